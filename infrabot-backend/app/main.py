@@ -2,10 +2,12 @@
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse
 import asyncio
+import math
 import time
+import os
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,9 +16,43 @@ import logging
 import json
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, AsyncGenerator
-from app.services.load_data import build_vector_db, create_rag_chain
-from app.services.ingest_service import ingest_documents, validate_milvus_connection
-from langchain_core.messages import AIMessage, HumanMessage
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.services.cache_service import (
+    semantic_cache,
+    history_fingerprint,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_FALLBACK_THRESHOLD,
+)
+from app.services.admission import AdmissionRejected, Permit, admission, client_address
+from app.services.circuit_breaker import (
+    CircuitBreakerCallbackHandler,
+    CircuitOpenError,
+    breakers,
+    embedding_breaker,
+    llm_breaker,
+    open_breaker_retry_after,
+)
+from app.services.monitoring import metrics, merge_snapshots
+from app.services.history_compaction import history_compactor, make_llm_summarizer
+from app.services.hybrid_retriever import takes_fast_path
+from app.services.pipeline_timing import PipelineTimingHandler
+from app.services.shared_state import (
+    SHARED_STATE_SYNC_SECONDS,
+    read_kb_version,
+    write_metrics_snapshot,
+    remove_metrics_snapshot,
+    read_metrics_snapshots,
+)
+
+# The RAG stack (langchain_openai, langchain_milvus, pymilvus) is imported by
+# the startup task rather than here, so uvicorn binds and answers liveness
+# probes before those imports finish.
+
+IMPORTED_AT = time.perf_counter()
+
+# Backoff between attempts to initialise the RAG chain at startup
+STARTUP_RETRY_DELAY_SECONDS = float(os.getenv("STARTUP_RETRY_DELAY_SECONDS", "2"))
+STARTUP_RETRY_MAX_DELAY_SECONDS = float(os.getenv("STARTUP_RETRY_MAX_DELAY_SECONDS", "30"))
 
 # Configure logging
 logging.basicConfig(
@@ -24,7 +60,89 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-app = FastAPI(title="Prodapt IT Helpdesk LLM")
+# Populated by the startup task; requests needing them get a 503 until then
+embeddings = None
+retriever = None
+retrieval_qa_chain = None
+startup_state: Dict[str, Any] = {"ready": False, "attempts": 0, "last_error": None, "startup_seconds": None}
+# Shared knowledge base version this worker's chain was built against
+loaded_kb_version = None
+
+
+def reload_rag_chain():
+    """Rebind the retriever and chain to the active collection version."""
+    global embeddings, retriever, retrieval_qa_chain, loaded_kb_version
+    from app.services.load_data import build_vector_db, create_rag_chain
+    from app.services.openai_llm import init_azure_chat_openai
+
+    # Read first: a version published while rebuilding triggers another reload
+    kb_version = read_kb_version()
+    new_embeddings, new_retriever = build_vector_db()
+    new_chain = create_rag_chain(new_retriever)
+    history_compactor.summarize = make_llm_summarizer(init_azure_chat_openai(), llm_breaker)
+    embeddings, retriever, retrieval_qa_chain = new_embeddings, new_retriever, new_chain
+    loaded_kb_version = kb_version
+    # Answers cached against the old collection are no longer valid
+    semantic_cache.invalidate()
+
+
+async def sync_shared_state():
+    """Publish this worker's metrics and follow knowledge base changes made by other processes."""
+    while True:
+        await asyncio.sleep(SHARED_STATE_SYNC_SECONDS)
+        try:
+            await asyncio.to_thread(write_metrics_snapshot, metrics.snapshot())
+            kb_version = await asyncio.to_thread(read_kb_version)
+            if startup_state["ready"] and kb_version != loaded_kb_version:
+                logging.info(f"Knowledge base version changed to {kb_version}, reloading RAG chain")
+                await asyncio.to_thread(reload_rag_chain)
+        except Exception as e:
+            logging.warning(f"Shared state sync failed: {e}")
+
+
+async def initialize_rag_chain():
+    """Build the retriever and chain off the event loop, retrying until Milvus is reachable."""
+    delay = STARTUP_RETRY_DELAY_SECONDS
+    while True:
+        startup_state["attempts"] += 1
+        try:
+            await asyncio.to_thread(reload_rag_chain)
+            from app.services.connection_manager import milvus_manager
+            milvus_manager.start_keepalive()
+            startup_state.update(ready=True, last_error=None, startup_seconds=time.perf_counter() - IMPORTED_AT)
+            logging.info(
+                f"FastAPI app initialized successfully with retriever and RAG chain "
+                f"in {startup_state['startup_seconds']:.2f}s."
+            )
+            return
+        except Exception as e:
+            startup_state["last_error"] = str(e)
+            logging.error(
+                f"Failed to initialize RAG chain (attempt {startup_state['attempts']}), "
+                f"retrying in {delay:.0f}s: {e}"
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STARTUP_RETRY_MAX_DELAY_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_task = asyncio.create_task(initialize_rag_chain())
+    sync_task = asyncio.create_task(sync_shared_state())
+    yield
+    init_task.cancel()
+    sync_task.cancel()
+    await asyncio.to_thread(remove_metrics_snapshot)
+    import sys
+    if "app.services.ingest_jobs" in sys.modules:
+        from app.services.ingest_jobs import ingest_jobs
+        await asyncio.to_thread(ingest_jobs.shutdown)
+    if "app.services.connection_manager" in sys.modules:
+        from app.services.connection_manager import milvus_manager
+        await milvus_manager.disconnect()
+
+
+app = FastAPI(title="Prodapt IT Helpdesk LLM", lifespan=lifespan)
 
 # Add performance middleware
 app.add_middleware(GZipMiddleware, minimum_size=1000)
@@ -48,36 +166,151 @@ app.add_middleware(
 
 app.add_middleware(GZipMiddleware, minimum_size=1000)  # Compress responses larger than 1KB
 
+# Size of the text chunks used when replaying a cached answer
+CACHED_REPLAY_CHUNK_SIZE = 64
+
 class ChatRequest(BaseModel):
     prompt: str = Field(..., min_length=1, description="The user's command or question")
     history: List[Dict[str, str]] = Field([], description="The conversation history")
 
 
-try:
-    embeddings, retriever = build_vector_db()
-    retrieval_qa_chain = create_rag_chain(retriever)
-    logging.info("FastAPI app initialized successfully with retriever and RAG chain.")
-except Exception as e:
-    logging.error(f"Failed to initialize FastAPI app: {e}")
-    raise e
+def require_ready():
+    if retrieval_qa_chain is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service is starting up; the RAG chain is not ready yet.",
+            headers={"Retry-After": "5"},
+        )
+
+def client_identity(http_request: Request) -> str:
+    """Client a chat request is rate limited as: the address the trusted proxies saw, else the peer."""
+    peer = http_request.client.host if http_request.client else "unknown"
+    return client_address(http_request.headers.get("x-forwarded-for", ""), peer)
+
+
+def rejection(error: AdmissionRejected) -> HTTPException:
+    metrics.record_admission(f"rejected_{error.status_code}")
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
+class PermitStreamingResponse(StreamingResponse):
+    """Streaming response that releases its admission permit however sending ends.
+
+    The body generator releases the permit itself (with the upstream latency),
+    but it never starts if the client disconnects before the response starts.
+    """
+
+    def __init__(self, content, permit: Permit, **kwargs):
+        super().__init__(content, **kwargs)
+        self.permit = permit
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.permit.release()
+
 
 @app.post("/api/chat")
-async def chat_endpoint(request: ChatRequest) -> StreamingResponse:
+async def chat_endpoint(request: ChatRequest, http_request: Request) -> StreamingResponse:
+    timing = PipelineTimingHandler()
     user_query = request.prompt.strip()
     if not user_query:
         raise HTTPException(status_code=400, detail="Query cannot be empty.")
 
-    chat_history = [
-        HumanMessage(content=msg["content"]) if msg["role"] == "user" else AIMessage(content=msg["content"])
-        for msg in request.history
-    ]
+    require_ready()
+    client_id = client_identity(http_request)
+    try:
+        admission.check_rate(client_id)
+    except AdmissionRejected as e:
+        raise rejection(e)
+    # Bind this request to the chain (and so the collection version) that is
+    # live now; a concurrent ingest swapping the globals does not affect it.
+    chain, chain_retriever = retrieval_qa_chain, retriever
+
+    stage_started = time.perf_counter()
+    # Recent turns verbatim, older ones summarised, within HISTORY_TOKEN_BUDGET
+    compacted = history_compactor.compact(request.history)
+    chat_history = compacted.messages
+    timing.record("history_conversion", time.perf_counter() - stage_started)
+
+    history_key = history_fingerprint(request.history)
+    cache_generation = semantic_cache.generation
+    query_vector = None
+    cached_answer = None
+    if SEMANTIC_CACHE_ENABLED:
+        stage_started = time.perf_counter()
+        cached_answer = semantic_cache.get_exact(user_query, history_key)
+        # A query the lexical fast path answers needs no embedding for retrieval,
+        # so none is made just for the similarity lookup
+        if cached_answer is None and not takes_fast_path(chain_retriever, user_query):
+            try:
+                query_vector = await embedding_breaker.acall(embeddings.aembed_query, user_query)
+                cached_answer = semantic_cache.get_similar(query_vector, history_key)
+            except Exception as e:
+                logging.warning(f"Semantic cache lookup failed, falling back to RAG chain: {e}")
+        timing.record("cache_lookup", time.perf_counter() - stage_started)
+        if cached_answer is not None:
+            metrics.record_cache_hit()
+        else:
+            metrics.record_cache_miss()
+
+    def fallback_answer():
+        """Closest cached answer accepted while a dependency is unavailable."""
+        if not SEMANTIC_CACHE_ENABLED or query_vector is None:
+            return None
+        return semantic_cache.get_similar(query_vector, history_key, threshold=SEMANTIC_CACHE_FALLBACK_THRESHOLD)
+
+    if cached_answer is None:
+        # Fail fast while Azure OpenAI or Milvus is known to be degraded
+        retry_after = open_breaker_retry_after()
+        if retry_after is not None:
+            cached_answer = fallback_answer()
+            if cached_answer is None:
+                metrics.record_request("/api/chat", timing.finish(), success=False)
+                raise HTTPException(
+                    status_code=503,
+                    detail="A dependency of the assistant is temporarily unavailable.",
+                    headers={"Retry-After": str(max(1, round(retry_after)))},
+                )
+            logging.warning(f"Serving cached fallback answer while a circuit breaker is open: {user_query[:100]}")
+
+    permit = None
+    if cached_answer is None:
+        # Only answers that open an LLM stream need an in-flight slot
+        try:
+            permit = await admission.acquire(client_id)
+        except AdmissionRejected as e:
+            raise rejection(e)
+        metrics.record_admission("queued" if permit.waited > 0 else "admitted")
+        timing.record("admission_wait", permit.waited)
+
+    async def cached_stream_generator(answer: str) -> AsyncGenerator[str, None]:
+        logging.info(f"Replaying cached answer for prompt: {user_query[:200]}")
+        metrics.increment_active_requests()
+        try:
+            for start in range(0, len(answer), CACHED_REPLAY_CHUNK_SIZE):
+                yield answer[start:start + CACHED_REPLAY_CHUNK_SIZE]
+        finally:
+            metrics.decrement_active_requests()
+            metrics.record_request("/api/chat", timing.finish())
 
     async def stream_generator() -> AsyncGenerator[str, None]:
         logging.info(f"Starting RAG chain astream with prompt: {user_query[:200]}")
         
         chunk_count = 0
+        answer_parts = []
+        success = False
+        metrics.increment_active_requests()
         try:
-            async for chunk in retrieval_qa_chain.astream({"input": user_query, "chat_history": chat_history}):
+            async for chunk in chain.astream(
+                {"input": user_query, "chat_history": chat_history},
+                config={"callbacks": [timing, CircuitBreakerCallbackHandler(llm_breaker)]},
+            ):
                 if chunk_count < 5:
                     logging.debug(f"Stream chunk [{chunk_count}]: {str(chunk)[:200]}")
                 chunk_count += 1
@@ -99,51 +332,119 @@ async def chat_endpoint(request: ChatRequest) -> StreamingResponse:
                     
                     # Only yield non-empty strings
                     if content_to_yield.strip():
+                        answer_parts.append(content_to_yield)
                         yield content_to_yield
             logging.info(f"Finished RAG chain astream. Total chunks: {chunk_count}")
+            success = True
+            if SEMANTIC_CACHE_ENABLED:
+                semantic_cache.put(
+                    user_query,
+                    history_key,
+                    "".join(answer_parts),
+                    query_vector=query_vector,
+                    generation=cache_generation,
+                )
+        except CircuitOpenError as e:
+            # A breaker opened after the pre-check; nothing was streamed yet
+            logging.warning(f"RAG chain rejected by circuit breaker '{e.name}'")
+            fallback = fallback_answer() if not answer_parts else None
+            if fallback is not None:
+                success = True
+                yield fallback
+            else:
+                yield f"ERROR: {str(e)}"
         except Exception as e:
             logging.error(f"Error during RAG chain astream: {e}", exc_info=True)
             # If error happens mid-stream, client connection will break.
             error_message = f"ERROR: {str(e)}"
             yield error_message
+        finally:
+            # Timed here, at the end of the stream, not when the response object is returned
+            metrics.decrement_active_requests()
+            metrics.record_request("/api/chat", timing.finish(), success)
+            logging.info(
+                f"Prompt tokens: {timing.prompt_tokens} (history {compacted.original_tokens} -> "
+                f"{compacted.tokens} tokens, {compacted.summarized_messages} messages summarized "
+                f"[{compacted.summary_source}])"
+            )
+            permit.release(timing.stages.get("time_to_first_token"))
 
     try:
         logging.info(f"Received chat request with query: {user_query[:100]}")
         # Return the streaming response. The frontend expects plain text chunks.
-        return StreamingResponse(stream_generator(), media_type="text/plain; charset=utf-8")
+        if cached_answer is not None:
+            return StreamingResponse(cached_stream_generator(cached_answer), media_type="text/plain; charset=utf-8")
+        return PermitStreamingResponse(stream_generator(), permit, media_type="text/plain; charset=utf-8")
     except Exception as e:
+        if permit is not None:
+            permit.release()
         logging.error(f"Error setting up streaming chat request: {e}", exc_info=True)
         # This HTTPException is for errors occurring *before* StreamingResponse is returned
         raise HTTPException(status_code=500, detail="Internal server error during streaming setup.")
 
-@app.post("/api/ingest")
-async def trigger_ingestion():
-    """Trigger document ingestion into Milvus."""
+@app.post("/api/ingest", status_code=202)
+async def trigger_ingestion(force: bool = False):
+    """Start document ingestion into Milvus as a background job."""
+    from app.services.ingest_jobs import ingest_jobs
+    from app.services.ingest_service import IngestAlreadyRunning
+
     try:
-        logging.info("Starting document ingestion via API...")
-        success = ingest_documents()
-        if success:
-            # Reinitialize the retriever and chain after successful ingestion
-            global embeddings, retriever, retrieval_qa_chain
-            embeddings, retriever = build_vector_db()
-            retrieval_qa_chain = create_rag_chain(retriever)
-            return {"status": "success", "message": "Document ingestion completed successfully"}
-        else:
-            return {"status": "error", "message": "Document ingestion failed"}
+        job = await asyncio.to_thread(ingest_jobs.start, force, reload_rag_chain)
+    except IngestAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logging.info(f"Started document ingestion job {job.job_id} via API")
+    return job.to_dict()
+
+
+@app.get("/api/ingest/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Progress of an ingestion job, whichever worker runs it."""
+    from app.services.ingest_jobs import ingest_jobs
+
+    status = await asyncio.to_thread(ingest_jobs.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job '{job_id}'")
+    return status
+
+
+@app.delete("/api/ingest/{job_id}")
+async def cancel_ingestion_job(job_id: str):
+    """Cancel a running ingestion job; it can be resumed by starting a new one."""
+    from app.services.ingest_jobs import ingest_jobs
+
+    status = await asyncio.to_thread(ingest_jobs.cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job '{job_id}'")
+    return status
+
+
+@app.post("/api/ingest/rollback")
+async def rollback_ingestion():
+    """Switch back to the previous knowledge base collection version."""
+    from app.services.ingest_service import rollback_collection, IngestAlreadyRunning
+
+    try:
+        collection_name = await asyncio.to_thread(rollback_collection)
+        await asyncio.to_thread(reload_rag_chain)
+        return {"status": "success", "message": f"Rolled back to collection '{collection_name}'"}
+    except (RuntimeError, IngestAlreadyRunning) as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        logging.error(f"Ingestion endpoint error: {e}")
-        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
+        logging.error(f"Rollback endpoint error: {e}")
+        raise HTTPException(status_code=500, detail=f"Rollback failed: {str(e)}")
 
 
 @app.get("/api/status")
 async def get_status():
     """Get system status including Milvus connection and knowledge base."""
+    from app.services.ingest_service import validate_milvus_connection, KNOWLEDGEBASE_PATH, VECTOR_STORE_BACKEND
+    from app.services.connection_manager import milvus_manager
+
     try:
         # Check Milvus connection
-        milvus_status = validate_milvus_connection()
+        milvus_status = await asyncio.to_thread(validate_milvus_connection)
         
         # Check knowledge base path
-        from app.services.ingest_service import KNOWLEDGEBASE_PATH
         kb_exists = KNOWLEDGEBASE_PATH.exists()
         
         pdf_count = 0
@@ -153,7 +454,11 @@ async def get_status():
         
         return {
             "status": "healthy" if milvus_status and kb_exists else "unhealthy",
+            "vector_store_backend": VECTOR_STORE_BACKEND,
             "milvus_connected": milvus_status,
+            "milvus_pool": milvus_manager.stats(),
+            "circuit_breakers": {name: breaker.stats() for name, breaker in breakers.items()},
+            "chat_admission": admission.stats(),
             "knowledge_base_exists": kb_exists,
             "knowledge_base_path": str(KNOWLEDGEBASE_PATH),
             "pdf_files_count": pdf_count
@@ -163,6 +468,47 @@ async def get_status():
         raise HTTPException(status_code=500, detail=f"Status check failed: {str(e)}")
 
 
+@app.get("/api/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """Metrics aggregated across all workers, in Prometheus text format (or ``?format=json``)."""
+    # Include this worker's latest numbers rather than its last periodic snapshot
+    await asyncio.to_thread(write_metrics_snapshot, metrics.snapshot())
+    snapshots = await asyncio.to_thread(read_metrics_snapshots)
+    merged = merge_snapshots(snapshots)
+    if format == "json":
+        return {**merged.get_detailed_metrics(), "workers": sorted(s["pid"] for s in snapshots)}
+    return PlainTextResponse(merged.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+@app.get("/health")
+async def liveness():
+    """Liveness probe: the process is up and serving, whether or not the chain is ready."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: the RAG chain is built and the knowledge base collection exists."""
+    checks = {"chain_ready": retrieval_qa_chain is not None, "collection_ready": False}
+    if checks["chain_ready"]:
+        from app.services.ingest_service import get_collection_versions
+        try:
+            active = await asyncio.to_thread(lambda: get_collection_versions().active())
+            checks["collection_ready"] = active is not None
+        except Exception as e:
+            logging.warning(f"Readiness check could not resolve the active collection: {e}")
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "not_ready",
+        **checks,
+        "startup_attempts": startup_state["attempts"],
+        "startup_seconds": startup_state["startup_seconds"],
+        "last_error": startup_state["last_error"],
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
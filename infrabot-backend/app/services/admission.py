@@ -0,0 +1,264 @@
+"""
+Admission control for the chat endpoint.
+
+Every answer that is not served from cache holds an Azure OpenAI stream open
+for seconds. Without a limit a burst of users exhausts the deployment's quota
+and every request degrades into 429 retries. The controller here bounds that:
+
+* each client can get a token bucket (request rate) and a cap on its own
+  concurrent streams. Both are off by default: a client is only identifiable
+  behind proxies that record its address (``CHAT_TRUSTED_PROXY_HOPS``), and
+  without them every user behind the frontend would share one limit;
+* RAG requests need one of ``limit`` in-flight slots; others wait in a
+  bounded queue, and are rejected up front when their estimated wait exceeds
+  the queue deadline rather than after it;
+* ``limit`` adapts to observed upstream latency (time to first token):
+  it shrinks multiplicatively when latency exceeds the target and grows
+  additively when it is below, between the configured minimum and maximum.
+
+Limits are per worker process.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper and lower bounds of the adaptive in-flight limit
+CHAT_MAX_INFLIGHT = int(os.getenv("CHAT_MAX_INFLIGHT", "32"))
+CHAT_MIN_INFLIGHT = int(os.getenv("CHAT_MIN_INFLIGHT", "4"))
+# Requests allowed to wait for a slot, and for how long
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "64"))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "5"))
+# Upstream latency (time to first token) the limit is steered towards
+CHAT_TARGET_LATENCY_SECONDS = float(os.getenv("CHAT_TARGET_LATENCY_SECONDS", "4"))
+# Per-client token bucket and concurrent streams (0 disables either)
+CHAT_CLIENT_RATE_PER_MINUTE = float(os.getenv("CHAT_CLIENT_RATE_PER_MINUTE", "0"))
+CHAT_CLIENT_BURST = int(os.getenv("CHAT_CLIENT_BURST", "10"))
+CHAT_CLIENT_MAX_INFLIGHT = int(os.getenv("CHAT_CLIENT_MAX_INFLIGHT", "0"))
+# Proxies in front of the backend that record the address they were called
+# from in X-Forwarded-For; 0 ignores the header and uses the peer address
+CHAT_TRUSTED_PROXY_HOPS = int(os.getenv("CHAT_TRUSTED_PROXY_HOPS", "0"))
+# Clients whose buckets are remembered (least recently seen are dropped)
+CHAT_CLIENTS_TRACKED = int(os.getenv("CHAT_CLIENTS_TRACKED", "10000"))
+
+# Factor applied to the limit when latency is above target
+DECREASE_FACTOR = 0.9
+# Weight of a new sample in the latency and service time averages
+EWMA_WEIGHT = 0.2
+
+
+def client_address(forwarded_for: str, peer: str, trusted_hops: int = CHAT_TRUSTED_PROXY_HOPS) -> str:
+    """Address of the client as seen by the outermost trusted proxy.
+
+    Each proxy appends its caller to X-Forwarded-For, so only the last
+    ``trusted_hops`` entries are trustworthy; anything to their left was sent
+    by the client and could be anything.
+    """
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    if trusted_hops <= 0 or not hops:
+        return peer
+    return hops[-min(trusted_hops, len(hops))]
+
+
+class AdmissionRejected(Exception):
+    """A request was not admitted; maps to an HTTP status with Retry-After."""
+
+    def __init__(self, reason: str, status_code: int, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Permit:
+    """An admitted request's slot; release it when the response stream ends."""
+
+    def __init__(self, controller: "AdmissionController", client_id: str, waited: float):
+        self.controller = controller
+        self.client_id = client_id
+        self.waited = waited
+        self.admitted_at = controller.clock()
+        self._released = False
+
+    def release(self, upstream_latency: Optional[float] = None):
+        """Free the slot; ``upstream_latency`` (time to first token) feeds the limit."""
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self, upstream_latency)
+
+
+class AdmissionController:
+    """Adaptive global concurrency limit with per-client rate and concurrency limits."""
+
+    def __init__(
+        self,
+        max_inflight: int = CHAT_MAX_INFLIGHT,
+        min_inflight: int = CHAT_MIN_INFLIGHT,
+        queue_size: int = CHAT_QUEUE_SIZE,
+        queue_timeout: float = CHAT_QUEUE_TIMEOUT_SECONDS,
+        target_latency: float = CHAT_TARGET_LATENCY_SECONDS,
+        client_rate_per_minute: float = CHAT_CLIENT_RATE_PER_MINUTE,
+        client_burst: int = CHAT_CLIENT_BURST,
+        client_max_inflight: int = CHAT_CLIENT_MAX_INFLIGHT,
+        clients_tracked: int = CHAT_CLIENTS_TRACKED,
+        clock=time.monotonic,
+    ):
+        self.max_inflight = max(1, max_inflight)
+        self.min_inflight = max(1, min(min_inflight, self.max_inflight))
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.client_rate = client_rate_per_minute / 60.0
+        self.client_burst = client_burst
+        self.client_max_inflight = client_max_inflight
+        self.clients_tracked = clients_tracked
+        self.clock = clock
+
+        self.limit = float(self.max_inflight)
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        # Slot hold time, used to estimate how long a queued request will wait
+        self.service_ewma: Optional[float] = None
+        self._last_decrease = -math.inf
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._client_active: Dict[str, int] = {}
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # client -> [tokens, updated]
+
+    def check_rate(self, client_id: str):
+        """Take one token from the client's bucket; raises ``AdmissionRejected`` (429) if empty."""
+        if self.client_rate <= 0:
+            return
+        now = self.clock()
+        bucket = self._buckets.pop(client_id, None) or [float(self.client_burst), now]
+        bucket[0] = min(self.client_burst, bucket[0] + (now - bucket[1]) * self.client_rate)
+        bucket[1] = now
+        self._buckets[client_id] = bucket
+        while len(self._buckets) > self.clients_tracked:
+            self._buckets.popitem(last=False)
+        if bucket[0] < 1:
+            raise AdmissionRejected("Too many requests from this client", 429, (1 - bucket[0]) / self.client_rate)
+        bucket[0] -= 1
+
+    async def acquire(self, client_id: str) -> Permit:
+        """Wait for an in-flight slot; raises ``AdmissionRejected`` if one cannot be had in time."""
+        active = self._client_active.get(client_id, 0)
+        if 0 < self.client_max_inflight <= active:
+            raise AdmissionRejected("Too many concurrent requests from this client", 429, self._service_estimate())
+        started = self.clock()
+        if self.in_flight < int(self.limit) and not self._waiters:
+            return self._grant(client_id, started)
+
+        if len(self._waiters) >= self.queue_size:
+            raise AdmissionRejected("Server is at capacity", 503, self._estimated_wait(len(self._waiters)))
+        estimate = self._estimated_wait(len(self._waiters) + 1)
+        if estimate > self.queue_timeout:
+            # Would time out in the queue anyway; tell the client now
+            raise AdmissionRejected("Server is at capacity", 503, estimate)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._client_active[client_id] = active + 1
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except BaseException:
+            # Cancelled while queued (client went away); give back a slot handed to us meanwhile
+            self._leave_queue(waiter, client_id)
+            self._wake_waiters()
+            raise
+        granted = self._leave_queue(waiter, client_id)
+        if not granted:
+            raise AdmissionRejected("Timed out waiting for capacity", 503, self._estimated_wait(len(self._waiters)))
+        return self._grant(client_id, started)
+
+    def _leave_queue(self, waiter: asyncio.Future, client_id: str) -> bool:
+        """Remove a waiter; True if it had been handed a slot (which is given back)."""
+        self._client_done(client_id)
+        if waiter.done() and not waiter.cancelled():
+            # _wake_waiters counted the slot as in flight; _grant counts it again
+            self.in_flight -= 1
+            return True
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        return False
+
+    def _grant(self, client_id: str, started: float) -> Permit:
+        self.in_flight += 1
+        self._client_active[client_id] = self._client_active.get(client_id, 0) + 1
+        return Permit(self, client_id, waited=self.clock() - started)
+
+    def _release(self, permit: Permit, upstream_latency: Optional[float]):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._client_done(permit.client_id)
+        self.service_ewma = self._ewma(self.service_ewma, self.clock() - permit.admitted_at)
+        if upstream_latency is not None:
+            self.observe_latency(upstream_latency)
+        self._wake_waiters()
+
+    def _client_done(self, client_id: str):
+        remaining = self._client_active.get(client_id, 1) - 1
+        if remaining > 0:
+            self._client_active[client_id] = remaining
+        else:
+            self._client_active.pop(client_id, None)
+
+    def observe_latency(self, seconds: float):
+        """Adjust the limit from one upstream latency sample."""
+        self.latency_ewma = self._ewma(self.latency_ewma, seconds)
+        now = self.clock()
+        if seconds > self.target_latency:
+            # At most one decrease per target interval, so a burst of slow
+            # answers that started together counts as one signal
+            if now - self._last_decrease >= self.target_latency:
+                self._last_decrease = now
+                previous = self.limit
+                self.limit = max(self.min_inflight, self.limit * DECREASE_FACTOR)
+                if int(previous) != int(self.limit):
+                    logger.info(
+                        f"Upstream latency {seconds:.2f}s above target, chat concurrency limit "
+                        f"{int(previous)} -> {int(self.limit)}"
+                    )
+        else:
+            self.limit = min(self.max_inflight, self.limit + 1 / self.limit)
+            self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            # Counted now so concurrent releases do not over-admit
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _service_estimate(self) -> float:
+        return self.service_ewma if self.service_ewma is not None else self.target_latency
+
+    def _estimated_wait(self, position: int) -> float:
+        """Expected queueing time at ``position``, from slot hold time and the limit."""
+        return position * self._service_estimate() / max(1, int(self.limit))
+
+    @staticmethod
+    def _ewma(current: Optional[float], sample: float) -> float:
+        return sample if current is None else (1 - EWMA_WEIGHT) * current + EWMA_WEIGHT * sample
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": sum(1 for waiter in self._waiters if not waiter.done()),
+            "latency_ewma_seconds": self.latency_ewma,
+            "service_ewma_seconds": self.service_ewma,
+        }
+
+
+# Shared by all chat requests in this worker
+admission = AdmissionController()
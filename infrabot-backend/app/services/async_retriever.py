@@ -0,0 +1,142 @@
+"""
+Non-blocking retrieval for the chat path.
+
+langchain_milvus searches through synchronous pymilvus gRPC calls, which would
+block the event loop for the duration of every search. The retriever here
+embeds the query with the async embeddings client and runs the vector search
+on a bounded, dedicated thread pool, so concurrent chat requests overlap their
+retrieval instead of queueing behind each other.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+from contextlib import nullcontext
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ConfigDict, Field
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.index_config import distances
+from app.services.pipeline_timing import report_stage
+
+logger = logging.getLogger(__name__)
+
+# Threads dedicated to blocking vector searches; also caps concurrent searches
+RETRIEVAL_THREADS = int(os.getenv("RETRIEVAL_THREADS", "8"))
+# Per-request budget for embedding the query and searching
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "10"))
+
+_retrieval_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_retrieval_executor() -> ThreadPoolExecutor:
+    """Shared thread pool for vector searches."""
+    global _retrieval_executor
+    with _executor_lock:
+        if _retrieval_executor is None:
+            _retrieval_executor = ThreadPoolExecutor(
+                max_workers=RETRIEVAL_THREADS, thread_name_prefix="retrieval"
+            )
+        return _retrieval_executor
+
+
+class RetrievalTimeout(TimeoutError):
+    """Retrieval did not finish within its per-request budget."""
+
+
+class AsyncVectorStoreRetriever(BaseRetriever):
+    """Similarity retriever whose async path never blocks the event loop.
+
+    A search that times out keeps running on its pool thread until pymilvus
+    returns (gRPC calls cannot be interrupted), but the request stops waiting
+    for it; the bounded pool keeps such stragglers from piling up threads.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: VectorStore
+    embeddings: Embeddings
+    k: int = 5
+    search_kwargs: Dict[str, Any] = Field(default_factory=dict)
+    timeout: float = RETRIEVAL_TIMEOUT_SECONDS
+    executor: Optional[Executor] = None
+    embedding_breaker: Optional[CircuitBreaker] = None
+    search_breaker: Optional[CircuitBreaker] = None
+    # Attach a [0, 1] "relevance_score" to each document's metadata (higher is better)
+    with_scores: bool = False
+    # Fetch k * rescore_factor candidates and keep the k closest by exact distance on the
+    # stored float vectors; recovers recall lost to a quantized (IVF_SQ8/IVF_PQ) index
+    rescore_factor: int = 1
+    metric_type: str = "L2"
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vectorstore.similarity_search(query, k=self.k, **self.search_kwargs)
+
+    def _rescore(self, vector: List[float], scored: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        store = self.vectorstore
+        ids = [document.metadata.get(store._primary_field) for document, _ in scored]
+        if not scored or None in ids:
+            return scored[:self.k]
+        try:
+            rows = store.client.get(store.collection_name, ids=ids, output_fields=[store._vector_field])
+            stored = {row[store._primary_field]: row[store._vector_field] for row in rows}
+            exact = distances([vector], [stored[i] for i in ids], self.metric_type)[0]
+        except Exception as e:
+            logger.warning(f"Rescoring failed, keeping index order: {e}")
+            return scored[:self.k]
+        # Back to Milvus' convention: squared distance for L2, similarity for IP and COSINE
+        sign = 1.0 if self.metric_type.upper() == "L2" else -1.0
+        return [(scored[i][0], sign * float(exact[i])) for i in exact.argsort()[:self.k]]
+
+    def _search(self, vector: List[float]) -> List[Document]:
+        rescore = self.rescore_factor > 1
+        if not self.with_scores and not rescore:
+            return self.vectorstore.similarity_search_by_vector(vector, k=self.k, **self.search_kwargs)
+        fetch_k = self.k * self.rescore_factor if rescore else self.k
+        scored = self.vectorstore.similarity_search_with_score_by_vector(vector, k=fetch_k, **self.search_kwargs)
+        if rescore:
+            scored = self._rescore(vector, scored)
+        if not self.with_scores:
+            return [document for document, _ in scored]
+        relevance = self.vectorstore._select_relevance_score_fn()
+        documents = []
+        for document, score in scored:
+            document.metadata["relevance_score"] = relevance(score)
+            documents.append(document)
+        return documents
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started = time.monotonic()
+        deadline = started + self.timeout
+        try:
+            with self.embedding_breaker.guard() if self.embedding_breaker else nullcontext():
+                vector = await asyncio.wait_for(self.embeddings.aembed_query(query), timeout=self.timeout)
+            embedded = time.monotonic()
+            await report_stage(run_manager, "query_embedding", embedded - started)
+
+            search = functools.partial(self._search, vector)
+            loop = asyncio.get_running_loop()
+            with self.search_breaker.guard() if self.search_breaker else nullcontext():
+                documents = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor or get_retrieval_executor(), search),
+                    timeout=max(0.0, deadline - time.monotonic()),
+                )
+            await report_stage(run_manager, "milvus_search", time.monotonic() - embedded)
+            return documents
+        except asyncio.TimeoutError:
+            logger.warning(f"Retrieval timed out after {self.timeout:.1f}s for query: {query[:100]}")
+            raise RetrievalTimeout(f"Retrieval timed out after {self.timeout:.1f}s")
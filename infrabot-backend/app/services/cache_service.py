@@ -0,0 +1,380 @@
+"""
+Caching services: semantic response cache for the chat endpoint and a
+two-tier (memory + SQLite) cache in front of the embeddings model.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Semantic cache configuration
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Looser match accepted when a dependency's circuit breaker is open and the alternative is no answer
+SEMANTIC_CACHE_FALLBACK_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_FALLBACK_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+# Embedding cache configuration
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", "./.cache/embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different inputs share a key."""
+    return " ".join(text.split()).lower()
+
+
+def history_fingerprint(history: Sequence[Dict[str, str]]) -> str:
+    """Stable hash of the normalized conversation history."""
+    normalized = [
+        [msg.get("role", "").strip().lower(), normalize_text(msg.get("content", ""))]
+        for msg in history
+    ]
+    return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """A cached answer together with the query embedding it was produced for."""
+    key: str
+    history_key: str
+    vector: Optional[np.ndarray]
+    answer: str
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class SemanticCache:
+    """TTL/LRU cache of chat answers matched by exact text or embedding similarity.
+
+    Entries are partitioned by history fingerprint so a cached answer is only
+    replayed for the same conversation context. Within a partition the query
+    embedding is compared by cosine similarity against ``threshold``.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: int = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._partitions: Dict[str, List[str]] = {}
+        self._matrices: Dict[str, Optional[np.ndarray]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """Current cache generation; bumped on every invalidation."""
+        return self._generation
+
+    @staticmethod
+    def _make_key(query: str, history_key: str) -> str:
+        digest = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+        return f"{history_key}:{digest}"
+
+    @staticmethod
+    def _normalize_vector(vector: Sequence[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        if norm == 0.0:
+            return None
+        return array / norm
+
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._partitions.get(entry.history_key)
+        if keys is not None:
+            keys.remove(key)
+            if not keys:
+                del self._partitions[entry.history_key]
+                self._matrices.pop(entry.history_key, None)
+            else:
+                self._matrices[entry.history_key] = None
+
+    def _touch(self, entry: CacheEntry) -> str:
+        entry.hits += 1
+        self._entries.move_to_end(entry.key)
+        return entry.answer
+
+    def get_exact(self, query: str, history_key: str) -> Optional[str]:
+        """Return a cached answer for the same normalized query and history."""
+        key = self._make_key(query, history_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry, time.time()):
+                self._remove(key)
+                return None
+            return self._touch(entry)
+
+    def get_similar(
+        self, query_vector: Sequence[float], history_key: str, threshold: Optional[float] = None
+    ) -> Optional[str]:
+        """Return the closest cached answer above the similarity threshold."""
+        vector = self._normalize_vector(query_vector)
+        if vector is None:
+            return None
+
+        with self._lock:
+            keys = self._partitions.get(history_key)
+            if not keys:
+                return None
+
+            now = time.time()
+            for key in [k for k in keys if self._is_expired(self._entries[k], now)]:
+                self._remove(key)
+            keys = self._partitions.get(history_key)
+            if not keys:
+                return None
+
+            candidates = [k for k in keys if self._entries[k].vector is not None]
+            if not candidates:
+                return None
+
+            matrix = self._matrices.get(history_key)
+            if matrix is None or matrix.shape[0] != len(candidates):
+                matrix = np.vstack([self._entries[k].vector for k in candidates])
+                self._matrices[history_key] = matrix
+
+            if matrix.shape[1] != vector.shape[0]:
+                return None
+
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if float(scores[best]) < (self.threshold if threshold is None else threshold):
+                return None
+
+            logger.debug(f"Semantic cache hit with similarity {float(scores[best]):.4f}")
+            return self._touch(self._entries[candidates[best]])
+
+    def put(
+        self,
+        query: str,
+        history_key: str,
+        answer: str,
+        query_vector: Optional[Sequence[float]] = None,
+        generation: Optional[int] = None,
+    ):
+        """Store an answer.
+
+        If ``generation`` is given and the cache has been invalidated since, the
+        answer was produced against stale data and is dropped.
+        """
+        if not answer.strip():
+            return
+
+        key = self._make_key(query, history_key)
+        vector = self._normalize_vector(query_vector) if query_vector is not None else None
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                logger.debug("Discarding answer produced before cache invalidation")
+                return
+
+            self._remove(key)
+            self._entries[key] = CacheEntry(
+                key=key, history_key=history_key, vector=vector, answer=answer
+            )
+            self._partitions.setdefault(history_key, []).append(key)
+            self._matrices[history_key] = None
+
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the knowledge base has been re-ingested."""
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+            self._matrices.clear()
+            self._generation += 1
+        logger.info("Semantic cache invalidated")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EmbeddingCache:
+    """Content-hash keyed vector store with an in-process LRU and a SQLite tier.
+
+    Keys include a namespace (deployment and model name) so vectors produced
+    by a different embedding model are never returned. Both tiers hold float32
+    arrays (12 KiB for 3072 dimensions, against about 100 KiB as a list of
+    Python floats); callers get lists.
+    """
+
+    _BATCH = 500
+
+    def __init__(
+        self,
+        path: Optional[Path] = EMBEDDING_CACHE_PATH,
+        memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES,
+    ):
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(path), check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+                logger.info(f"Embedding cache persisted at {path}")
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache disk tier unavailable, using memory only: {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for whichever keys are present."""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector.tolist()
+                else:
+                    missing.append(key)
+
+            if self._db is not None and missing:
+                for start in range(0, len(missing), self._BATCH):
+                    batch = missing[start:start + self._BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector.tolist()
+                        self._remember(key, vector)
+        return found
+
+    def put_many(self, namespace: str, items: Dict[str, List[float]]):
+        """Store vectors in both tiers."""
+        arrays = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self._lock:
+            for key, vector in arrays.items():
+                self._remember(key, vector)
+            if self._db is not None and arrays:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, namespace, vector) VALUES (?, ?, ?)",
+                        [(key, namespace, vector.tobytes()) for key, vector in arrays.items()],
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to persist embeddings to cache: {e}")
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the underlying model for unseen text."""
+
+    def __init__(self, underlying: Embeddings, namespace: str, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.cache = cache
+
+    def _lookup(self, texts: List[str]):
+        keys = [EmbeddingCache.make_key(self.namespace, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        # Deduplicate misses so repeated chunks are only embedded once
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def _store(self, found: Dict[str, List[float]], missing: Dict[str, str], vectors):
+        computed = dict(zip(missing.keys(), vectors))
+        self.cache.put_many(self.namespace, computed)
+        found.update(computed)
+
+    def uncached(self, texts: List[str]) -> List[str]:
+        """The distinct texts that would need an API call to embed."""
+        _, _, missing = self._lookup(texts)
+        return list(missing.values())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            self._store(found, missing, self.underlying.embed_documents(list(missing.values())))
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)}/{len(texts)} hits")
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._lookup([text])
+        if missing:
+            self._store(found, missing, [self.underlying.embed_query(text)])
+        return found[keys[0]]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            self._store(found, missing, vectors)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._lookup([text])
+        if missing:
+            self._store(found, missing, [await self.underlying.aembed_query(text)])
+        return found[keys[0]]
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache()
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache, opening it on first use."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
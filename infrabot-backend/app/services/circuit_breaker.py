@@ -1,82 +1,302 @@
 """
 Circuit breaker pattern for resilient API calls.
+
+A breaker watches the outcomes of calls to one dependency (Azure OpenAI
+embeddings, Milvus search, the chat model) over a sliding time window. When
+too many of them fail, or are too slow, it opens and calls fail immediately
+with ``CircuitOpenError`` instead of waiting on a degraded service. After a
+recovery period a limited number of probe calls are let through; if they
+succeed the breaker closes again.
+
+Breakers are thread-safe and usable from both sync and async code: state
+changes happen under a lock and never span an ``await``.
 """
+import os
 import time
+import asyncio
 import logging
+import threading
 from enum import Enum
-from typing import Callable, Any
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple, Type
 from functools import wraps
 
+from langchain_core.callbacks import AsyncCallbackHandler
+
 logger = logging.getLogger(__name__)
 
+# Outcomes older than this no longer count towards the failure rate
+CIRCUIT_BREAKER_WINDOW_SECONDS = float(os.getenv("CIRCUIT_BREAKER_WINDOW_SECONDS", "30"))
+# Calls needed in the window before the breaker may open
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "10"))
+# Fraction of failed calls in the window that opens the breaker
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))
+# Fraction of slow calls in the window that opens the breaker
+CIRCUIT_BREAKER_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_RATE", "0.5"))
+# How long an open breaker rejects calls before letting probes through
+CIRCUIT_BREAKER_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RECOVERY_SECONDS", "15"))
+# Probe calls allowed at once while half-open; this many successes close the breaker
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Per-dependency latency above which a call counts as slow
+EMBEDDING_SLOW_CALL_SECONDS = float(os.getenv("EMBEDDING_SLOW_CALL_SECONDS", "2"))
+MILVUS_SLOW_CALL_SECONDS = float(os.getenv("MILVUS_SLOW_CALL_SECONDS", "1"))
+# Measured to the first streamed token
+LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "10"))
+
+
 class CircuitState(Enum):
     CLOSED = "closed"
     OPEN = "open"
     HALF_OPEN = "half_open"
 
+
+class CircuitOpenError(Exception):
+    """A call was rejected because the dependency's breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker '{name}' is open - service unavailable")
+        self.name = name
+        self.retry_after = retry_after
+
+
 class CircuitBreaker:
-    """Circuit breaker implementation for resilient service calls."""
-    
+    """Sliding-window circuit breaker with latency tripping and half-open probe limits."""
+
     def __init__(
         self,
-        failure_threshold: int = 5,
-        recovery_timeout: int = 60,
-        expected_exception: Exception = Exception
+        name: str = "default",
+        failure_rate_threshold: float = CIRCUIT_BREAKER_FAILURE_RATE,
+        slow_call_seconds: Optional[float] = None,
+        slow_call_rate_threshold: float = CIRCUIT_BREAKER_SLOW_CALL_RATE,
+        window_seconds: float = CIRCUIT_BREAKER_WINDOW_SECONDS,
+        min_calls: int = CIRCUIT_BREAKER_MIN_CALLS,
+        recovery_timeout: float = CIRCUIT_BREAKER_RECOVERY_SECONDS,
+        half_open_max_calls: int = CIRCUIT_BREAKER_HALF_OPEN_PROBES,
+        expected_exception: Type[BaseException] = Exception,
+        clock: Callable[[], float] = time.monotonic,
     ):
-        self.failure_threshold = failure_threshold
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
         self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
         self.expected_exception = expected_exception
-        
-        self.failure_count = 0
-        self.last_failure_time = None
+        self.clock = clock
+
         self.state = CircuitState.CLOSED
-    
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._outcomes: "deque[Tuple[float, bool, bool]]" = deque()  # (time, failed, slow)
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def acquire(self) -> bool:
+        """Permission to make one call; True if the call is a half-open probe.
+
+        Raises ``CircuitOpenError`` when the call must not be made. Every
+        successful ``acquire`` must be followed by ``record`` or ``release``.
+        """
+        with self._lock:
+            now = self.clock()
+            if self.state == CircuitState.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - now
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(CircuitState.HALF_OPEN, now)
+            if self.state == CircuitState.HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_max_calls:
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def record(self, probe: bool, failed: bool, duration: float = 0.0):
+        """Record the outcome of a call made after ``acquire``."""
+        slow = self.slow_call_seconds is not None and duration >= self.slow_call_seconds
+        with self._lock:
+            now = self.clock()
+            if probe:
+                if self.state != CircuitState.HALF_OPEN:
+                    return
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed or slow:
+                    logger.warning(f"Circuit breaker '{self.name}' probe {'failed' if failed else 'was slow'}")
+                    self._transition(CircuitState.OPEN, now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._transition(CircuitState.CLOSED, now)
+                return
+            if self.state != CircuitState.CLOSED:
+                # A call started before the breaker opened; it says nothing new
+                return
+
+            self._outcomes.append((now, failed, slow))
+            self._failures += failed
+            self._slow += slow
+            self._expire(now)
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            if self._failures / calls >= self.failure_rate_threshold:
+                logger.warning(f"Circuit breaker '{self.name}' OPENED: {self._failures}/{calls} calls failed")
+                self._transition(CircuitState.OPEN, now)
+            elif self._slow / calls >= self.slow_call_rate_threshold:
+                logger.warning(
+                    f"Circuit breaker '{self.name}' OPENED: {self._slow}/{calls} calls slower than "
+                    f"{self.slow_call_seconds:.1f}s"
+                )
+                self._transition(CircuitState.OPEN, now)
+
+    def release(self, probe: bool):
+        """Give back a permit without an outcome, e.g. when the caller was cancelled."""
+        if not probe:
+            return
+        with self._lock:
+            if self.state == CircuitState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def retry_after(self) -> Optional[float]:
+        """Seconds until calls are allowed again, or None if they are allowed now."""
+        with self._lock:
+            if self.state == CircuitState.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - self.clock()
+                return remaining if remaining > 0 else None
+            if self.state == CircuitState.HALF_OPEN and self._probes_in_flight >= self.half_open_max_calls:
+                return self.recovery_timeout
+            return None
+
+    @contextmanager
+    def guard(self):
+        """Protect the enclosed block; works around ``await`` as well as sync code."""
+        probe = self.acquire()
+        started = self.clock()
+        try:
+            yield
+        except self.expected_exception:
+            self.record(probe, failed=True, duration=self.clock() - started)
+            raise
+        except BaseException:
+            # Cancellation or an exception this breaker does not track
+            self.release(probe)
+            raise
+        self.record(probe, failed=False, duration=self.clock() - started)
+
     def call(self, func: Callable, *args, **kwargs) -> Any:
         """Execute function with circuit breaker protection."""
-        if self.state == CircuitState.OPEN:
-            if self._should_attempt_reset():
-                self.state = CircuitState.HALF_OPEN
-                logger.info("Circuit breaker entering HALF_OPEN state")
-            else:
-                raise Exception("Circuit breaker is OPEN - service unavailable")
-        
-        try:
-            result = func(*args, **kwargs)
-            self._on_success()
-            return result
-        except self.expected_exception as e:
-            self._on_failure()
-            raise e
-    
-    def _should_attempt_reset(self) -> bool:
-        """Check if enough time has passed to attempt reset."""
-        return (
-            self.last_failure_time and
-            time.time() - self.last_failure_time >= self.recovery_timeout
-        )
-    
-    def _on_success(self):
-        """Handle successful call."""
-        self.failure_count = 0
-        self.state = CircuitState.CLOSED
-    
-    def _on_failure(self):
-        """Handle failed call."""
-        self.failure_count += 1
-        self.last_failure_time = time.time()
-        
-        if self.failure_count >= self.failure_threshold:
-            self.state = CircuitState.OPEN
-            logger.warning(f"Circuit breaker OPENED after {self.failure_count} failures")
-
-def circuit_breaker(failure_threshold: int = 5, recovery_timeout: int = 60):
-    """Decorator for circuit breaker pattern."""
+        with self.guard():
+            return func(*args, **kwargs)
+
+    async def acall(self, func: Callable, *args, **kwargs) -> Any:
+        """Await ``func(*args, **kwargs)`` with circuit breaker protection."""
+        with self.guard():
+            return await func(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(self.clock())
+            calls = len(self._outcomes)
+            return {
+                "state": self.state.value,
+                "calls_in_window": calls,
+                "failure_rate": self._failures / calls if calls else 0.0,
+                "slow_call_rate": self._slow / calls if calls else 0.0,
+                "probes_in_flight": self._probes_in_flight,
+            }
+
+    def _expire(self, now: float):
+        while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+            _, failed, slow = self._outcomes.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _transition(self, state: CircuitState, now: float):
+        logger.info(f"Circuit breaker '{self.name}' {self.state.value} -> {state.value}")
+        self.state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == CircuitState.OPEN:
+            self.opened_at = now
+        self._outcomes.clear()
+        self._failures = self._slow = 0
+
+
+class CircuitBreakerCallbackHandler(AsyncCallbackHandler):
+    """Applies a breaker to the chat model calls of one chain run.
+
+    The model call is refused at ``on_chat_model_start`` when the breaker is
+    open (``raise_error`` makes LangChain propagate the error). A call counts
+    as successful once its first token arrives, timed from the start of the
+    call, so a slow first token trips the latency threshold.
+    """
+
+    raise_error = True
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self._calls: Dict[Any, Tuple[bool, float]] = {}  # run_id -> (probe, started)
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any):
+        self._calls[run_id] = (self.breaker.acquire(), self.breaker.clock())
+
+    async def on_llm_new_token(self, token: str, *, run_id, **kwargs: Any):
+        self._finish(run_id, failed=False)
+
+    async def on_llm_end(self, response, *, run_id, **kwargs: Any):
+        self._finish(run_id, failed=False)
+
+    async def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any):
+        if not isinstance(error, Exception):
+            # Cancelled, or the stream was closed (GeneratorExit) because the
+            # client went away: says nothing about the upstream
+            call = self._calls.pop(run_id, None)
+            if call is not None:
+                self.breaker.release(call[0])
+            return
+        self._finish(run_id, failed=True)
+
+    def _finish(self, run_id, failed: bool):
+        call = self._calls.pop(run_id, None)
+        if call is not None:
+            probe, started = call
+            self.breaker.record(probe, failed=failed, duration=self.breaker.clock() - started)
+
+
+def circuit_breaker(failure_threshold: float = CIRCUIT_BREAKER_FAILURE_RATE,
+                    recovery_timeout: float = CIRCUIT_BREAKER_RECOVERY_SECONDS):
+    """Decorator for circuit breaker pattern; supports sync and async functions."""
     def decorator(func):
-        breaker = CircuitBreaker(failure_threshold, recovery_timeout)
-        
+        breaker = CircuitBreaker(
+            func.__qualname__, failure_rate_threshold=failure_threshold, recovery_timeout=recovery_timeout
+        )
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return await breaker.acall(func, *args, **kwargs)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             return breaker.call(func, *args, **kwargs)
-        
-        return wrapper
+
+        return async_wrapper if asyncio.iscoroutinefunction(func) else wrapper
     return decorator
+
+
+# One breaker per upstream dependency of the chat path, shared by all requests
+embedding_breaker = CircuitBreaker("azure_openai_embeddings", slow_call_seconds=EMBEDDING_SLOW_CALL_SECONDS)
+milvus_breaker = CircuitBreaker("milvus_search", slow_call_seconds=MILVUS_SLOW_CALL_SECONDS)
+llm_breaker = CircuitBreaker("azure_openai_chat", slow_call_seconds=LLM_SLOW_CALL_SECONDS)
+breakers = {breaker.name: breaker for breaker in (embedding_breaker, milvus_breaker, llm_breaker)}
+
+
+def open_breaker_retry_after() -> Optional[float]:
+    """Longest wait among open chat-path breakers, or None if every dependency can be called."""
+    waits = [wait for wait in (breaker.retry_after() for breaker in breakers.values()) if wait is not None]
+    return max(waits) if waits else None
@@ -0,0 +1,157 @@
+"""
+Blue/green versioning of the knowledge base collection.
+
+The configured collection name is a Milvus alias pointing at one of several
+physical, versioned collections. Full rebuilds are written to a new version
+and promoted by moving the alias, so searches never see an empty or partial
+collection and the previous version stays available for rollback.
+"""
+import os
+import time
+import logging
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from pymilvus import MilvusClient, MilvusException
+
+from app.services.lexical_index import delete_index
+
+logger = logging.getLogger(__name__)
+
+# Number of versions kept (the active one included) after a promotion
+MILVUS_KEEP_VERSIONS = int(os.getenv("MILVUS_KEEP_VERSIONS", "2"))
+
+VERSION_SEPARATOR = "_v"
+PRIMARY_FIELD = "pk"
+
+
+class CollectionVersions:
+    """Manage versioned collections behind a single alias."""
+
+    def __init__(self, client: MilvusClient, alias: str, keep_versions: int = MILVUS_KEEP_VERSIONS):
+        self.client = client
+        self.alias = alias
+        self.keep_versions = max(2, keep_versions)
+
+    def new_version_name(self) -> str:
+        name = f"{self.alias}{VERSION_SEPARATOR}{time.strftime('%Y%m%d%H%M%S')}"
+        # Two rebuilds within the same second get distinct names
+        suffix = 1
+        candidate = name
+        while self.client.has_collection(candidate):
+            candidate = f"{name}_{suffix}"
+            suffix += 1
+        return candidate
+
+    def list_versions(self) -> List[str]:
+        """Versioned collections for this alias, oldest first."""
+        prefix = f"{self.alias}{VERSION_SEPARATOR}"
+        return sorted(name for name in self.client.list_collections() if name.startswith(prefix))
+
+    def _alias_target(self) -> Optional[str]:
+        try:
+            return self.client.describe_alias(self.alias).get("collection_name")
+        except MilvusException:
+            return None
+
+    def active(self) -> Optional[str]:
+        """The physical collection currently serving searches.
+
+        Deployments created before versioning have a plain collection named
+        like the alias; that collection is reported as active until the first
+        promotion replaces it.
+        """
+        target = self._alias_target()
+        if target:
+            return target
+        if self.client.has_collection(self.alias):
+            return self.alias
+        return None
+
+    def previous(self) -> Optional[str]:
+        """The newest version older than the active one, used for rollback."""
+        active = self.active()
+        older = [name for name in self.list_versions() if active is None or name < active]
+        return older[-1] if older else None
+
+    def entity_count(self, collection_name: str) -> int:
+        self.client.flush(collection_name)
+        return int(self.client.get_collection_stats(collection_name).get("row_count", 0))
+
+    def _scan_keys(self, collection_name: str) -> Tuple[int, List[str]]:
+        """Number of distinct primary keys, and the keys stored more than once."""
+        counts = Counter()
+        iterator = self.client.query_iterator(collection_name, batch_size=1000, output_fields=[PRIMARY_FIELD])
+        try:
+            while batch := iterator.next():
+                counts.update(str(row[PRIMARY_FIELD]) for row in batch)
+        finally:
+            iterator.close()
+        return len(counts), [key for key, count in counts.items() if count > 1]
+
+    def _deduplicate(self, collection_name: str, keys: List[str], batch_size: int = 1000):
+        """Keep a single row for each of ``keys``."""
+        fields = [field["name"] for field in self.client.describe_collection(collection_name)["fields"]]
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            rows = {str(row[PRIMARY_FIELD]): row for row in self.client.get(collection_name, ids=batch, output_fields=fields)}
+            self.client.delete(collection_name, ids=batch)
+            self.client.insert(collection_name, data=list(rows.values()))
+
+    def _point_alias(self, collection_name: str):
+        if self._alias_target():
+            self.client.alter_alias(collection_name=collection_name, alias=self.alias)
+            return
+        if self.client.has_collection(self.alias):
+            # A pre-versioning collection owns the name; it has to go before
+            # the alias can be created.
+            logger.warning(f"Replacing legacy collection '{self.alias}' with an alias")
+            self.client.drop_collection(self.alias)
+            delete_index(self.alias)
+        self.client.create_alias(collection_name=collection_name, alias=self.alias)
+
+    def promote(self, collection_name: str, expected_count: Optional[int] = None):
+        """Verify ``collection_name`` and atomically make it the active version."""
+        if expected_count is not None:
+            count = self.entity_count(collection_name)
+            if count > expected_count:
+                # A resumed rebuild inserts the batch that was in flight, but not
+                # checkpointed, when it stopped a second time
+                distinct, duplicates = self._scan_keys(collection_name)
+                if distinct == expected_count and duplicates:
+                    logger.warning(f"Removing {count - distinct} duplicate entities from '{collection_name}'")
+                    self._deduplicate(collection_name, duplicates)
+                    distinct, duplicates = self._scan_keys(collection_name)
+                    count = distinct + len(duplicates)
+            if count != expected_count:
+                raise RuntimeError(
+                    f"Refusing to promote '{collection_name}': it has {count} entities, "
+                    f"expected {expected_count}"
+                )
+        previous = self.active()
+        self._point_alias(collection_name)
+        logger.info(f"Promoted '{collection_name}' to '{self.alias}' (previous: {previous})")
+        self.prune()
+
+    def rollback(self) -> str:
+        """Point the alias back at the previous version."""
+        previous = self.previous()
+        if previous is None:
+            raise RuntimeError(f"No previous version of '{self.alias}' to roll back to")
+        self._point_alias(previous)
+        logger.info(f"Rolled back '{self.alias}' to '{previous}'")
+        return previous
+
+    def prune(self):
+        """Drop versions beyond ``keep_versions``, never touching the active one."""
+        active = self.active()
+        stale = [name for name in self.list_versions() if name != active]
+        for name in stale[: max(0, len(stale) - (self.keep_versions - 1))]:
+            logger.info(f"Dropping old collection version '{name}'")
+            try:
+                self.client.drop_collection(name)
+            except MilvusException as e:
+                logger.warning(f"Failed to drop old collection version '{name}': {e}")
+                continue
+            # Its lexical index is a full copy of the corpus
+            delete_index(name)
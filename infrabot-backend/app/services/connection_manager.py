@@ -1,81 +1,263 @@
 """
 Enhanced connection management for Milvus and Azure OpenAI.
+
+All Milvus traffic (retrieval, ingestion, collection management and status
+checks) goes through one pool of gRPC channels owned by ``milvus_manager``.
+A background thread probes every channel and replaces the ones that stop
+answering, so a Milvus restart heals without restarting the app.
 """
+import os
+import time
 import asyncio
-from contextlib import asynccontextmanager
-from typing import Optional
 import logging
-from pymilvus import connections, utility
+import functools
+import threading
+import types
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from pymilvus import MilvusClient
 from langchain_milvus.vectorstores import Milvus
-from app.services.ingest_service import init_embeddings, MILVUS_HOST, MILVUS_PORT, MILVUS_COLLECTION_NAME
+
+from app.services.async_retriever import RETRIEVAL_THREADS, get_retrieval_executor
+from app.services.monitoring import metrics
+
+load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+MILVUS_HOST = os.getenv("MILVUS_HOST", "milvus-standalone")
+MILVUS_PORT = int(os.getenv("MILVUS_PORT", "19530"))
+# gRPC multiplexes calls over HTTP/2, so one channel per two search threads is plenty
+MILVUS_POOL_SIZE = int(os.getenv("MILVUS_POOL_SIZE", str(max(1, RETRIEVAL_THREADS // 2))))
+MILVUS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MILVUS_CONNECT_TIMEOUT_SECONDS", "30"))
+MILVUS_CONNECT_RETRIES = int(os.getenv("MILVUS_CONNECT_RETRIES", "3"))
+# Interval between keepalive probes of each channel (0 disables the probe thread)
+MILVUS_HEALTH_INTERVAL_SECONDS = float(os.getenv("MILVUS_HEALTH_INTERVAL_SECONDS", "15"))
+
+
+def create_milvus_channel(host: str = MILVUS_HOST, port: int = MILVUS_PORT) -> MilvusClient:
+    """Open a client on its own gRPC channel rather than pymilvus' shared one."""
+    return MilvusClient(
+        uri=f"http://{host}:{port}",
+        timeout=MILVUS_CONNECT_TIMEOUT_SECONDS,
+        dedicated=True,
+    )
+
+
 class MilvusConnectionManager:
-    """Singleton connection manager for Milvus."""
-    
-    _instance: Optional['MilvusConnectionManager'] = None
-    _connection_alias = "default"
-    _is_connected = False
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
-    async def connect(self):
-        """Establish connection to Milvus with retry logic."""
-        if self._is_connected:
-            return
-            
-        max_retries = 3
-        for attempt in range(max_retries):
+    """Pool of Milvus channels with retrying connects, keepalive probes and reconnects."""
+
+    def __init__(
+        self,
+        pool_size: int = MILVUS_POOL_SIZE,
+        client_factory: Callable[[], MilvusClient] = create_milvus_channel,
+        connect_retries: int = MILVUS_CONNECT_RETRIES,
+        health_interval: float = MILVUS_HEALTH_INTERVAL_SECONDS,
+    ):
+        self.pool_size = max(1, pool_size)
+        self.client_factory = client_factory
+        self.connect_retries = max(1, connect_retries)
+        self.health_interval = health_interval
+        self._clients: List[Optional[MilvusClient]] = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self.connects = 0
+        self.reconnects = 0
+        self.failed_probes = 0
+
+    def _open_channel(self) -> MilvusClient:
+        for attempt in range(self.connect_retries):
             try:
-                connections.connect(
-                    alias=self._connection_alias,
-                    host=MILVUS_HOST,
-                    port=MILVUS_PORT,
-                    timeout=30
-                )
-                self._is_connected = True
-                logger.info(f"Connected to Milvus at {MILVUS_HOST}:{MILVUS_PORT}")
-                return
+                client = self.client_factory()
+                self.connects += 1
+                metrics.record_connection_event("milvus_connects")
+                return client
             except Exception as e:
+                metrics.record_connection_event("milvus_connect_failures")
                 logger.warning(f"Milvus connection attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                if attempt < self.connect_retries - 1:
+                    time.sleep(2 ** attempt)  # Exponential backoff
                 else:
                     raise
-    
-    async def disconnect(self):
-        """Safely disconnect from Milvus."""
-        if self._is_connected:
+
+    def connect_sync(self):
+        """Open every channel in the pool; a no-op once connected."""
+        with self._lock:
+            if self._clients:
+                return
+            self._clients = [self._open_channel() for _ in range(self.pool_size)]
+            logger.info(f"Connected to Milvus at {MILVUS_HOST}:{MILVUS_PORT} with {self.pool_size} channels")
+
+    async def connect(self):
+        """Establish connection to Milvus with retry logic."""
+        await asyncio.to_thread(self.connect_sync)
+
+    def client(self) -> MilvusClient:
+        """Next channel from the pool, connecting on first use."""
+        if not self._clients:
+            self.connect_sync()
+        with self._lock:
+            for _ in range(len(self._clients)):
+                index = self._next % len(self._clients)
+                self._next += 1
+                client = self._clients[index]
+                if client is not None:
+                    return client
+        # Every channel is down; reconnect one in the caller's thread
+        return self._reconnect(0)
+
+    def _reconnect(self, index: int) -> MilvusClient:
+        with self._lock:
+            old = self._clients[index]
+            self._clients[index] = None
+        if old is not None:
+            try:
+                old.close()
+            except Exception as e:
+                logger.debug(f"Error closing Milvus channel {index}: {e}")
+        client = self._open_channel()
+        with self._lock:
+            self._clients[index] = client
+        self.reconnects += 1
+        metrics.record_connection_event("milvus_reconnects")
+        logger.info(f"Reconnected Milvus channel {index}")
+        return client
+
+    def probe(self) -> bool:
+        """Ping every channel, replacing those that fail. True if all ended up healthy."""
+        healthy = True
+        for index in range(len(self._clients)):
+            client = self._clients[index]
+            try:
+                if client is None:
+                    raise ConnectionError("channel is down")
+                client.get_server_version()
+                continue
+            except Exception as e:
+                self.failed_probes += 1
+                metrics.record_connection_event("milvus_failed_probes")
+                logger.warning(f"Milvus channel {index} failed its health probe: {e}")
+            try:
+                self._reconnect(index)
+            except Exception as e:
+                healthy = False
+                logger.error(f"Failed to reconnect Milvus channel {index}: {e}")
+        return healthy
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self.health_interval):
             try:
-                connections.disconnect(self._connection_alias)
-                self._is_connected = False
-                logger.info("Disconnected from Milvus")
+                self.probe()
+            except Exception as e:
+                logger.error(f"Milvus keepalive probe failed: {e}")
+
+    def start_keepalive(self):
+        """Start the background probe thread (idempotent)."""
+        if self.health_interval <= 0 or (self._keepalive_thread and self._keepalive_thread.is_alive()):
+            return
+        self._stop.clear()
+        self._keepalive_thread = threading.Thread(
+            target=self._keepalive_loop, name="milvus-keepalive", daemon=True
+        )
+        self._keepalive_thread.start()
+
+    def disconnect_sync(self):
+        self._stop.set()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            if client is None:
+                continue
+            try:
+                client.close()
             except Exception as e:
                 logger.error(f"Error disconnecting from Milvus: {e}")
-    
+        if clients:
+            logger.info("Disconnected from Milvus")
+
+    async def disconnect(self):
+        """Safely disconnect from Milvus."""
+        await asyncio.to_thread(self.disconnect_sync)
+
     def is_connected(self) -> bool:
         """Check if connection is active."""
-        return self._is_connected and connections.has_connection(self._connection_alias)
-    
+        return bool(self._clients) and all(client is not None for client in self._clients)
+
     async def health_check(self) -> bool:
         """Perform health check on Milvus connection."""
         try:
-            if not self.is_connected():
+            if not self._clients:
                 await self.connect()
-            
-            # Check if collection exists
-            return utility.has_collection(MILVUS_COLLECTION_NAME)
+            return await asyncio.to_thread(self.probe)
         except Exception as e:
             logger.error(f"Milvus health check failed: {e}")
             return False
 
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pool_size": self.pool_size,
+            "healthy_channels": sum(1 for client in self._clients if client is not None),
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "failed_probes": self.failed_probes,
+        }
+
+
 # Global connection manager instance
 milvus_manager = MilvusConnectionManager()
 
+
+class ThreadedAsyncClient:
+    """Stand-in for ``AsyncMilvusClient`` that runs pooled synchronous calls on the retrieval thread pool."""
+
+    def __getattr__(self, name: str):
+        method = getattr(milvus_manager.client(), name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_retrieval_executor(), functools.partial(method, *args, **kwargs))
+
+        return call
+
+
+class PooledMilvus(Milvus):
+    """Milvus vector store whose calls are spread over the managed channel pool.
+
+    ``Milvus.__init__`` opens a ``MilvusClient`` and an ``AsyncMilvusClient`` of
+    its own, which nothing closes when the RAG chain is rebuilt. Here it runs
+    with both names bound to the pool in a namespace of its own, so it opens
+    no clients and langchain_milvus' module (and any other ``Milvus`` built
+    meanwhile) is left as it is. Async methods run the synchronous calls on
+    the retrieval thread pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        from langchain_milvus.vectorstores import milvus as base
+
+        pooled = milvus_manager.client()
+        init = Milvus.__init__
+        namespace = dict(vars(base), MilvusClient=lambda **_: pooled, AsyncMilvusClient=lambda **_: None)
+        pooled_init = types.FunctionType(init.__code__, namespace, init.__name__, init.__defaults__, init.__closure__)
+        pooled_init.__kwdefaults__ = init.__kwdefaults__
+        pooled_init(self, *args, **kwargs)
+        self._milvus_client = None
+        self._async_milvus_client = ThreadedAsyncClient()
+
+    @property
+    def client(self) -> MilvusClient:
+        return milvus_manager.client()
+
+    @property
+    def aclient(self) -> ThreadedAsyncClient:
+        return self._async_milvus_client
+
+
 @asynccontextmanager
 async def get_milvus_connection():
     """Context manager for Milvus connections."""
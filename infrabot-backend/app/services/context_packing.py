@@ -0,0 +1,234 @@
+"""
+Context packing between retrieval and the prompt.
+
+Chunks are split with ``CHUNK_OVERLAP`` characters of overlap, so neighbouring
+chunks of the same PDF repeat text, and a few large documents tend to fill
+every slot. Before the retrieved chunks are stuffed into the prompt they are:
+
+1. merged with their neighbours from the same source (adjacent chunk indices
+   or overlapping text), removing the repeated overlap;
+2. de-duplicated: a passage whose word shingles are mostly contained in a
+   more relevant one is dropped;
+3. ordered by maximal marginal relevance, trading relevance against
+   similarity to chunks already chosen (same-source chunks count as similar);
+4. added in that order until ``CONTEXT_TOKEN_BUDGET`` is reached.
+
+Similarity is lexical (Jaccard over word shingles) so packing needs no extra
+embedding calls.
+"""
+import os
+import re
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+from app.services.parse_pool import CHUNK_OVERLAP
+from app.services.pipeline_timing import report_stage
+from app.services.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+# Tokens of retrieved context placed in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Relevance vs. diversity in MMR ordering (1 = relevance only)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Share of a chunk's shingles found in a more relevant passage that makes it a duplicate
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.8"))
+
+# Similarity assumed between chunks of the same source, for diversity
+SAME_SOURCE_SIMILARITY = 0.5
+# Shortest suffix/prefix match treated as split overlap between two chunks
+MIN_MERGE_OVERLAP = 30
+SHINGLE_WORDS = 3
+
+_WORD = re.compile(r"\w+")
+_CHUNK_INDEX = re.compile(r"-(\d+)$")
+
+
+@dataclass
+class Passage:
+    """One or more merged chunks of the same source."""
+    text: str
+    source: Optional[str]
+    relevance: float
+    metadata: Dict
+    chunk_index: Optional[int] = None
+    last_index: Optional[int] = None
+    chunks: int = 1
+    shingles: FrozenSet = field(default_factory=frozenset)
+
+    def to_document(self) -> Document:
+        metadata = {**self.metadata, "chunks": self.chunks}
+        if "relevance_score" in metadata:
+            metadata["relevance_score"] = self.relevance
+        return Document(page_content=self.text, metadata=metadata)
+
+
+def _chunk_index(metadata: Dict) -> Optional[int]:
+    """Position of a chunk within its file, from the ``<content hash>-<index>`` primary key."""
+    match = _CHUNK_INDEX.search(str(metadata.get("pk", "")))
+    return int(match.group(1)) if match else None
+
+
+def shingles(text: str) -> FrozenSet:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return frozenset(words)
+    return frozenset(tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+
+
+def jaccard(a: FrozenSet, b: FrozenSet) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def containment(a: FrozenSet, b: FrozenSet) -> float:
+    """Share of the smaller set contained in the other; catches a chunk repeated inside a merged passage."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def text_overlap(left: str, right: str, max_overlap: int = CHUNK_OVERLAP + 50) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for size in range(min(len(left), len(right), max_overlap), MIN_MERGE_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _to_passages(documents: Sequence[Document]) -> List[Passage]:
+    passages = []
+    for rank, document in enumerate(documents):
+        # Rank-based relevance when the retriever attached no scores
+        relevance = document.metadata.get("relevance_score", 1.0 - rank / max(1, len(documents)))
+        index = _chunk_index(document.metadata)
+        passages.append(Passage(
+            text=document.page_content,
+            source=document.metadata.get("source"),
+            relevance=float(relevance),
+            metadata=dict(document.metadata),
+            chunk_index=index,
+            last_index=index,
+        ))
+    return passages
+
+
+def merge_neighbours(passages: List[Passage]) -> List[Passage]:
+    """Join chunks of the same source that are adjacent in their file, dropping the repeated overlap."""
+    by_source: Dict[Optional[str], List[Passage]] = {}
+    for passage in passages:
+        by_source.setdefault(passage.source, []).append(passage)
+
+    merged = []
+    for source, group in by_source.items():
+        if source is None:
+            merged.extend(group)
+            continue
+        group.sort(key=lambda p: (p.chunk_index is None, p.chunk_index or 0))
+        current = group[0]
+        for passage in group[1:]:
+            adjacent = (
+                current.last_index is not None
+                and passage.chunk_index is not None
+                and passage.chunk_index == current.last_index + 1
+            )
+            overlap = text_overlap(current.text, passage.text)
+            if adjacent or overlap:
+                separator = "" if overlap else "\n"
+                current.text = current.text + separator + passage.text[overlap:]
+                current.relevance = max(current.relevance, passage.relevance)
+                current.last_index = passage.last_index
+                current.chunks += passage.chunks
+            else:
+                merged.append(current)
+                current = passage
+        merged.append(current)
+    return merged
+
+
+def _similarity(a: Passage, b: Passage) -> float:
+    similarity = jaccard(a.shingles, b.shingles)
+    if a.source is not None and a.source == b.source:
+        similarity = max(similarity, SAME_SOURCE_SIMILARITY)
+    return similarity
+
+
+def mmr_order(passages: List[Passage], lambda_mult: float = CONTEXT_MMR_LAMBDA) -> List[Passage]:
+    remaining = list(passages)
+    ordered: List[Passage] = []
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda p: lambda_mult * p.relevance
+            - (1 - lambda_mult) * max((_similarity(p, chosen) for chosen in ordered), default=0.0),
+        )
+        ordered.append(best)
+        remaining.remove(best)
+    return ordered
+
+
+@dataclass
+class PackedContext:
+    documents: List[Document]
+    tokens_before: int
+    tokens_after: int
+    dropped_duplicates: int = 0
+    merged_chunks: int = 0
+
+
+def pack_documents(
+    documents: Sequence[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    lambda_mult: float = CONTEXT_MMR_LAMBDA,
+    duplicate_similarity: float = CONTEXT_DUPLICATE_SIMILARITY,
+) -> PackedContext:
+    """Merge, de-duplicate, diversify and budget retrieved chunks."""
+    tokens_before = sum(count_tokens(d.page_content) for d in documents)
+    passages = merge_neighbours(_to_passages(documents))
+    merged_chunks = len(documents) - len(passages)
+    for passage in passages:
+        passage.shingles = shingles(passage.text)
+
+    kept: List[Passage] = []
+    for passage in sorted(passages, key=lambda p: p.relevance, reverse=True):
+        if any(containment(passage.shingles, other.shingles) >= duplicate_similarity for other in kept):
+            continue
+        kept.append(passage)
+    dropped = len(passages) - len(kept)
+
+    packed, used = [], 0
+    for passage in mmr_order(kept, lambda_mult):
+        tokens = count_tokens(passage.text)
+        if used + tokens > token_budget:
+            if packed:
+                continue
+            # The most relevant passage alone is over budget: keep its beginning
+            passage.text = truncate_to_tokens(passage.text, token_budget)
+            tokens = count_tokens(passage.text)
+        packed.append(passage.to_document())
+        used += tokens
+    return PackedContext(packed, tokens_before, used, dropped, merged_chunks)
+
+
+def make_context_packer(token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """Runnable from retrieved documents to packed documents, placed before the stuff chain."""
+
+    async def pack(documents: List[Document], config: RunnableConfig) -> List[Document]:
+        started = time.perf_counter()
+        packed = pack_documents(documents, token_budget=token_budget)
+        await report_stage(config, "context_packing", time.perf_counter() - started)
+        logger.debug(
+            f"Packed {len(documents)} chunks into {len(packed.documents)} passages: "
+            f"{packed.tokens_before} -> {packed.tokens_after} tokens "
+            f"({packed.merged_chunks} merged, {packed.dropped_duplicates} duplicates dropped)"
+        )
+        return packed.documents
+
+    return RunnableLambda(pack, name="context_packing")
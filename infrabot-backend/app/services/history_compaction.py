@@ -0,0 +1,217 @@
+"""
+Token-budgeted compaction of the chat history sent with each question.
+
+The frontend sends the whole conversation on every turn. Sending it verbatim
+makes prompt size (and so latency and cost) grow with conversation length.
+``HistoryCompactor`` keeps the most recent messages verbatim within a token
+budget and replaces everything older with a summary.
+
+Summaries are produced by the chat model off the request path: the first time
+a prefix of a conversation needs summarising, the request uses a cheap
+extractive summary of the user's earlier questions while the model summary
+is computed in the background. Summaries are rolling (the previous summary
+plus the messages since) and cached by a fingerprint of the prefix they
+cover, so each turn of a long conversation summarises only what is new.
+As the summarised prefix grows by a turn or so each time, a request uses the
+summary of the longest prefix already cached plus the questions asked since.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+
+from app.services.cache_service import normalize_text
+from app.services.tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens of history (verbatim messages plus summary) sent with a question
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Most recent messages always kept verbatim, even over budget
+HISTORY_MIN_RECENT_MESSAGES = int(os.getenv("HISTORY_MIN_RECENT_MESSAGES", "2"))
+# Part of the budget reserved for the summary of older messages
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_SUMMARY_CACHE_ENTRIES = int(os.getenv("HISTORY_SUMMARY_CACHE_ENTRIES", "1000"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+Summarizer = Callable[[str, List[BaseMessage]], Awaitable[str]]
+
+
+def to_message(message: Dict[str, str]) -> BaseMessage:
+    content = message.get("content", "")
+    return HumanMessage(content=content) if message.get("role") == "user" else AIMessage(content=content)
+
+
+@dataclass
+class CompactedHistory:
+    messages: List[BaseMessage]
+    original_tokens: int
+    tokens: int
+    summarized_messages: int = 0
+    # "none", "cached" (model summary), "rolling" (model summary of an earlier
+    # prefix plus the questions since) or "extractive" (no model summary yet)
+    summary_source: str = "none"
+
+
+class HistoryCompactor:
+    """Fit chat history into a token budget with recent turns verbatim and a rolling summary."""
+
+    def __init__(
+        self,
+        summarize: Optional[Summarizer] = None,
+        budget: int = HISTORY_TOKEN_BUDGET,
+        min_recent_messages: int = HISTORY_MIN_RECENT_MESSAGES,
+        summary_max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS,
+        cache_entries: int = HISTORY_SUMMARY_CACHE_ENTRIES,
+    ):
+        self.summarize = summarize
+        self.budget = budget
+        self.min_recent_messages = min_recent_messages
+        self.summary_max_tokens = summary_max_tokens
+        self.cache_entries = cache_entries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def compact(self, history: Sequence[Dict[str, str]]) -> CompactedHistory:
+        messages = [to_message(message) for message in history]
+        counts = [count_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS for message in messages]
+        original = sum(counts)
+        if original <= self.budget:
+            return CompactedHistory(messages, original, original)
+
+        # Newest messages first, within what the summary leaves of the budget
+        available = self.budget - self.summary_max_tokens
+        keep, used = 0, 0
+        for count in reversed(counts):
+            if keep >= self.min_recent_messages and used + count > available:
+                break
+            keep += 1
+            used += count
+        older = len(messages) - keep
+        if older == 0:
+            return CompactedHistory(messages, original, original)
+
+        prefix_keys = self._prefix_keys(history[:older])
+        # The prefix grows every turn, so the newest model summary usually covers
+        # all but the messages that aged out since; those get an extractive tail
+        covered = next((i + 1 for i in range(older - 1, -1, -1) if prefix_keys[i] in self._summaries), 0)
+        if covered == older:
+            summary = self._summaries[prefix_keys[-1]]
+            self._summaries.move_to_end(prefix_keys[-1])
+            source = "cached"
+        elif covered:
+            self._schedule_summary(prefix_keys, messages[:older])
+            cached = self._summaries[prefix_keys[covered - 1]]
+            self._summaries.move_to_end(prefix_keys[covered - 1])
+            tail = self._extractive_summary(
+                messages[covered:older], self.summary_max_tokens - count_tokens(cached) - 1,
+                "Since then the user asked: ",
+            )
+            summary = f"{cached} {tail}" if tail else cached
+            source = "rolling"
+        else:
+            self._schedule_summary(prefix_keys, messages[:older])
+            summary = self._extractive_summary(messages[:older], self.summary_max_tokens)
+            source = "extractive"
+
+        summary_message = SystemMessage(content=SUMMARY_PREFIX + truncate_to_tokens(summary, self.summary_max_tokens))
+        tokens = count_tokens(summary_message.content) + MESSAGE_OVERHEAD_TOKENS + used
+        return CompactedHistory([summary_message, *messages[older:]], original, tokens, older, source)
+
+    @staticmethod
+    def _prefix_keys(history: Sequence[Dict[str, str]]) -> List[str]:
+        """Fingerprint of every prefix of ``history`` (element i covers messages 0..i)."""
+        digest = hashlib.sha256()
+        keys = []
+        for message in history:
+            digest.update(message.get("role", "").strip().lower().encode("utf-8") + b"\0")
+            digest.update(normalize_text(message.get("content", "")).encode("utf-8") + b"\0")
+            keys.append(digest.hexdigest())
+        return keys
+
+    @staticmethod
+    def _extractive_summary(
+        messages: Sequence[BaseMessage], max_tokens: int, lead: str = "The user previously asked: "
+    ) -> str:
+        """The user's earlier questions, most recent kept when they do not all fit."""
+        questions = [str(m.content).strip() for m in messages if isinstance(m, HumanMessage) and str(m.content).strip()]
+        kept, used = [], count_tokens(lead)
+        for question in reversed(questions):
+            cost = count_tokens(question) + 1
+            if used + cost > max_tokens:
+                break
+            kept.append(question)
+            used += cost
+        return lead + " | ".join(reversed(kept)) if kept else ""
+
+    def _schedule_summary(self, prefix_keys: List[str], messages: List[BaseMessage]):
+        key = prefix_keys[-1]
+        if self.summarize is None or key in self._pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # Continue from the longest prefix that already has a summary
+        start, previous = 0, ""
+        for index in range(len(prefix_keys) - 2, -1, -1):
+            cached = self._summaries.get(prefix_keys[index])
+            if cached is not None:
+                start, previous = index + 1, cached
+                break
+        task = loop.create_task(self._summarize_into(key, previous, messages[start:]))
+        self._pending[key] = task
+
+    async def _summarize_into(self, key: str, previous: str, messages: List[BaseMessage]):
+        try:
+            summary = (await self.summarize(previous, messages)).strip()
+            if summary:
+                self._summaries[key] = summary
+                while len(self._summaries) > self.cache_entries:
+                    self._summaries.popitem(last=False)
+        except Exception as e:
+            logger.warning(f"History summarisation failed, using extractive summaries: {e}")
+        finally:
+            self._pending.pop(key, None)
+
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an IT helpdesk assistant.\n"
+    "Update the existing summary with the new messages. Keep the user's problem, environment details "
+    "(device, OS, application, error messages) and the steps already suggested or tried. "
+    "Write at most {max_words} words, in the third person, with no preamble."
+)
+
+
+def make_llm_summarizer(llm, breaker=None, max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS) -> Summarizer:
+    """Summarizer backed by the chat model, optionally behind a circuit breaker."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", SUMMARY_SYSTEM_PROMPT),
+        ("human", "Existing summary:\n{summary}\n\nNew messages:\n{messages}"),
+    ])
+    chain = prompt | llm | StrOutputParser()
+
+    async def summarize(previous: str, messages: List[BaseMessage]) -> str:
+        inputs = {
+            "max_words": max(20, int(max_tokens * 0.75)),
+            "summary": previous or "(none)",
+            "messages": get_buffer_string(messages, human_prefix="User", ai_prefix="Assistant"),
+        }
+        if breaker is not None:
+            return await breaker.acall(chain.ainvoke, inputs)
+        return await chain.ainvoke(inputs)
+
+    return summarize
+
+
+# Shared by all chat requests; the summarizer is attached when the RAG chain is built
+history_compactor = HistoryCompactor()
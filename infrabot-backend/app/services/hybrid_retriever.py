@@ -0,0 +1,138 @@
+"""
+Hybrid lexical + dense retrieval.
+
+Every question is searched in the local BM25 index first. When that search
+is confident (every query term appears in the top chunk and at least one of
+them is rare in the corpus, typically an error code or product name) its
+results are returned directly, skipping the query embedding and the Milvus
+search. Otherwise the dense search runs and both rankings are combined with
+reciprocal rank fusion, so exact-token matches the embedding missed still
+reach the prompt. If the dense search fails, lexical results are served.
+``takes_fast_path`` lets the chat endpoint make the same decision up front,
+so a confident query skips the semantic cache's query embedding as well.
+
+Lexical hits carry their query coverage as ``lexical_score``, not as
+``relevance_score``: the reranker and query condensation compare relevance
+scores across documents, and coverage (1.0 on every fast-path hit) is not on
+the dense similarity scale.
+"""
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ConfigDict
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.lexical_index import BM25Index, LexicalHit, tokenize
+from app.services.pipeline_timing import report_stage
+
+logger = logging.getLogger(__name__)
+
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+# Lexical candidates fused with the dense results
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", "10"))
+# Rank offset in reciprocal rank fusion (higher flattens the rank weighting)
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_FAST_PATH_ENABLED = os.getenv("HYBRID_FAST_PATH_ENABLED", "true").lower() == "true"
+# Share of the query's IDF weight the top lexical hit must match to skip dense search
+HYBRID_FAST_PATH_COVERAGE = float(os.getenv("HYBRID_FAST_PATH_COVERAGE", "1.0"))
+# A query term found in at most this share of chunks counts as rare
+HYBRID_FAST_PATH_MAX_DF = float(os.getenv("HYBRID_FAST_PATH_MAX_DF", "0.02"))
+
+
+def _document(hit: LexicalHit) -> Document:
+    return Document(page_content=hit.text, metadata={**hit.metadata, "pk": hit.chunk_id, "lexical_score": hit.coverage})
+
+
+def _key(document: Document) -> str:
+    return str(document.metadata.get("pk") or document.page_content)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = HYBRID_RRF_K) -> List[Document]:
+    """Merge rankings by the sum of 1 / (rrf_k + rank); the first ranking's copy of a document is kept."""
+    fused: Dict[str, Tuple[float, Document]] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = _key(document)
+            score, kept = fused.get(key, (0.0, document))
+            fused[key] = (score + 1.0 / (rrf_k + rank), kept)
+    ordered = sorted(fused.values(), key=lambda item: item[0], reverse=True)[:k]
+    return [document for _, document in ordered]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 and dense retrieval fused by reciprocal rank, with a lexical-only fast path."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    dense: BaseRetriever
+    index: BM25Index
+    k: int = 5
+    lexical_k: int = HYBRID_LEXICAL_K
+    rrf_k: int = HYBRID_RRF_K
+    fast_path: bool = HYBRID_FAST_PATH_ENABLED
+    fast_path_coverage: float = HYBRID_FAST_PATH_COVERAGE
+    fast_path_max_df: float = HYBRID_FAST_PATH_MAX_DF
+
+    def _fuse(self, dense: List[Document], lexical: List[Document]) -> List[Document]:
+        """RRF of both rankings, every result scored on the dense relevance scale.
+
+        A lexical-only hit was ranked by the dense search below every result it
+        returned, so it gets the lowest of their relevance scores.
+        """
+        fused = reciprocal_rank_fusion([dense, lexical], self.k, self.rrf_k)
+        scores = [d.metadata["relevance_score"] for d in dense if "relevance_score" in d.metadata]
+        coverage = {_key(d): d.metadata["lexical_score"] for d in lexical}
+        for document in fused:
+            if _key(document) in coverage:
+                document.metadata.setdefault("lexical_score", coverage[_key(document)])
+            if scores:
+                document.metadata.setdefault("relevance_score", min(scores))
+        return fused
+
+    def is_confident(self, query: str, hits: List[LexicalHit]) -> bool:
+        """Whether the top lexical hit is good enough to skip dense search."""
+        if not self.fast_path or not hits or hits[0].coverage < self.fast_path_coverage:
+            return False
+        max_docs = max(1.0, self.fast_path_max_df * len(self.index))
+        return any(0 < self.index.document_frequency(term) <= max_docs for term in tokenize(query))
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = self.index.search(query, self.lexical_k)
+        if self.is_confident(query, hits):
+            return [_document(hit) for hit in hits[:self.k]]
+        dense = self.dense.invoke(query, {"callbacks": run_manager.get_child()})
+        return self._fuse(dense, [_document(hit) for hit in hits])
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started = time.perf_counter()
+        hits = self.index.search(query, self.lexical_k)
+        await report_stage(run_manager, "lexical_search", time.perf_counter() - started)
+        lexical = [_document(hit) for hit in hits]
+        if self.is_confident(query, hits):
+            logger.debug(f"Lexical fast path for query: {query[:100]}")
+            return lexical[:self.k]
+        try:
+            dense = await self.dense.ainvoke(query, {"callbacks": run_manager.get_child()})
+        except Exception as e:
+            if not lexical:
+                raise
+            logger.warning(f"Dense retrieval failed, serving lexical results: {e}")
+            return lexical[:self.k]
+        return self._fuse(dense, lexical)
+
+
+def takes_fast_path(retriever: Optional[BaseRetriever], query: str) -> bool:
+    """Whether ``retriever`` (or the hybrid retriever it wraps) answers ``query`` from the lexical index alone."""
+    while retriever is not None and not isinstance(retriever, HybridRetriever):
+        retriever = getattr(retriever, "base", None)
+    if retriever is None:
+        return False
+    return retriever.is_confident(query, retriever.index.search(query, retriever.lexical_k))
@@ -0,0 +1,153 @@
+"""
+Milvus vector index configuration.
+
+New collection versions are built with the index described by the
+``MILVUS_INDEX_*`` settings (or the options given to ``manage.py ingest``).
+Searches use parameters for the index a collection was actually built with,
+read from Milvus, so changing the build settings never sends e.g. HNSW ``ef``
+to an IVF collection that is still serving. ``MILVUS_SEARCH_PARAMS`` is
+merged over the per-type defaults as given, so set it for the served type.
+
+Use ``benchmarks/index_recall.py`` to compare recall and latency of settings.
+"""
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Index built for new collection versions: AUTOINDEX, FLAT, HNSW, IVF_FLAT, IVF_SQ8, IVF_PQ or DISKANN.
+# IVF_SQ8 (8-bit scalar) and IVF_PQ (product) quantization shrink the index; see MILVUS_RESCORE_FACTOR
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "AUTOINDEX").upper()
+MILVUS_METRIC_TYPE = os.getenv("MILVUS_METRIC_TYPE", "L2").upper()
+# JSON build parameters, e.g. {"M": 16, "efConstruction": 200}; per-type defaults when empty
+MILVUS_INDEX_PARAMS = os.getenv("MILVUS_INDEX_PARAMS", "")
+# JSON search parameters, e.g. {"ef": 64}; per-type defaults when empty
+MILVUS_SEARCH_PARAMS = os.getenv("MILVUS_SEARCH_PARAMS", "")
+# Candidates fetched per result and re-ranked by exact distance on the stored vectors (1 disables)
+MILVUS_RESCORE_FACTOR = int(os.getenv("MILVUS_RESCORE_FACTOR", "1"))
+
+DEFAULT_BUILD_PARAMS: Dict[str, Dict[str, Any]] = {
+    "AUTOINDEX": {},
+    "FLAT": {},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "DISKANN": {},
+}
+DEFAULT_SEARCH_PARAMS: Dict[str, Dict[str, Any]] = {
+    "AUTOINDEX": {},
+    "FLAT": {},
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "DISKANN": {"search_list": 100},
+}
+
+
+def parse_params(value: Optional[str]) -> Dict[str, Any]:
+    """Parameters from JSON (``{"M": 16}``) or ``key=value`` pairs (``M=16,efConstruction=200``)."""
+    if not value or not value.strip():
+        return {}
+    value = value.strip()
+    if value.startswith("{"):
+        return json.loads(value)
+    params = {}
+    for pair in value.split(","):
+        key, _, raw = pair.partition("=")
+        try:
+            params[key.strip()] = json.loads(raw)
+        except ValueError:
+            params[key.strip()] = raw.strip()
+    return params
+
+
+@dataclass
+class IndexConfig:
+    index_type: str = MILVUS_INDEX_TYPE
+    metric_type: str = MILVUS_METRIC_TYPE
+    build_params: Dict[str, Any] = field(default_factory=lambda: parse_params(MILVUS_INDEX_PARAMS))
+    search_overrides: Dict[str, Any] = field(default_factory=lambda: parse_params(MILVUS_SEARCH_PARAMS))
+
+    def __post_init__(self):
+        self.index_type = self.index_type.upper()
+        self.metric_type = self.metric_type.upper()
+        if self.index_type not in DEFAULT_BUILD_PARAMS:
+            raise ValueError(f"Unsupported index type '{self.index_type}'")
+
+    def index_params(self) -> Dict[str, Any]:
+        """``index_params`` for langchain_milvus / ``create_index``."""
+        return {
+            "index_type": self.index_type,
+            "metric_type": self.metric_type,
+            "params": self.build_params or dict(DEFAULT_BUILD_PARAMS[self.index_type]),
+        }
+
+    def search_params(self) -> Dict[str, Any]:
+        """``search_params`` for langchain_milvus / ``search``."""
+        return search_params_for(self.index_type, self.metric_type, self.search_overrides)
+
+    def describe(self) -> str:
+        return (
+            f"{self.index_type}/{self.metric_type} build={self.index_params()['params']} "
+            f"search={self.search_params()['params']}"
+        )
+
+
+def search_params_for(index_type: str, metric_type: str, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    index_type = index_type.upper()
+    params = dict(DEFAULT_SEARCH_PARAMS.get(index_type, {}))
+    params.update(overrides if overrides is not None else parse_params(MILVUS_SEARCH_PARAMS))
+    return {"metric_type": metric_type.upper(), "params": params}
+
+
+def collection_index(client, collection_name: str) -> Optional[Dict[str, str]]:
+    """Index type and metric of a collection's vector index, or None if it cannot be read."""
+    try:
+        for index_name in client.list_indexes(collection_name):
+            info = client.describe_index(collection_name, index_name)
+            if info.get("index_type") and info.get("metric_type"):
+                return {"index_type": info["index_type"], "metric_type": info["metric_type"]}
+    except Exception as e:
+        logger.warning(f"Could not read the index of '{collection_name}': {e}")
+    return None
+
+
+def collection_search_params(client, collection_name: str) -> Optional[Dict[str, Any]]:
+    """Search parameters matching the index a collection was built with."""
+    index = collection_index(client, collection_name)
+    if index is None:
+        return None
+    return search_params_for(index["index_type"], index["metric_type"])
+
+
+def collection_dimension(client, collection_name: str) -> Optional[int]:
+    """Dimension of a collection's float vector field, or None if it cannot be read."""
+    try:
+        for field_info in client.describe_collection(collection_name)["fields"]:
+            dim = (field_info.get("params") or {}).get("dim")
+            if dim:
+                return int(dim)
+    except Exception as e:
+        logger.warning(f"Could not read the vector dimension of '{collection_name}': {e}")
+    return None
+
+
+def distances(queries: np.ndarray, vectors: np.ndarray, metric_type: str) -> np.ndarray:
+    """Exact distances (lower is closer) between each query and each vector, Milvus-style per metric."""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    metric_type = metric_type.upper()
+    if metric_type == "COSINE":
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    if metric_type in ("IP", "COSINE"):
+        return -(queries @ vectors.T)
+    # Squared L2, as Milvus reports it
+    return (queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)
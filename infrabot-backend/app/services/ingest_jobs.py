@@ -0,0 +1,245 @@
+"""
+Background ingestion jobs.
+
+Ingestion is slow and blocking (parsing, embedding, Milvus inserts), so the API
+runs it on a dedicated worker thread and exposes its progress by job ID
+instead of holding the request (and the event loop) until it finishes.
+
+With several uvicorn workers a job runs in whichever worker received the
+request; its status is mirrored to the shared state directory so any worker
+can report on it or cancel it.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from enum import Enum
+from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from app.services.ingest_service import (
+    IngestAlreadyRunning,
+    IngestCancelled,
+    IngestStats,
+    ingest_documents,
+)
+from app.services.shared_state import SHARED_STATE_DIR, read_json, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Number of finished jobs kept for status queries
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "20"))
+# How often a running job mirrors its status and checks for cancellation from other workers
+INGEST_JOB_REPORT_SECONDS = float(os.getenv("INGEST_JOB_REPORT_SECONDS", "1"))
+INGEST_JOBS_DIR = SHARED_STATE_DIR / "ingest_jobs"
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class IngestJob:
+    """State of one ingestion run."""
+    job_id: str
+    force: bool = False
+    status: JobStatus = JobStatus.PENDING
+    stats: IngestStats = field(default_factory=IngestStats)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+    def to_dict(self) -> Dict:
+        stats = self.stats
+        eta = None if self.finished else stats.eta_seconds()
+        return {
+            "job_id": self.job_id,
+            "status": self.status.value,
+            "force": self.force,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "progress": 1.0 if self.status == JobStatus.SUCCEEDED else round(stats.progress(), 4),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "files_total": stats.files_total,
+            "files_parsed": stats.files_parsed,
+            "files_failed": stats.files_failed,
+            "chunks_parsed": stats.chunks_parsed,
+            "chunks_embedded": stats.chunks_embedded,
+            "chunks_inserted": stats.chunks_inserted,
+            "chunks_skipped": stats.chunks_skipped,
+            "elapsed_seconds": round(stats.elapsed, 1),
+            "updated_at": time.time(),
+        }
+
+
+class IngestJobManager:
+    """Run ingestion jobs one at a time on a background thread."""
+
+    def __init__(
+        self,
+        run_fn: Callable = ingest_documents,
+        history: int = INGEST_JOB_HISTORY,
+        state_dir: Optional[Path] = None,
+    ):
+        self.run_fn = run_fn
+        self.history = history
+        # Where job status is mirrored for other workers; None keeps it in-process
+        self.state_dir = state_dir
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._active: Optional[IngestJob] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+
+    @property
+    def active(self) -> Optional[IngestJob]:
+        with self._lock:
+            return self._active
+
+    def start(self, force: bool = False, on_success: Optional[Callable[[], None]] = None) -> IngestJob:
+        """Queue a new ingestion run; raises ``IngestAlreadyRunning`` if one is in progress."""
+        with self._lock:
+            if self._active is not None:
+                raise IngestAlreadyRunning(f"Ingestion job {self._active.job_id} is already running")
+            running_elsewhere = self._shared_active()
+            if running_elsewhere is not None:
+                raise IngestAlreadyRunning(f"Ingestion job {running_elsewhere} is already running")
+            job = IngestJob(job_id=uuid.uuid4().hex, force=force)
+            self._active = job
+            self._jobs[job.job_id] = job
+            self._trim()
+        self._executor.submit(self._run, job, on_success)
+        logger.info(f"Queued ingestion job {job.job_id} (force={force})")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        """A job started by this process."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Status of a job started by any worker."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.state_dir is None or not job_id.isalnum():
+            return None
+        return read_json(self._job_path(job_id))
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Request cancellation; the run stops at its next file or batch boundary."""
+        job = self.get(job_id)
+        if job is not None:
+            if not job.finished:
+                job.stats.cancel_event.set()
+                logger.info(f"Cancellation requested for ingestion job {job_id}")
+            return job.to_dict()
+
+        status = self.status(job_id)
+        if status is not None and status["status"] in (JobStatus.PENDING.value, JobStatus.RUNNING.value):
+            # Picked up by the worker running the job on its next report
+            self._cancel_marker(job_id).touch()
+            logger.info(f"Cancellation requested for ingestion job {job_id} running in another worker")
+        return status
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.state_dir / f"{job_id}.json"
+
+    def _cancel_marker(self, job_id: str) -> Path:
+        return self.state_dir / f"{job_id}.cancel"
+
+    def _shared_active(self) -> Optional[str]:
+        """ID of a job another worker is still reporting progress for."""
+        if self.state_dir is None or not self.state_dir.exists():
+            return None
+        stale_after = max(10.0, 5 * INGEST_JOB_REPORT_SECONDS)
+        for path in self.state_dir.glob("*.json"):
+            status = read_json(path)
+            if (
+                status
+                and status.get("status") in (JobStatus.PENDING.value, JobStatus.RUNNING.value)
+                and time.time() - status.get("updated_at", 0) < stale_after
+            ):
+                return status["job_id"]
+        return None
+
+    def _report(self, job: IngestJob):
+        if self.state_dir is None:
+            return
+        try:
+            write_json_atomic(self._job_path(job.job_id), job.to_dict())
+            if not job.finished and self._cancel_marker(job.job_id).exists():
+                job.stats.cancel_event.set()
+        except OSError as e:
+            logger.warning(f"Failed to share status of ingestion job {job.job_id}: {e}")
+
+    def _report_until_finished(self, job: IngestJob, finished: threading.Event):
+        while not finished.wait(INGEST_JOB_REPORT_SECONDS):
+            self._report(job)
+
+    def _trim_shared(self):
+        if self.state_dir is None or not self.state_dir.exists():
+            return
+        paths = sorted(self.state_dir.glob("*.json"), key=lambda path: path.stat().st_mtime)
+        for path in paths[: max(0, len(paths) - self.history)]:
+            path.unlink(missing_ok=True)
+            self._cancel_marker(path.stem).unlink(missing_ok=True)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestJob, on_success: Optional[Callable[[], None]]):
+        job.status = JobStatus.RUNNING
+        finished = threading.Event()
+        reporter = threading.Thread(
+            target=self._report_until_finished, args=(job, finished), name="ingest-report", daemon=True
+        )
+        self._report(job)
+        reporter.start()
+        try:
+            job.stats.check_cancelled()
+            if not self.run_fn(force=job.force, stats=job.stats):
+                raise RuntimeError("Document ingestion failed")
+            if on_success is not None:
+                on_success()
+            job.status = JobStatus.SUCCEEDED
+            logger.info(f"Ingestion job {job.job_id} succeeded: {job.stats.summary()}")
+        except IngestCancelled:
+            job.status = JobStatus.CANCELLED
+            logger.info(f"Ingestion job {job.job_id} cancelled")
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            logger.error(f"Ingestion job {job.job_id} failed: {e}", exc_info=True)
+        finally:
+            job.finished_at = time.time()
+            finished.set()
+            reporter.join()
+            self._report(job)
+            self._trim_shared()
+            with self._lock:
+                self._active = None
+
+    def shutdown(self):
+        """Cancel the running job and wait for the worker thread to stop."""
+        active = self.active
+        if active is not None:
+            active.stats.cancel_event.set()
+        self._executor.shutdown(wait=True)
+
+
+ingest_jobs = IngestJobManager(state_dir=INGEST_JOBS_DIR)
@@ -0,0 +1,214 @@
+"""
+Manifest of ingested knowledge base files, used for incremental ingestion.
+"""
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+INGEST_MANIFEST_PATH = Path(os.getenv("INGEST_MANIFEST_PATH", "./.cache/ingest_manifest.json"))
+INGEST_CHECKPOINT_PATH = Path(os.getenv("INGEST_CHECKPOINT_PATH", "./.cache/ingest_checkpoint.jsonl"))
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    """Hash a file's content without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids_for(file_name: str, content_hash: str, count: int) -> List[str]:
+    """Deterministic primary keys for the chunks of a file with the given name and content.
+
+    The name is part of the key, so two files with the same content, or a
+    renamed file and its old record, never share chunks.
+    """
+    key = hashlib.sha256(f"{file_name}\0{content_hash}".encode("utf-8")).hexdigest()[:32]
+    return [f"{key}-{index:05d}" for index in range(count)]
+
+
+@dataclass
+class FileRecord:
+    """What was ingested for a single knowledge base file."""
+    name: str
+    size: int
+    mtime: float
+    sha256: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ManifestDiff:
+    """Files that need work compared to the last ingest."""
+    new: List[Path] = field(default_factory=list)
+    changed: List[Path] = field(default_factory=list)
+    removed: List[FileRecord] = field(default_factory=list)
+    unchanged: List[Path] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.new or self.changed or self.removed)
+
+
+class IngestManifest:
+    """JSON manifest mapping file names to their ingested chunk IDs."""
+
+    def __init__(self, path: Path = INGEST_MANIFEST_PATH, collection_name: Optional[str] = None):
+        self.path = path
+        self.collection_name = collection_name
+        self.files: Dict[str, FileRecord] = {}
+        # Content hashes computed during diff(), reused when recording files
+        self._hashes: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: Path = INGEST_MANIFEST_PATH) -> "IngestManifest":
+        manifest = cls(path)
+        if not path.exists():
+            return manifest
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") != MANIFEST_VERSION:
+                logger.warning(f"Ignoring ingest manifest with unsupported version at {path}")
+                return manifest
+            manifest.collection_name = data.get("collection_name")
+            manifest.files = {
+                name: FileRecord(**record) for name, record in data.get("files", {}).items()
+            }
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Failed to read ingest manifest at {path}, treating as empty: {e}")
+            manifest.files = {}
+        return manifest
+
+    def save(self):
+        """Atomically write the manifest to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": MANIFEST_VERSION,
+            "collection_name": self.collection_name,
+            "files": {name: asdict(record) for name, record in sorted(self.files.items())},
+        }
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def content_hash(self, file_path: Path) -> str:
+        cached = self._hashes.get(file_path.name)
+        if cached is None:
+            cached = file_sha256(file_path)
+            self._hashes[file_path.name] = cached
+        return cached
+
+    def diff(self, file_paths: List[Path]) -> ManifestDiff:
+        """Compare the files on disk against the manifest.
+
+        Size and mtime are checked first; the content hash is only computed
+        when they differ, so touching a file without changing it is cheap.
+        """
+        result = ManifestDiff()
+        seen = set()
+        for file_path in sorted(file_paths):
+            seen.add(file_path.name)
+            record = self.files.get(file_path.name)
+            if record is None:
+                result.new.append(file_path)
+                continue
+
+            stat = file_path.stat()
+            if stat.st_size == record.size and stat.st_mtime == record.mtime:
+                result.unchanged.append(file_path)
+            elif self.content_hash(file_path) == record.sha256:
+                record.size, record.mtime = stat.st_size, stat.st_mtime
+                result.unchanged.append(file_path)
+            else:
+                result.changed.append(file_path)
+
+        result.removed = [record for name, record in self.files.items() if name not in seen]
+        return result
+
+    def record(self, file_path: Path, chunk_ids: List[str]) -> FileRecord:
+        stat = file_path.stat()
+        record = FileRecord(
+            name=file_path.name,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            sha256=self.content_hash(file_path),
+            chunk_ids=chunk_ids,
+        )
+        self.files[file_path.name] = record
+        return record
+
+    def forget(self, name: str):
+        self.files.pop(name, None)
+
+
+class IngestCheckpoint:
+    """Append-only log of chunk IDs inserted by an ingest run that has not finished.
+
+    The first line records the run's mode and collection; each following line
+    holds the IDs of one inserted batch. An interrupted run leaves the file
+    behind so the next run can skip what was already inserted.
+    """
+
+    def __init__(self, path: Path = INGEST_CHECKPOINT_PATH):
+        self.path = path
+        self.mode: Optional[str] = None
+        self.collection_name: Optional[str] = None
+        self.inserted: Set[str] = set()
+
+    @classmethod
+    def load(cls, path: Path = INGEST_CHECKPOINT_PATH) -> "IngestCheckpoint":
+        checkpoint = cls(path)
+        if not path.exists():
+            return checkpoint
+        try:
+            with open(path, encoding="utf-8") as handle:
+                header = json.loads(handle.readline() or "{}")
+                checkpoint.mode = header.get("mode")
+                checkpoint.collection_name = header.get("collection_name")
+                for line in handle:
+                    try:
+                        checkpoint.inserted.update(json.loads(line))
+                    except ValueError:
+                        # A torn final line from an interrupted write
+                        break
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ingest checkpoint at {path}: {e}")
+            return cls(path)
+        return checkpoint
+
+    def in_progress(self, mode: str, collection_name: str) -> bool:
+        return self.mode == mode and self.collection_name == collection_name
+
+    def begin(self, mode: str, collection_name: str):
+        """Start a new run, discarding any previous checkpoint."""
+        self.mode, self.collection_name = mode, collection_name
+        self.inserted = set()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps({"mode": mode, "collection_name": collection_name}) + "\n")
+
+    def mark_inserted(self, chunk_ids: Iterable[str]):
+        chunk_ids = list(chunk_ids)
+        self.inserted.update(chunk_ids)
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(chunk_ids) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def complete(self):
+        """The run finished; nothing needs resuming."""
+        self.mode = self.collection_name = None
+        self.inserted = set()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -1,14 +1,52 @@
 """
 Ingest service for loading documents into Milvus vector database.
+
+With ``VECTOR_STORE_BACKEND=local`` the embedded on-disk store from
+``local_vector_store`` is used instead and no Milvus is needed.
 """
 import os
+import time
+import random
+import hashlib
 import logging
+import threading
+import itertools
 from pathlib import Path
+from contextlib import contextmanager
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from langchain_openai import AzureOpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import UnstructuredPDFLoader
-from langchain_milvus.vectorstores import Milvus
+from pymilvus import MilvusClient
 from dotenv import load_dotenv
+from app.services.cache_service import CachedEmbeddings, get_embedding_cache, EMBEDDING_CACHE_ENABLED
+from app.services.async_retriever import AsyncVectorStoreRetriever
+from app.services.hybrid_retriever import HYBRID_RETRIEVAL_ENABLED, HybridRetriever
+from app.services.lexical_index import BM25Index
+from app.services.local_vector_store import LocalVectorStore, get_local_client
+from app.services.index_config import (
+    MILVUS_RESCORE_FACTOR,
+    IndexConfig,
+    collection_dimension,
+    collection_index,
+    collection_search_params,
+    search_params_for,
+)
+from app.services.reranker import (
+    RERANK_ENABLED,
+    RERANK_FETCH_K,
+    RERANK_TOP_N,
+    Reranker,
+    RerankingRetriever,
+    get_scorer,
+)
+from app.services.circuit_breaker import embedding_breaker, milvus_breaker
+from app.services.connection_manager import milvus_manager, PooledMilvus
+from app.services.ingest_manifest import IngestManifest, IngestCheckpoint, chunk_ids_for
+from app.services.parse_pool import parse_files
+from app.services.collection_versions import CollectionVersions
+from app.services.shared_state import publish_kb_version
 
 # Load environment variables
 load_dotenv()
@@ -23,19 +61,98 @@ AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
 AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
 AZURE_OPENAI_EMBEDDING_MODEL_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL_NAME", "text-embedding-3-large")
+# Shortened (Matryoshka) embeddings, e.g. 256, 512 or 1024; empty keeps the model's full size.
+# Changing it needs a rebuild (manage.py ingest --force); until then queries follow the served collection
+AZURE_OPENAI_EMBEDDING_DIMENSIONS = int(os.getenv("AZURE_OPENAI_EMBEDDING_DIMENSIONS", "0")) or None
+# Full output size of the embedding models
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
 
 # Milvus configuration
 MILVUS_HOST = os.getenv("MILVUS_HOST", "milvus-standalone")
 MILVUS_PORT = int(os.getenv("MILVUS_PORT", "19530"))
 MILVUS_COLLECTION_NAME = os.getenv("MILVUS_COLLECTION_NAME", "infrabot_knowledgebase")
 
+# Vector store backend: "milvus", or "local" for the embedded on-disk store (single node, tests)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "milvus").lower()
+if VECTOR_STORE_BACKEND not in ("milvus", "local"):
+    raise ValueError(f"Unsupported VECTOR_STORE_BACKEND '{VECTOR_STORE_BACKEND}' (use 'milvus' or 'local')")
+
 # Knowledge base path
 KNOWLEDGEBASE_PATH = Path(os.getenv("KNOWLEDGEBASE_PATH", "./knowledgebase/"))
 
+# Lock file that serialises ingest runs across processes (API workers, CLI)
+INGEST_LOCK_PATH = Path(os.getenv("INGEST_LOCK_PATH", "./.cache/ingest.lock"))
+
+# Embedding pipeline configuration (0 disables the client-side TPM/RPM budget)
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+INGEST_EMBED_TPM = int(os.getenv("INGEST_EMBED_TPM", "0"))
+INGEST_EMBED_RPM = int(os.getenv("INGEST_EMBED_RPM", "0"))
+INGEST_EMBED_MAX_RETRIES = int(os.getenv("INGEST_EMBED_MAX_RETRIES", "6"))
+# Upper bound on chunks parsed but not yet inserted, which bounds ingest memory
+INGEST_MAX_INFLIGHT_CHUNKS = int(os.getenv("INGEST_MAX_INFLIGHT_CHUNKS", "1024"))
+INGEST_PROGRESS_INTERVAL_SECONDS = float(os.getenv("INGEST_PROGRESS_INTERVAL_SECONDS", "10"))
+# How often an incremental ingest saves the manifest and lexical index together
+INGEST_SAVE_INTERVAL_SECONDS = float(os.getenv("INGEST_SAVE_INTERVAL_SECONDS", "60"))
+
+
+def milvus_connection_args():
+    """Connection arguments shared by every Milvus vector store."""
+    return {
+        "host": MILVUS_HOST,
+        "port": MILVUS_PORT
+    }
+
+
+def get_milvus_client() -> MilvusClient:
+    """A channel from the shared Milvus connection pool, or the embedded store's client."""
+    if VECTOR_STORE_BACKEND == "local":
+        return get_local_client()
+    return milvus_manager.client()
+
 
-def init_embeddings():
-    """Initialize Azure OpenAI embeddings."""
+def open_vectorstore(embeddings, collection_name: str, index_config: IndexConfig = None, search_params=None):
+    """Vector store on ``collection_name`` for the configured backend.
+
+    ``index_config`` only matters for collections that do not exist yet; the
+    local backend always searches exactly and only takes its metric.
+    """
+    if VECTOR_STORE_BACKEND == "local":
+        metric_type = index_config.metric_type if index_config else "L2"
+        return LocalVectorStore(embeddings, collection_name, client=get_local_client(), metric_type=metric_type)
+    return PooledMilvus(
+        embedding_function=embeddings,
+        connection_args=milvus_connection_args(),
+        collection_name=collection_name,
+        index_params=index_config.index_params() if index_config else None,
+        search_params=index_config.search_params() if index_config else search_params,
+    )
+
+
+def get_collection_versions() -> CollectionVersions:
+    return CollectionVersions(get_milvus_client(), MILVUS_COLLECTION_NAME)
+
+
+def resolve_active_collection() -> str:
+    """Physical collection behind the ``MILVUS_COLLECTION_NAME`` alias."""
+    return get_collection_versions().active() or MILVUS_COLLECTION_NAME
+
+
+def embedding_dimensions() -> Optional[int]:
+    """Dimension of the embeddings ingestion produces, if known."""
+    return AZURE_OPENAI_EMBEDDING_DIMENSIONS or EMBEDDING_MODEL_DIMENSIONS.get(AZURE_OPENAI_EMBEDDING_MODEL_NAME)
+
+
+def init_embeddings(dimensions: Optional[int] = None):
+    """Initialize Azure OpenAI embeddings, shortened to ``dimensions`` (default from the environment)."""
     logger.info("Initializing Azure OpenAI embeddings...")
+    dimensions = dimensions or AZURE_OPENAI_EMBEDDING_DIMENSIONS
+    if dimensions == EMBEDDING_MODEL_DIMENSIONS.get(AZURE_OPENAI_EMBEDDING_MODEL_NAME):
+        dimensions = None
     
     if not AZURE_OPENAI_API_KEY:
         raise EnvironmentError(
@@ -56,142 +173,757 @@ def init_embeddings():
             api_key=AZURE_OPENAI_API_KEY,
             azure_endpoint=AZURE_OPENAI_ENDPOINT,
             api_version=AZURE_OPENAI_API_VERSION,
+            dimensions=dimensions,
+        )
+        logger.info(
+            f"Azure OpenAI embeddings initialized successfully with deployment '{AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME}'"
+            + (f" ({dimensions} dimensions)" if dimensions else "")
         )
-        logger.info(f"Azure OpenAI embeddings initialized successfully with deployment '{AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME}'")
+        if EMBEDDING_CACHE_ENABLED:
+            namespace = f"{AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME}:{AZURE_OPENAI_EMBEDDING_MODEL_NAME}"
+            if dimensions:
+                namespace += f":{dimensions}"
+            embeddings = CachedEmbeddings(embeddings, namespace, get_embedding_cache())
+            logger.info(f"Embedding cache enabled for namespace '{namespace}'")
         return embeddings
     except Exception as e:
         logger.error(f"Failed to initialize Azure OpenAI embeddings: {e}")
         raise
 
 
-def get_split_documents(index_path: Path):
-    """Load and split documents from the knowledge base."""
-    logger.info(f"Loading documents from {index_path}")
-    
+def list_pdf_files(index_path: Path):
+    """Return the PDF files in the knowledge base, sorted by name."""
     if not index_path.exists():
         raise FileNotFoundError(f"Knowledge base path '{index_path}' not found.")
-    
-    split_docs = []
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    
-    pdf_files = [f for f in os.listdir(index_path) if f.lower().endswith(".pdf")]
+    return sorted(
+        index_path / f for f in os.listdir(index_path)
+        if f.lower().endswith(".pdf") and (index_path / f).is_file()
+    )
+
+
+def iter_split_documents(index_path: Path):
+    """Yield document chunks from the knowledge base one file at a time."""
+    logger.info(f"Loading documents from {index_path}")
+    pdf_files = list_pdf_files(index_path)
     logger.info(f"Found {len(pdf_files)} PDF files to process")
-    
-    for file_name in pdf_files:
-        file_path = index_path / file_name
-        if file_path.is_file():
+
+    for result in parse_files(pdf_files):
+        if not result.ok:
+            logger.error(f"Failed to load file {result.file_path.name}: {result.error}")
+            continue
+        logger.info(
+            f"Successfully processed {result.file_path.name}: "
+            f"{len(result.documents)} chunks created in {result.elapsed:.1f}s"
+        )
+        yield from result.documents
+
+
+def get_split_documents(index_path: Path):
+    """Load and split documents from the knowledge base."""
+    split_docs = list(iter_split_documents(index_path))
+    logger.info(f"Total document chunks created: {len(split_docs)}")
+    return split_docs
+
+
+class IngestCancelled(Exception):
+    """Raised inside an ingest run once cancellation has been requested."""
+
+
+class IngestAlreadyRunning(Exception):
+    """Raised when another ingest run holds the ingest lock."""
+
+
+@dataclass
+class IngestStats:
+    """Counters for a running ingest, safe to update from worker threads.
+
+    Also carries the run's cancellation flag, which the pipeline checks
+    between files and batches.
+    """
+    files_total: int = 0
+    files_parsed: int = 0
+    files_failed: int = 0
+    pages_parsed: int = 0
+    chunks_parsed: int = 0
+    chunks_skipped: int = 0
+    chunks_embedded: int = 0
+    chunks_inserted: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _last_logged: float = field(default=0.0, repr=False)
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def rates(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return {
+            "pages_per_second": self.pages_parsed / elapsed,
+            "chunks_per_second": self.chunks_inserted / elapsed,
+        }
+
+    def summary(self) -> str:
+        rates = self.rates()
+        return (
+            f"{self.files_parsed}/{self.files_total} files ({self.files_failed} failed), "
+            f"{self.pages_parsed} pages, {self.chunks_parsed} chunks parsed, "
+            f"{self.chunks_inserted} inserted, {self.chunks_skipped} skipped in {self.elapsed:.1f}s "
+            f"({rates['pages_per_second']:.2f} pages/s, {rates['chunks_per_second']:.2f} chunks/s)"
+        )
+
+    def progress(self) -> float:
+        """Estimated fraction of the run completed, in [0, 1]."""
+        if not self.files_total:
+            return 0.0
+        parsed_fraction = self.files_parsed / self.files_total
+        done_chunks = self.chunks_inserted + self.chunks_skipped
+        insert_fraction = done_chunks / self.chunks_parsed if self.chunks_parsed else 0.0
+        return min(1.0, parsed_fraction * insert_fraction)
+
+    def eta_seconds(self) -> Optional[float]:
+        progress = self.progress()
+        if progress <= 0.0:
+            return None
+        return self.elapsed * (1.0 - progress) / progress
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise IngestCancelled("Ingestion cancelled")
+
+    def maybe_log(self, interval: float = INGEST_PROGRESS_INTERVAL_SECONDS):
+        now = time.monotonic()
+        if now - self._last_logged >= interval:
+            self._last_logged = now
+            logger.info(f"Ingest progress: {self.summary()}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for rate budgeting."""
+    return len(text) // 4 + 1
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after_seconds(error: Exception):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value:
             try:
-                logger.info(f"Processing file: {file_name}")
-                loader = UnstructuredPDFLoader(str(file_path))
-                documents = loader.load()
-                
-                if documents:
-                    splits = text_splitter.split_documents(documents)
-                    split_docs.extend(splits)
-                    logger.info(f"Successfully processed {file_name}: {len(splits)} chunks created")
+                seconds = float(value)
+                return seconds / 1000 if header.endswith("-ms") else seconds
+            except ValueError:
+                pass
+    return None
+
+
+class EmbeddingRateLimiter:
+    """Client-side budget for embedding requests with adaptive concurrency.
+
+    Requests are admitted while they fit a sliding one-minute window of tokens
+    and requests. A 429 from Azure halves the concurrency limit and pauses all
+    workers until the server's retry-after has elapsed; sustained success grows
+    the limit back one step at a time.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int = INGEST_EMBED_TPM,
+        requests_per_minute: int = INGEST_EMBED_RPM,
+        max_concurrency: int = INGEST_EMBED_CONCURRENCY,
+    ):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency_limit = self.max_concurrency
+
+        self._window = deque()  # (timestamp, tokens)
+        self._window_tokens = 0
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _expire(self, now: float):
+        while self._window and now - self._window[0][0] >= 60:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def acquire(self, tokens: int):
+        """Block until a request of ``tokens`` fits the budget."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                wait_for = None
+                if now < self._paused_until:
+                    wait_for = self._paused_until - now
+                elif self._in_flight >= self.concurrency_limit:
+                    wait_for = None
+                elif self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+                    wait_for = self._window[0][0] + 60 - now
+                elif (
+                    self.tokens_per_minute
+                    and self._window
+                    and self._window_tokens + tokens > self.tokens_per_minute
+                ):
+                    wait_for = self._window[0][0] + 60 - now
                 else:
-                    logger.warning(f"No content extracted from {file_name}")
-                    
-            except Exception as e:
-                logger.error(f"Failed to load file {file_name}: {e}")
+                    self._window.append((now, tokens))
+                    self._window_tokens += tokens
+                    self._in_flight += 1
+                    return
+                self._cond.wait(timeout=wait_for)
+
+    def release(self, rate_limited: bool = False, retry_after: float = 0.0, failed: bool = False):
+        with self._cond:
+            self._in_flight -= 1
+            if failed:
+                self._successes = 0
+            elif rate_limited:
+                self._successes = 0
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                logger.warning(
+                    f"Embedding rate limited; concurrency reduced to {self.concurrency_limit}, "
+                    f"pausing {retry_after:.1f}s"
+                )
+            else:
+                self._successes += 1
+                if self.concurrency_limit < self.max_concurrency and self._successes >= self.concurrency_limit * 4:
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+def _embed_batch(embeddings, texts, limiter: EmbeddingRateLimiter):
+    """Embed one batch, retrying rate-limit and transient errors with backoff."""
+    # Only text missing from the embedding cache costs API quota
+    uncached = embeddings.uncached(texts) if isinstance(embeddings, CachedEmbeddings) else texts
+    tokens = sum(estimate_tokens(text) for text in uncached)
+    if not uncached:
+        return embeddings.embed_documents(texts)
+
+    for attempt in range(INGEST_EMBED_MAX_RETRIES + 1):
+        limiter.acquire(tokens)
+        try:
+            vectors = embeddings.embed_documents(texts)
+        except Exception as e:
+            backoff = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+            if _is_rate_limited(e):
+                limiter.release(rate_limited=True, retry_after=_retry_after_seconds(e) or backoff)
+            else:
+                limiter.release(failed=True)
+            if attempt == INGEST_EMBED_MAX_RETRIES:
+                raise
+            logger.warning(f"Embedding batch failed (attempt {attempt + 1}): {e}")
+            if not _is_rate_limited(e):
+                time.sleep(backoff)
+            continue
+        limiter.release()
+        return vectors
+
+
+def _batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def embed_and_insert(
+    embeddings,
+    vectorstore,
+    chunks,
+    checkpoint: IngestCheckpoint = None,
+    batch_size: int = INGEST_EMBED_BATCH_SIZE,
+    limiter: EmbeddingRateLimiter = None,
+    stats: IngestStats = None,
+    max_inflight_chunks: int = INGEST_MAX_INFLIGHT_CHUNKS,
+    lexical_index: BM25Index = None,
+) -> int:
+    """Embed a stream of ``(document, chunk_id)`` pairs in concurrent batches.
+
+    Each batch is inserted as soon as its embeddings arrive. The input is
+    consumed lazily and at most ``max_inflight_chunks`` chunks are held between
+    reading and insertion, so memory stays flat regardless of corpus size.
+    Chunks whose IDs are already in ``checkpoint`` are skipped, and every
+    inserted batch is recorded there so an interrupted run can resume.
+    Every chunk, skipped or not, is also added to ``lexical_index`` if given.
+    Returns the number of chunks inserted.
+    """
+    limiter = limiter or EmbeddingRateLimiter()
+    stats = stats or IngestStats()
+    insert_lock = threading.Lock()
+    inserted = 0
+    batches = 0
+
+    def pending_chunks():
+        for document, chunk_id in chunks:
+            if lexical_index is not None:
+                lexical_index.add(chunk_id, document.page_content, document.metadata)
+            if checkpoint is not None and chunk_id in checkpoint.inserted:
+                stats.add(chunks_skipped=1)
                 continue
-    
-    logger.info(f"Total document chunks created: {len(split_docs)}")
-    return split_docs
+            yield document, chunk_id
 
+    def process(batch):
+        texts = [document.page_content for document, _ in batch]
+        vectors = _embed_batch(embeddings, texts, limiter)
+        stats.add(chunks_embedded=len(batch))
+        # Inserts are serialised: the first one creates the collection
+        with insert_lock:
+            vectorstore.add_embeddings(
+                texts,
+                vectors,
+                metadatas=[document.metadata for document, _ in batch],
+                ids=[chunk_id for _, chunk_id in batch],
+            )
+            if checkpoint is not None:
+                checkpoint.mark_inserted(chunk_id for _, chunk_id in batch)
+        stats.add(chunks_inserted=len(batch))
+        return len(batch)
 
-def create_milvus_vectorstore(embeddings, documents):
-    """Create or update Milvus vector store with documents."""
-    logger.info(f"Creating Milvus vector store with {len(documents)} documents")
-    
-    connection_args = {
-        "host": MILVUS_HOST,
-        "port": MILVUS_PORT
-    }
-    
+    with ThreadPoolExecutor(max_workers=limiter.max_concurrency) as pool:
+        futures = set()
+        inflight_chunks = 0
+
+        def collect(block: bool):
+            nonlocal futures, inflight_chunks, inserted
+            done, futures = wait(futures, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                count = future.result()
+                inflight_chunks -= count
+                inserted += count
+            stats.maybe_log()
+
+        try:
+            for batch in _batched(pending_chunks(), batch_size):
+                stats.check_cancelled()
+                # Backpressure: stop reading input until in-flight batches drain
+                while futures and inflight_chunks + len(batch) > max(max_inflight_chunks, batch_size):
+                    collect(block=True)
+                futures.add(pool.submit(process, batch))
+                inflight_chunks += len(batch)
+                batches += 1
+                collect(block=False)
+            while futures:
+                collect(block=True)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    logger.info(f"Embedded and inserted {inserted} chunks in {batches} batches")
+    return inserted
+
+
+def _iter_file_chunks(file_paths, manifest: IngestManifest, stats: IngestStats):
+    """Parse files and yield ``(document, chunk_id)`` pairs, recording each file in the manifest."""
+    for result in parse_files(file_paths):
+        stats.check_cancelled()
+        stats.add(files_parsed=1)
+        if not result.ok:
+            stats.add(files_failed=1)
+            logger.error(f"Failed to load file {result.file_path.name}: {result.error}")
+            continue
+        chunk_ids = _chunk_ids(result, manifest)
+        manifest.record(result.file_path, chunk_ids)
+        stats.add(pages_parsed=result.pages, chunks_parsed=len(result.documents))
+        logger.info(
+            f"Successfully processed {result.file_path.name}: {result.pages} pages, "
+            f"{len(result.documents)} chunks created in {result.elapsed:.1f}s"
+        )
+        yield from zip(result.documents, chunk_ids)
+
+
+def fill_new_collection(
+    embeddings, chunks, collection_name: str, checkpoint: IngestCheckpoint = None, stats: IngestStats = None,
+    lexical_index: BM25Index = None, index_config: IndexConfig = None,
+):
+    """Stream ``(document, chunk_id)`` pairs into a new (or resumed) collection version.
+
+    The vector index is built as described by ``index_config`` (the
+    ``MILVUS_INDEX_*`` settings by default). Returns the vector store; the
+    collection is not searchable through the alias until it is promoted.
+    """
+    index_config = index_config or IndexConfig()
     try:
-        vectorstore = Milvus.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            connection_args=connection_args,
-            collection_name=MILVUS_COLLECTION_NAME,
-            drop_old=True  # Drop existing collection and create new one
+        if VECTOR_STORE_BACKEND == "local":
+            logger.info(f"Building local collection '{collection_name}' ({index_config.metric_type}, exact search)")
+        else:
+            logger.info(f"Building '{collection_name}' with index {index_config.describe()}")
+        vectorstore = open_vectorstore(embeddings, collection_name, index_config=index_config)
+        if checkpoint is not None and not checkpoint.in_progress("rebuild", collection_name):
+            checkpoint.begin("rebuild", collection_name)
+        embed_and_insert(
+            embeddings, vectorstore, chunks, checkpoint=checkpoint, stats=stats, lexical_index=lexical_index
         )
-        logger.info(f"Successfully created Milvus vector store with collection '{MILVUS_COLLECTION_NAME}'")
+        logger.info(f"Successfully filled collection '{collection_name}'")
         return vectorstore
     except Exception as e:
         logger.error(f"Failed to create Milvus vector store: {e}")
         raise
 
 
+def create_milvus_vectorstore(
+    embeddings, documents, ids=None, checkpoint: IngestCheckpoint = None, index_config: IndexConfig = None
+):
+    """Build a new collection version from documents and promote it."""
+    logger.info(f"Creating Milvus vector store with {len(documents)} documents")
+    if ids is None:
+        # Content-derived IDs keep an interrupted rebuild resumable
+        ids = [
+            f"{hashlib.sha256(document.page_content.encode('utf-8')).hexdigest()[:32]}-{index:05d}"
+            for index, document in enumerate(documents)
+        ]
+    versions = get_collection_versions()
+    collection_name = versions.new_version_name()
+    lexical_index = BM25Index(collection_name)
+    vectorstore = fill_new_collection(
+        embeddings, zip(documents, ids), collection_name, checkpoint=checkpoint, lexical_index=lexical_index,
+        index_config=index_config,
+    )
+    lexical_index.save()
+    versions.promote(collection_name, expected_count=len(set(ids)))
+    return vectorstore
+
+
+def _dimension_changed(collection_name: str) -> bool:
+    """Whether a collection's vectors differ in size from what the embeddings now produce."""
+    expected = embedding_dimensions()
+    dimension = collection_dimension(get_milvus_client(), collection_name)
+    return bool(expected and dimension and dimension != expected)
+
+
 def get_milvus_retriever(embeddings):
-    """Get a retriever from existing Milvus collection."""
+    """Get a retriever bound to the currently active collection version."""
     logger.info("Creating Milvus retriever")
     
-    connection_args = {
-        "host": MILVUS_HOST,
-        "port": MILVUS_PORT
-    }
-    
     try:
-        vectorstore = Milvus(
-            embedding_function=embeddings,
-            connection_args=connection_args,
-            collection_name=MILVUS_COLLECTION_NAME
+        collection_name = resolve_active_collection()
+        client = get_milvus_client()
+        if _dimension_changed(collection_name):
+            # e.g. AZURE_OPENAI_EMBEDDING_DIMENSIONS changed but the rebuild has not been promoted yet
+            dimension = collection_dimension(client, collection_name)
+            logger.warning(
+                f"'{collection_name}' holds {dimension}-dimensional vectors but embeddings are configured for "
+                f"{embedding_dimensions()}; embedding queries at {dimension} until it is rebuilt"
+            )
+            embeddings = init_embeddings(dimensions=dimension)
+        # Matching the index this version was built with, whatever the current settings
+        index = collection_index(client, collection_name)
+        vectorstore = open_vectorstore(
+            embeddings, collection_name,
+            search_params=search_params_for(index["index_type"], index["metric_type"]) if index else None,
         )
-        retriever = vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
+        # With reranking, more candidates are fetched and only the best RERANK_TOP_N kept
+        k = RERANK_FETCH_K if RERANK_ENABLED else 5
+        # Searches run on the retrieval thread pool so they never block the event loop
+        retriever = AsyncVectorStoreRetriever(
+            vectorstore=vectorstore,
+            embeddings=embeddings,
+            k=k,
+            embedding_breaker=embedding_breaker,
+            search_breaker=milvus_breaker,
+            with_scores=True,
+            # Local collections are searched exactly, so there is nothing to rescore
+            rescore_factor=1 if VECTOR_STORE_BACKEND == "local" else MILVUS_RESCORE_FACTOR,
+            metric_type=index["metric_type"] if index else "L2",
         )
-        logger.info("Successfully created Milvus retriever")
+        if HYBRID_RETRIEVAL_ENABLED:
+            lexical_index = BM25Index.load(collection_name)
+            if lexical_index is not None:
+                retriever = HybridRetriever(dense=retriever, index=lexical_index, k=k)
+                logger.info(f"Hybrid retrieval enabled with a lexical index of {len(lexical_index)} chunks")
+            else:
+                logger.warning(
+                    f"No lexical index for '{collection_name}', using dense retrieval only "
+                    f"(run 'python manage.py lexical-index' to build one)"
+                )
+        if RERANK_ENABLED:
+            # Loads the cross-encoder now, off the request path
+            retriever = RerankingRetriever(base=retriever, reranker=Reranker(get_scorer(), top_n=RERANK_TOP_N))
+        logger.info(f"Successfully created Milvus retriever on '{collection_name}'")
         return retriever
     except Exception as e:
         logger.error(f"Failed to create Milvus retriever: {e}")
         raise
 
 
-def ingest_documents():
-    """Main function to ingest documents into Milvus."""
+def open_milvus_vectorstore(embeddings, collection_name: str):
+    """Open a collection for in-place updates without dropping it."""
+    return open_vectorstore(
+        embeddings, collection_name, search_params=collection_search_params(get_milvus_client(), collection_name)
+    )
+
+
+def _delete_chunks(vectorstore, chunk_ids, batch_size: int = 1000):
+    for start in range(0, len(chunk_ids), batch_size):
+        if not vectorstore.delete(ids=chunk_ids[start:start + batch_size]):
+            raise RuntimeError(f"Failed to delete chunks from '{vectorstore.collection_name}'")
+
+
+def build_lexical_index(collection_name: str, batch_size: int = 1000) -> BM25Index:
+    """Build and save the lexical index of an existing collection from the chunks stored in Milvus."""
+    from pymilvus import DataType
+
+    client = get_milvus_client()
+    vector_types = {DataType.FLOAT_VECTOR, DataType.BINARY_VECTOR, DataType.FLOAT16_VECTOR,
+                    DataType.BFLOAT16_VECTOR, DataType.SPARSE_FLOAT_VECTOR}
+    fields = [
+        field["name"] for field in client.describe_collection(collection_name)["fields"]
+        if field.get("type") not in vector_types
+    ]
+    index = BM25Index(collection_name)
+    iterator = client.query_iterator(collection_name, batch_size=batch_size, output_fields=fields)
+    try:
+        while batch := iterator.next():
+            for row in batch:
+                chunk_id, text = row.pop("pk"), row.pop("text", "")
+                index.add(str(chunk_id), text, row)
+    finally:
+        iterator.close()
+    index.save()
+    return index
+
+
+def load_lexical_index(collection_name: str) -> BM25Index:
+    """The collection's lexical index, backfilled from Milvus if it was never built."""
+    index = BM25Index.load(collection_name)
+    if index is None:
+        logger.info(f"No lexical index for '{collection_name}', building it from the collection")
+        index = build_lexical_index(collection_name)
+    return index
+
+
+def _chunk_ids(result, manifest: IngestManifest):
+    """Deterministic chunk IDs for a parsed file, derived from its name and content hash."""
+    path = result.file_path
+    return chunk_ids_for(path.name, manifest.content_hash(path), len(result.documents))
+
+
+def rebuild_collection(
+    embeddings, manifest: IngestManifest, checkpoint: IngestCheckpoint, stats: IngestStats,
+    index_config: IndexConfig = None,
+) -> bool:
+    """Re-parse every file into a new collection version and promote it.
+
+    The active version keeps serving searches until the new one has been
+    filled and its entity count verified; it is then kept for rollback.
+    """
+    logger.info("Running full ingestion into a new collection version")
+    versions = get_collection_versions()
+    if checkpoint.mode == "rebuild" and checkpoint.collection_name and \
+            get_milvus_client().has_collection(checkpoint.collection_name):
+        collection_name = checkpoint.collection_name
+        logger.info(f"Resuming interrupted rebuild of '{collection_name}'")
+    else:
+        collection_name = versions.new_version_name()
+    manifest.files = {}
+    manifest.collection_name = collection_name
+
+    pdf_files = list_pdf_files(KNOWLEDGEBASE_PATH)
+    stats.files_total = len(pdf_files)
+    logger.info(f"Found {len(pdf_files)} PDF files to process")
+
+    chunks = _iter_file_chunks(pdf_files, manifest, stats)
+    first = next(chunks, None)
+    if first is None:
+        logger.warning("No documents to ingest.")
+        return False
+
+    lexical_index = BM25Index(collection_name)
+    fill_new_collection(
+        embeddings, itertools.chain([first], chunks), collection_name, checkpoint=checkpoint, stats=stats,
+        lexical_index=lexical_index, index_config=index_config,
+    )
+    lexical_index.save()
+    versions.promote(collection_name, expected_count=stats.chunks_parsed)
+    manifest.save()
+    checkpoint.complete()
+    return True
+
+
+def update_collection(
+    embeddings, manifest: IngestManifest, vectorstore, checkpoint: IngestCheckpoint, stats: IngestStats
+) -> bool:
+    """Upsert chunks of new/changed files and delete chunks of removed files."""
+    diff = manifest.diff(list_pdf_files(KNOWLEDGEBASE_PATH))
+    stats.files_total = len(diff.new) + len(diff.changed)
+    logger.info(
+        f"Incremental ingestion: {len(diff.new)} new, {len(diff.changed)} changed, "
+        f"{len(diff.removed)} removed, {len(diff.unchanged)} unchanged files"
+    )
+    lexical_index = load_lexical_index(vectorstore.collection_name)
+    if not diff.has_changes:
+        manifest.save()
+        logger.info("Knowledge base is up to date, nothing to ingest")
+        return True
+
+    if not checkpoint.in_progress("update", vectorstore.collection_name):
+        checkpoint.begin("update", vectorstore.collection_name)
+
+    # The manifest and lexical index are rewritten whole, so they are saved
+    # together at intervals rather than per file. A run interrupted between
+    # saves redoes those files from the older manifest; the checkpoint skips
+    # their chunks that were already inserted.
+    last_save = time.monotonic()
+
+    def save(force: bool = False):
+        nonlocal last_save
+        if force or time.monotonic() - last_save >= INGEST_SAVE_INTERVAL_SECONDS:
+            lexical_index.save()
+            manifest.save()
+            last_save = time.monotonic()
+
+    limiter = EmbeddingRateLimiter()
+    for result in parse_files(diff.new + diff.changed):
+        stats.check_cancelled()
+        file_path, splits = result.file_path, result.documents
+        stats.add(files_parsed=1)
+        if not result.ok:
+            stats.add(files_failed=1)
+            logger.error(f"Failed to load file {file_path.name}: {result.error}")
+            continue
+        chunk_ids = _chunk_ids(result, manifest)
+        stats.add(pages_parsed=result.pages, chunks_parsed=len(splits))
+
+        previous = manifest.files.get(file_path.name)
+        # Insert the new chunks before deleting the old ones so the file never
+        # disappears from search results while it is being replaced.
+        if splits:
+            embed_and_insert(
+                embeddings, vectorstore, zip(splits, chunk_ids),
+                checkpoint=checkpoint, limiter=limiter, stats=stats, lexical_index=lexical_index,
+            )
+        if previous:
+            _delete_chunks(vectorstore, previous.chunk_ids)
+            lexical_index.remove(previous.chunk_ids)
+        manifest.record(file_path, chunk_ids)
+        save()
+        logger.info(f"Successfully processed {file_path.name}: {len(splits)} chunks upserted")
+
+    for record in diff.removed:
+        logger.info(f"Removing {len(record.chunk_ids)} chunks of deleted file {record.name}")
+        _delete_chunks(vectorstore, record.chunk_ids)
+        lexical_index.remove(record.chunk_ids)
+        manifest.forget(record.name)
+        save()
+
+    save(force=True)
+    checkpoint.complete()
+    return True
+
+
+@contextmanager
+def ingest_lock(path: Path = INGEST_LOCK_PATH):
+    """Hold an exclusive, non-blocking lock for the duration of an ingest run."""
+    try:
+        import fcntl
+    except ImportError:  # Not available on Windows; runs are not serialised there
+        yield
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise IngestAlreadyRunning("Another ingestion is already running")
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def ingest_documents(force: bool = False, stats: IngestStats = None, index_config: IndexConfig = None):
+    """Main function to ingest documents into Milvus.
+
+    By default only new, changed and removed files are applied to the existing
+    collection, tracked through the ingest manifest. A full rebuild happens when
+    ``force`` is set or when there is no usable manifest or collection; it
+    builds the vector index from ``index_config`` (env settings by default).
+    Progress and throughput are accumulated in ``stats`` if one is given, and
+    setting ``stats.cancel_event`` stops the run (it resumes next time).
+    """
     logger.info("Starting document ingestion process")
+    stats = stats or IngestStats()
     
+    with ingest_lock():
+        success = _run_ingest(force, stats, index_config)
+        if success:
+            # Tell every API worker to rebind to the updated collection
+            publish_kb_version(resolve_active_collection())
+        return success
+
+
+def _run_ingest(force: bool, stats: IngestStats, index_config: IndexConfig = None):
     try:
         # Initialize embeddings
         embeddings = init_embeddings()
+        manifest = IngestManifest.load()
+        checkpoint = IngestCheckpoint.load()
+        active = get_collection_versions().active()
+        if force:
+            checkpoint.complete()
+        elif checkpoint.mode == "rebuild":
+            # A new version was only partially built; finish that first
+            logger.info(f"Resuming interrupted rebuild ({len(checkpoint.inserted)} chunks already inserted)")
+        elif active is not None and _dimension_changed(active):
+            logger.info(f"Embedding dimension changed since '{active}' was built, running full ingestion")
+        elif manifest.files and active is not None and manifest.collection_name == active:
+            vectorstore = open_milvus_vectorstore(embeddings, active)
+            success = update_collection(embeddings, manifest, vectorstore, checkpoint, stats)
+            logger.info(f"Document ingestion completed successfully: {stats.summary()}")
+            return success
+        elif active is None:
+            logger.info(f"Collection '{MILVUS_COLLECTION_NAME}' not found, running full ingestion")
+        else:
+            logger.info(f"Manifest does not describe active collection '{active}', running full ingestion")
+
+        success = rebuild_collection(embeddings, manifest, checkpoint, stats, index_config)
+        if success:
+            logger.info(f"Document ingestion completed successfully: {stats.summary()}")
+        return success
         
-        # Load and split documents
-        split_docs = get_split_documents(KNOWLEDGEBASE_PATH)
-        
-        if not split_docs:
-            logger.warning("No documents to ingest.")
-            return False
-        
-        # Create vector store
-        vectorstore = create_milvus_vectorstore(embeddings, split_docs)
-        
-        logger.info("Document ingestion completed successfully")
-        return True
-        
+    except IngestCancelled:
+        logger.warning(f"Document ingestion cancelled: {stats.summary()}")
+        raise
     except Exception as e:
         logger.error(f"Document ingestion failed: {e}")
         raise
 
 
+def rollback_collection() -> str:
+    """Point the alias back at the previous collection version."""
+    with ingest_lock():
+        collection_name = get_collection_versions().rollback()
+        publish_kb_version(collection_name)
+        return collection_name
+
+
 def validate_milvus_connection():
     """Validate connection to Milvus."""
     try:
-        from pymilvus import connections, utility
-        
-        # Connect to Milvus
-        connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+        versions = get_collection_versions()
+        active = versions.active()
         
         # Check if collection exists
-        if utility.has_collection(MILVUS_COLLECTION_NAME):
-            logger.info(f"Collection '{MILVUS_COLLECTION_NAME}' exists in Milvus")
+        if active is not None:
+            logger.info(f"Collection '{MILVUS_COLLECTION_NAME}' exists in Milvus (active version '{active}')")
             
             # Get collection info
-            from pymilvus import Collection
-            collection = Collection(MILVUS_COLLECTION_NAME)
-            count = collection.num_entities
+            count = get_milvus_client().get_collection_stats(active).get("row_count", 0)
             logger.info(f"Collection contains {count} entities")
             return True
         else:
@@ -201,11 +933,6 @@ def validate_milvus_connection():
     except Exception as e:
         logger.error(f"Failed to validate Milvus connection: {e}")
         return False
-    finally:
-        try:
-            connections.disconnect("default")
-        except:
-            pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+Local BM25 index over the knowledge base chunks.
+
+Helpdesk questions often hinge on exact tokens (error codes, product names
+such as "Intune" or "O365") that dense embeddings blur. The index is built
+during ingestion next to the Milvus collection, one file per collection
+version so it follows promotion and rollback, and is loaded by the API
+workers when they bind to a collection.
+
+The file stores each chunk's text and metadata; postings are rebuilt on load.
+"""
+import os
+import json
+import math
+import re
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_DIR = Path(os.getenv("LEXICAL_INDEX_DIR", "./.cache/lexical"))
+
+INDEX_VERSION = 1
+# BM25 term frequency saturation and length normalisation
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or our should "
+    "the this to what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+@dataclass
+class LexicalHit:
+    chunk_id: str
+    text: str
+    metadata: Dict
+    score: float
+    # Share of the query's IDF weight matched by this chunk, in [0, 1]
+    coverage: float
+
+
+class BM25Index:
+    """In-memory inverted index with BM25 scoring, keyed by chunk ID."""
+
+    def __init__(self, collection_name: Optional[str] = None):
+        self.collection_name = collection_name
+        self.documents: Dict[str, Tuple[str, Dict]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict] = None):
+        """Index a chunk, replacing any previous chunk with the same ID."""
+        if chunk_id in self.documents:
+            self.remove([chunk_id])
+        terms = tokenize(text)
+        self.documents[chunk_id] = (text, dict(metadata or {}))
+        self._lengths[chunk_id] = len(terms)
+        self._total_length += len(terms)
+        for term, count in Counter(terms).items():
+            self._postings.setdefault(term, {})[chunk_id] = count
+
+    def remove(self, chunk_ids: Iterable[str]):
+        for chunk_id in chunk_ids:
+            entry = self.documents.pop(chunk_id, None)
+            if entry is None:
+                continue
+            self._total_length -= self._lengths.pop(chunk_id)
+            for term in set(tokenize(entry[0])):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def document_frequency(self, term: str) -> int:
+        return len(self._postings.get(term, ()))
+
+    def idf(self, term: str) -> float:
+        n = len(self.documents)
+        df = self.document_frequency(term)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10) -> List[LexicalHit]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.documents:
+            return []
+        average_length = self._total_length / len(self.documents) or 1.0
+        idfs = {term: self.idf(term) for term in terms}
+        total_idf = sum(idfs.values())
+
+        scores: Dict[str, float] = {}
+        matched: Dict[str, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = idfs[term]
+            for chunk_id, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched[chunk_id] = matched.get(chunk_id, 0.0) + idf
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        hits = []
+        for chunk_id, score in ranked:
+            text, metadata = self.documents[chunk_id]
+            hits.append(LexicalHit(chunk_id, text, metadata, score, matched[chunk_id] / total_idf))
+        return hits
+
+    def save(self, path: Optional[Path] = None):
+        """Atomically write the index to disk."""
+        path = path or index_path(self.collection_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": INDEX_VERSION,
+            "collection_name": self.collection_name,
+            "documents": {chunk_id: [text, metadata] for chunk_id, (text, metadata) in self.documents.items()},
+        }
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp_path, path)
+        logger.info(f"Saved lexical index of {len(self.documents)} chunks to {path}")
+
+    @classmethod
+    def load(cls, collection_name: str, path: Optional[Path] = None) -> Optional["BM25Index"]:
+        """The saved index for a collection, or None if there is none usable."""
+        path = path or index_path(collection_name)
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read lexical index at {path}: {e}")
+            return None
+        if data.get("version") != INDEX_VERSION:
+            logger.warning(f"Ignoring lexical index with unsupported version at {path}")
+            return None
+        index = cls(collection_name)
+        for chunk_id, (text, metadata) in data.get("documents", {}).items():
+            index.add(chunk_id, text, metadata)
+        return index
+
+
+def index_path(collection_name: Optional[str]) -> Path:
+    return LEXICAL_INDEX_DIR / f"{collection_name or 'default'}.json"
+
+
+def delete_index(collection_name: str):
+    """Remove a collection's saved index, once the collection itself is dropped."""
+    index_path(collection_name).unlink(missing_ok=True)
@@ -12,6 +12,16 @@ from langchain.chains.retrieval import create_retrieval_chain
 
 from app.services.openai_llm import init_azure_chat_openai, create_chat_prompt_template # Import from openai_llm.py
 from app.services.ingest_service import init_embeddings, get_milvus_retriever, validate_milvus_connection
+from app.services.circuit_breaker import llm_breaker
+from app.services.context_packing import CONTEXT_PACKING_ENABLED, make_context_packer
+from app.services.query_condensation import (
+    QUERY_CONDENSE_DEPLOYMENT,
+    QUERY_CONDENSE_ENABLED,
+    QUERY_CONDENSE_MODEL_NAME,
+    QueryCondenser,
+    make_condensing_retrieval,
+    make_llm_rewriter,
+)
 
 env_index_path_str = os.getenv("INDEX_PATH")
 if env_index_path_str:
@@ -72,7 +82,19 @@ def create_rag_chain(retriever):
   
     combine_docs_chain = create_stuff_documents_chain(llm, prompt)
     
-   
-    retrieval_qa_chain = create_retrieval_chain(retriever, combine_docs_chain)
+    # Follow-up questions are also retrieved in a standalone, history-aware form
+    condenser = None
+    if QUERY_CONDENSE_ENABLED:
+        if QUERY_CONDENSE_DEPLOYMENT:
+            # Its failures are bounded by the rewrite timeout and say nothing about the chat deployment
+            rewriter = make_llm_rewriter(init_azure_chat_openai(QUERY_CONDENSE_DEPLOYMENT, QUERY_CONDENSE_MODEL_NAME))
+        else:
+            rewriter = make_llm_rewriter(llm, llm_breaker)
+        condenser = QueryCondenser(rewriter)
+    retrieval = make_condensing_retrieval(retriever, condenser)
+    if CONTEXT_PACKING_ENABLED:
+        # Merge overlapping neighbours, drop duplicates and fit the context token budget
+        retrieval = retrieval | make_context_packer()
+    retrieval_qa_chain = create_retrieval_chain(retrieval, combine_docs_chain)
     
     return retrieval_qa_chain # Return the single, combined chain
\ No newline at end of file
@@ -0,0 +1,496 @@
+"""
+Embedded vector store for single-node and test deployments.
+
+With ``VECTOR_STORE_BACKEND=local`` the knowledge base is kept on local disk
+instead of in Milvus, so a bot runs without the etcd + minio + milvus stack.
+Each collection is a directory holding its vectors as a raw float32 file,
+searched through a NumPy memory map, and a JSON-lines file with the text and
+metadata of each row. Opening a collection maps the file rather than reading
+it, so it loads in milliseconds and the OS page cache keeps it in memory.
+
+Search is exact (brute force, scanned in blocks), which is fast enough for
+the tens of thousands of chunks a team knowledge base holds; the configured
+metric is honoured but the index type is not.
+
+``LocalVectorClient`` answers the part of the ``MilvusClient`` API used by
+collection versioning, index inspection and lexical index backfill, so
+blue/green promotion and rollback work the same on both backends.
+"""
+import os
+import json
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from pymilvus import DataType, MilvusException
+
+from app.services.index_config import distances
+
+logger = logging.getLogger(__name__)
+
+LOCAL_VECTOR_STORE_DIR = Path(os.getenv("LOCAL_VECTOR_STORE_DIR", "./.cache/vectors"))
+# Rows compared per block during a search, which bounds its temporary memory
+LOCAL_SEARCH_BLOCK_ROWS = int(os.getenv("LOCAL_SEARCH_BLOCK_ROWS", "65536"))
+
+STORE_VERSION = 1
+# Share of deleted (replaced or removed) rows at which a collection is rewritten without them
+COMPACT_DELETED_SHARE = 0.5
+ALIASES_FILE = "aliases.json"
+
+
+def _write_json(path: Path, data):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class LocalCollection:
+    """One collection on disk: appended float32 rows, their text/metadata and deleted row numbers.
+
+    Files carry a generation number; compaction writes the next generation and
+    switches ``collection.json`` to it in one rename, so readers never see a
+    half-written collection.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self.metric_type = "L2"
+        self.generation = 0
+        self.rows: List[Dict[str, Any]] = []
+        self.deleted: set = set()
+        self._positions: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._signature: Tuple = ()
+        # Files hold an interrupted (or in-flight) append beyond the complete rows
+        self._incomplete = False
+        if self.exists():
+            self._load()
+
+    def exists(self) -> bool:
+        return (self.path / "collection.json").exists()
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> Path:
+        suffix = {"vectors": "f32", "rows": "jsonl", "deleted": "jsonl"}[kind]
+        return self.path / f"{kind}.{self.generation if generation is None else generation}.{suffix}"
+
+    def _load(self):
+        info = json.loads((self.path / "collection.json").read_text(encoding="utf-8"))
+        if info.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported local collection version at {self.path}")
+        self.dim, self.metric_type, self.generation = info["dim"], info["metric_type"], info["generation"]
+        rows_path, deleted_path = self._file("rows"), self._file("deleted")
+        torn = False
+        if rows_path.exists():
+            with open(rows_path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        self.rows.append(json.loads(line))
+                    except ValueError:
+                        torn = True
+                        break
+        if deleted_path.exists():
+            self.deleted = {int(line) for line in deleted_path.read_text(encoding="utf-8").split()}
+        self._map_vectors()
+        # A row counts once both its vector and its text were written. Loading
+        # never changes the files: a writer may be between the two appends, so
+        # only the writer (holding the ingest lock) cuts off an interrupted one
+        # before its next append, in _repair()
+        count = min(len(self.rows), len(self._vectors))
+        vectors_path = self._file("vectors")
+        partial = vectors_path.exists() and vectors_path.stat().st_size % (4 * self.dim) != 0
+        self._incomplete = torn or partial or len(self.rows) != len(self._vectors)
+        self.rows = self.rows[:count]
+        self._vectors = self._vectors[:count]
+        self._positions = {row["pk"]: i for i, row in enumerate(self.rows) if i not in self.deleted}
+        self._signature = self.disk_signature()
+
+    def disk_signature(self) -> Tuple:
+        """Changes whenever any process writes to the collection."""
+        try:
+            info = (self.path / "collection.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            return ()
+        files = (self._file("rows"), self._file("deleted"))
+        return (info,) + tuple(path.stat().st_size if path.exists() else 0 for path in files)
+
+    def is_stale(self) -> bool:
+        """Whether another process changed the collection since it was loaded."""
+        return self.disk_signature() != self._signature
+
+    def _repair(self):
+        """Cut the files back to the complete rows before appending after them."""
+        if not self._incomplete:
+            return
+        count = len(self.rows)
+        logger.warning(f"Truncating local collection '{self.path.name}' to {count} complete rows")
+        vectors_path = self._file("vectors")
+        if vectors_path.exists():
+            os.truncate(vectors_path, count * 4 * self.dim)
+        with open(self._file("rows"), "w", encoding="utf-8") as handle:
+            handle.writelines(json.dumps(row) + "\n" for row in self.rows)
+        self._incomplete = False
+        self._map_vectors()
+
+    def _map_vectors(self):
+        path = self._file("vectors")
+        rows = path.stat().st_size // (4 * self.dim) if path.exists() else 0
+        if rows:
+            self._vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        else:
+            self._vectors = np.empty((0, self.dim), dtype=np.float32)
+
+    def create(self, dim: int, metric_type: str):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim, self.metric_type = dim, metric_type.upper()
+        self._write_info()
+        self._map_vectors()
+        self._signature = self.disk_signature()
+        logger.info(f"Created local collection '{self.path.name}' ({dim} dimensions, {self.metric_type})")
+
+    def _write_info(self):
+        _write_json(self.path / "collection.json", {
+            "version": STORE_VERSION, "dim": self.dim, "metric_type": self.metric_type, "generation": self.generation,
+        })
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(self, ids: List[str], vectors: np.ndarray, texts: List[str], metadatas: List[dict]):
+        """Append rows; a row whose pk already exists replaces it."""
+        with self._lock:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            self._repair()
+            replaced = [self._positions[pk] for pk in ids if pk in self._positions]
+            with open(self._file("vectors"), "ab") as handle:
+                handle.write(vectors.tobytes())
+            with open(self._file("rows"), "a", encoding="utf-8") as handle:
+                for pk, text, metadata in zip(ids, texts, metadatas):
+                    handle.write(json.dumps({"pk": pk, "text": text, "metadata": metadata}) + "\n")
+            start = len(self.rows)
+            self.rows.extend({"pk": pk, "text": text, "metadata": metadata}
+                             for pk, text, metadata in zip(ids, texts, metadatas))
+            self._mark_deleted(replaced)
+            self._positions.update((pk, start + i) for i, pk in enumerate(ids))
+            self._map_vectors()
+            self._signature = self.disk_signature()
+            self._maybe_compact()
+
+    def _mark_deleted(self, positions: List[int]):
+        if not positions:
+            return
+        with open(self._file("deleted"), "a", encoding="utf-8") as handle:
+            handle.write("".join(f"{position}\n" for position in positions))
+        self.deleted.update(positions)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        with self._lock:
+            positions = [self._positions.pop(pk) for pk in ids if pk in self._positions]
+            self._mark_deleted(positions)
+            self._signature = self.disk_signature()
+            self._maybe_compact()
+            return len(positions)
+
+    def _maybe_compact(self):
+        if self.rows and len(self.deleted) >= COMPACT_DELETED_SHARE * len(self.rows):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the collection without deleted rows as a new generation."""
+        with self._lock:
+            if not self.deleted:
+                return
+            keep = [i for i in range(len(self.rows)) if i not in self.deleted]
+            old_generation, generation = self.generation, self.generation + 1
+            vectors = np.asarray(self._vectors[keep], dtype=np.float32)
+            self._file("vectors", generation).write_bytes(vectors.tobytes())
+            with open(self._file("rows", generation), "w", encoding="utf-8") as handle:
+                for i in keep:
+                    handle.write(json.dumps(self.rows[i]) + "\n")
+            self.generation = generation
+            self._write_info()
+            for kind in ("vectors", "rows", "deleted"):
+                self._file(kind, old_generation).unlink(missing_ok=True)
+            logger.info(f"Compacted local collection '{self.path.name}': dropped {len(self.deleted)} rows")
+            self.rows = [self.rows[i] for i in keep]
+            self.deleted = set()
+            self._incomplete = False
+            self._positions = {row["pk"]: i for i, row in enumerate(self.rows)}
+            self._map_vectors()
+            self._signature = self.disk_signature()
+
+    def search(self, vector, k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """The k nearest live rows with Milvus-convention scores."""
+        with self._lock:
+            vectors, rows, deleted = self._vectors, self.rows, list(self.deleted)
+        if k <= 0 or len(rows) == len(deleted):
+            return []
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(vectors), LOCAL_SEARCH_BLOCK_ROWS):
+            block = distances([vector], vectors[start:start + LOCAL_SEARCH_BLOCK_ROWS], self.metric_type)[0]
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+            best_scores = np.concatenate([best_scores, block])
+            if deleted:
+                live = ~np.isin(best_rows, deleted)
+                best_rows, best_scores = best_rows[live], best_scores[live]
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+        order = best_scores.argsort()
+        # Back to Milvus' convention: squared distance for L2, similarity for IP and COSINE
+        sign = 1.0 if self.metric_type == "L2" else -1.0
+        return [(rows[best_rows[i]], sign * float(best_scores[i])) for i in order]
+
+    def vector(self, position: int) -> List[float]:
+        return self._vectors[position].tolist()
+
+    def live_rows(self) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            positions = sorted(self._positions.values())
+        for position in positions:
+            yield position, self.rows[position]
+
+
+class _RowIterator:
+    """``query_iterator`` stand-in: batches of rows, then an empty batch."""
+
+    def __init__(self, rows: List[dict], batch_size: int):
+        self.rows = rows
+        self.batch_size = batch_size
+        self.offset = 0
+
+    def next(self) -> List[dict]:
+        batch = self.rows[self.offset:self.offset + self.batch_size]
+        self.offset += len(batch)
+        return batch
+
+    def close(self):
+        pass
+
+
+class LocalVectorClient:
+    """The subset of ``MilvusClient`` the ingest and retrieval code uses, over local collections."""
+
+    def __init__(self, root: Path = LOCAL_VECTOR_STORE_DIR):
+        self.root = Path(root)
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+
+    def _aliases(self) -> Dict[str, str]:
+        path = self.root / ALIASES_FILE
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def _resolve(self, name: str) -> str:
+        return self._aliases().get(name, name)
+
+    def collection(self, name: str) -> LocalCollection:
+        """The (possibly not yet created) collection called ``name`` or pointed at by that alias."""
+        name = self._resolve(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            # Another process (the ingest CLI, say) may have written to it since
+            if collection is None or collection.is_stale():
+                collection = LocalCollection(self.root / name)
+                self._collections[name] = collection
+            return collection
+
+    def has_collection(self, name: str) -> bool:
+        return (self.root / self._resolve(name) / "collection.json").exists()
+
+    def list_collections(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(path.name for path in self.root.iterdir() if (path / "collection.json").exists())
+
+    def drop_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(self.root / name, ignore_errors=True)
+        logger.info(f"Dropped local collection '{name}'")
+
+    def describe_alias(self, alias: str) -> Dict[str, str]:
+        aliases = self._aliases()
+        if alias not in aliases:
+            raise MilvusException(message=f"alias {alias} not found")
+        return {"alias": alias, "collection_name": aliases[alias]}
+
+    def create_alias(self, collection_name: str, alias: str):
+        self.alter_alias(collection_name=collection_name, alias=alias)
+
+    def alter_alias(self, collection_name: str, alias: str):
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_json(self.root / ALIASES_FILE, {**self._aliases(), alias: collection_name})
+
+    def flush(self, collection_name: str):
+        self.collection(collection_name).compact()
+
+    def get_collection_stats(self, collection_name: str) -> Dict[str, int]:
+        return {"row_count": len(self.collection(collection_name))}
+
+    def list_indexes(self, collection_name: str) -> List[str]:
+        return ["vector"] if self.has_collection(collection_name) else []
+
+    def describe_index(self, collection_name: str, index_name: str) -> Dict[str, str]:
+        return {"index_type": "FLAT", "metric_type": self.collection(collection_name).metric_type}
+
+    def describe_collection(self, collection_name: str) -> Dict[str, Any]:
+        return {"fields": [
+            {"name": "pk", "type": DataType.VARCHAR},
+            {"name": "text", "type": DataType.VARCHAR},
+            {"name": "vector", "type": DataType.FLOAT_VECTOR, "params": {"dim": self.collection(collection_name).dim}},
+        ]}
+
+    def _row(self, collection: LocalCollection, position: int, row: dict, output_fields) -> dict:
+        result = {"pk": row["pk"], "text": row["text"], **row["metadata"]}
+        if output_fields and "vector" in output_fields:
+            result["vector"] = collection.vector(position)
+        return result
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, output_fields=None, **kwargs):
+        """Every live row with its text and metadata (the vector only if asked for)."""
+        collection = self.collection(collection_name)
+        rows = [self._row(collection, position, row, output_fields) for position, row in collection.live_rows()]
+        return _RowIterator(rows, batch_size)
+
+    def get(self, collection_name: str, ids: List[str], output_fields=None, **kwargs) -> List[dict]:
+        collection = self.collection(collection_name)
+        positions = collection._positions
+        return [
+            self._row(collection, positions[pk], collection.rows[positions[pk]], output_fields)
+            for pk in ids if pk in positions
+        ]
+
+    def get_server_version(self) -> str:
+        return "local"
+
+    def close(self):
+        pass
+
+
+_local_client: Optional[LocalVectorClient] = None
+_client_lock = threading.Lock()
+
+
+def get_local_client() -> LocalVectorClient:
+    """Process-wide client for ``LOCAL_VECTOR_STORE_DIR``."""
+    global _local_client
+    with _client_lock:
+        if _local_client is None:
+            _local_client = LocalVectorClient()
+        return _local_client
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain vector store over a local collection, interchangeable with ``Milvus`` for this app."""
+
+    _primary_field = "pk"
+    _text_field = "text"
+    _vector_field = "vector"
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        collection_name: str,
+        client: Optional[LocalVectorClient] = None,
+        metric_type: str = "L2",
+    ):
+        self.embedding_func = embedding_function
+        self.collection_name = collection_name
+        self.client = client or get_local_client()
+        self.metric_type = metric_type.upper()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_func
+
+    @property
+    def collection(self) -> LocalCollection:
+        return self.client.collection(self.collection_name)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        if not texts:
+            return []
+        if ids is None:
+            raise ValueError("Local collections need explicit ids")
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        collection = self.collection
+        if not collection.exists():
+            collection.create(vectors.shape[1], self.metric_type)
+        collection.add(list(ids), vectors, list(texts), list(metadatas or [{} for _ in texts]))
+        return list(ids)
+
+    def add_texts(
+        self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *, ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_func.embed_documents(texts), metadatas, ids=ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids is None:
+            raise ValueError("Local collections only delete by id")
+        if self.collection.exists():
+            self.collection.delete(ids)
+        return True
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        if kwargs.get("expr"):
+            raise ValueError("Filter expressions are not supported by the local vector store")
+        collection = self.collection
+        if not collection.exists():
+            return []
+        results = []
+        for row, score in collection.search(embedding, k):
+            metadata = {**row["metadata"], self._primary_field: row["pk"]}
+            results.append((Document(page_content=row["text"], metadata=metadata), score))
+        return results
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_func.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Same [0, 1] mapping as langchain_milvus, for unit-norm embeddings
+        if self.collection.metric_type == "L2":
+            return lambda distance: 1 - distance / 4.0
+        return lambda similarity: (similarity + 1) / 2.0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        collection_name: str = "local",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, collection_name, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -1,16 +1,60 @@
 """
 Monitoring and metrics collection service.
 """
+import os
 import time
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import asyncio
 from collections import defaultdict, deque
 
+from app.services.quantile_sketch import DDSketch, WindowedSketch, WindowViews
+
 logger = logging.getLogger(__name__)
 
+# Histogram bucket upper bounds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+# Quantiles reported for every time window
+REPORTED_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+# Window the average/p95 of MetricsSummary are computed over
+SUMMARY_WINDOW = "5m"
+
+
+def _histogram_lines(name: str, sketch: DDSketch, buckets: Sequence[float], labels: str = "") -> List[str]:
+    """Prometheus histogram series derived from a sketch's buckets."""
+    prefix = f"{labels}," if labels else ""
+    lines = [f'{name}_bucket{{{prefix}le="{bound:g}"}} {sketch.count_at_most(bound)}' for bound in buckets]
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {sketch.count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {sketch.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {sketch.count}")
+    return lines
+
+
+def _quantile_lines(name: str, views: Dict[str, DDSketch], labels: str) -> List[str]:
+    lines = []
+    for window, sketch in views.items():
+        for q in REPORTED_QUANTILES:
+            value = sketch.quantile(q)
+            if value is not None:
+                lines.append(f'{name}{{{labels},window="{window}",quantile="{q:g}"}} {value:.6f}')
+    return lines
+
+
+def _quantile_summary(views: Dict[str, DDSketch]) -> Dict[str, Dict[str, Any]]:
+    return {
+        window: {
+            "count": sketch.count,
+            "average": sketch.average,
+            **{f"p{round(q * 100)}": sketch.quantile(q) for q in REPORTED_QUANTILES},
+        }
+        for window, sketch in views.items()
+    }
+
+
 @dataclass
 class MetricsSummary:
     """Summary of system metrics."""
@@ -24,21 +68,33 @@ class MetricsSummary:
     last_updated: datetime = field(default_factory=datetime.now)
 
 class MetricsCollector:
-    """Collect and analyze system metrics."""
+    """Collect and analyze system metrics.
+
+    Durations go into per-endpoint and per-stage quantile sketches, so recording
+    is constant time and percentiles are read from buckets instead of sorting
+    a window of raw samples.
+    """
     
-    def __init__(self, max_samples: int = 1000):
-        self.max_samples = max_samples
-        self.response_times = deque(maxlen=max_samples)
+    def __init__(self):
+        self.recent_response_times = deque(maxlen=10)
         self.request_counts = defaultdict(int)
         self.error_counts = defaultdict(int)
         self.cache_stats = {"hits": 0, "misses": 0}
+        self.connection_stats = defaultdict(int)
+        self.admission_stats = defaultdict(int)
+        self.condensation_stats = defaultdict(int)
+        self.request_sketches: Dict[str, WindowedSketch] = defaultdict(WindowedSketch)
+        self.stage_sketches: Dict[str, WindowedSketch] = defaultdict(WindowedSketch)
+        self.tokens_sketch = WindowedSketch()
+        self.prompt_tokens_sketch = WindowedSketch()
         self.active_requests = 0
         self.start_time = datetime.now()
     
     def record_request(self, endpoint: str, response_time: float, success: bool = True):
         """Record request metrics."""
-        self.response_times.append(response_time)
+        self.recent_response_times.append(response_time)
         self.request_counts[endpoint] += 1
+        self.request_sketches[endpoint].add(response_time)
         
         if not success:
             self.error_counts[endpoint] += 1
@@ -51,6 +107,30 @@ class MetricsCollector:
         """Record cache miss."""
         self.cache_stats["misses"] += 1
     
+    def record_stage(self, stage: str, seconds: float):
+        """Record the duration of one RAG pipeline stage."""
+        self.stage_sketches[stage].add(seconds)
+    
+    def record_tokens(self, count: int):
+        """Record the number of tokens generated for one answer."""
+        self.tokens_sketch.add(count)
+    
+    def record_prompt_tokens(self, count: int):
+        """Record the number of prompt tokens sent to the model for one answer."""
+        self.prompt_tokens_sketch.add(count)
+    
+    def record_connection_event(self, event: str):
+        """Record a connection pool event (connect, reconnect, failed probe)."""
+        self.connection_stats[event] += 1
+    
+    def record_admission(self, outcome: str):
+        """Record a chat admission decision (admitted, queued or the rejection reason)."""
+        self.admission_stats[outcome] += 1
+    
+    def record_condensation(self, outcome: str):
+        """Record a follow-up question rewrite (rewritten, cached, empty, timeout or failed)."""
+        self.condensation_stats[outcome] += 1
+    
     def increment_active_requests(self):
         """Increment active request counter."""
         self.active_requests += 1
@@ -65,16 +145,10 @@ class MetricsCollector:
         total_errors = sum(self.error_counts.values())
         successful_requests = total_requests - total_errors
         
-        avg_response_time = (
-            sum(self.response_times) / len(self.response_times)
-            if self.response_times else 0.0
+        recent = DDSketch.merged(
+            sketch.view(SUMMARY_WINDOW) for sketch in list(self.request_sketches.values())
         )
         
-        # Calculate P95
-        sorted_times = sorted(self.response_times)
-        p95_index = int(0.95 * len(sorted_times)) if sorted_times else 0
-        p95_response_time = sorted_times[p95_index] if sorted_times else 0.0
-        
         # Calculate cache hit rate
         total_cache_ops = self.cache_stats["hits"] + self.cache_stats["misses"]
         cache_hit_rate = (
@@ -86,8 +160,8 @@ class MetricsCollector:
             total_requests=total_requests,
             successful_requests=successful_requests,
             failed_requests=total_errors,
-            average_response_time=avg_response_time,
-            p95_response_time=p95_response_time,
+            average_response_time=recent.average,
+            p95_response_time=recent.quantile(0.95) or 0.0,
             active_connections=self.active_requests,
             cache_hit_rate=cache_hit_rate,
             last_updated=datetime.now()
@@ -104,9 +178,165 @@ class MetricsCollector:
             "endpoint_stats": dict(self.request_counts),
             "error_stats": dict(self.error_counts),
             "cache_stats": self.cache_stats.copy(),
-            "recent_response_times": list(self.response_times)[-10:],  # Last 10 response times
+            "connection_stats": dict(self.connection_stats),
+            "admission_stats": dict(self.admission_stats),
+            "condensation_stats": dict(self.condensation_stats),
+            "latency_quantiles": {
+                endpoint: _quantile_summary(sketch.views())
+                for endpoint, sketch in list(self.request_sketches.items())
+            },
+            "stage_stats": {
+                stage: _quantile_summary(sketch.views()) for stage, sketch in list(self.stage_sketches.items())
+            },
+            "token_stats": {
+                "prompt": _quantile_summary(self.prompt_tokens_sketch.views()),
+                "generated": _quantile_summary(self.tokens_sketch.views()),
+            },
+            "recent_response_times": list(self.recent_response_times),  # Last 10 response times
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Mergeable state of this worker's metrics."""
+        def serialize(sketch):
+            return {window: view.to_dict() for window, view in sketch.views().items()}
+
+        return {
+            "pid": os.getpid(),
+            "start_time": self.start_time.timestamp(),
+            "request_counts": dict(self.request_counts),
+            "error_counts": dict(self.error_counts),
+            "cache_stats": self.cache_stats.copy(),
+            "connection_stats": dict(self.connection_stats),
+            "admission_stats": dict(self.admission_stats),
+            "condensation_stats": dict(self.condensation_stats),
+            "active_requests": self.active_requests,
+            "recent_response_times": list(self.recent_response_times),
+            "request_sketches": {name: serialize(s) for name, s in list(self.request_sketches.items())},
+            "stage_sketches": {name: serialize(s) for name, s in list(self.stage_sketches.items())},
+            "tokens_sketch": serialize(self.tokens_sketch),
+            "prompt_tokens_sketch": serialize(self.prompt_tokens_sketch),
         }
 
+    def render_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP infrabot_requests_total Requests handled, by endpoint.",
+            "# TYPE infrabot_requests_total counter",
+        ]
+        lines += [f'infrabot_requests_total{{endpoint="{e}"}} {c}' for e, c in sorted(self.request_counts.items())]
+        lines += [
+            "# HELP infrabot_request_errors_total Failed requests, by endpoint.",
+            "# TYPE infrabot_request_errors_total counter",
+        ]
+        lines += [f'infrabot_request_errors_total{{endpoint="{e}"}} {c}' for e, c in sorted(self.error_counts.items())]
+        lines += [
+            "# HELP infrabot_active_requests Requests currently being served.",
+            "# TYPE infrabot_active_requests gauge",
+            f"infrabot_active_requests {self.active_requests}",
+            "# HELP infrabot_semantic_cache_total Semantic cache lookups, by result.",
+            "# TYPE infrabot_semantic_cache_total counter",
+        ]
+        lines += [f'infrabot_semantic_cache_total{{result="{r}"}} {c}' for r, c in sorted(self.cache_stats.items())]
+        lines += [
+            "# HELP infrabot_connection_events_total Connection pool events.",
+            "# TYPE infrabot_connection_events_total counter",
+        ]
+        lines += [
+            f'infrabot_connection_events_total{{event="{e}"}} {c}' for e, c in sorted(self.connection_stats.items())
+        ]
+        lines += [
+            "# HELP infrabot_chat_admission_total Chat admission decisions, by outcome.",
+            "# TYPE infrabot_chat_admission_total counter",
+        ]
+        lines += [
+            f'infrabot_chat_admission_total{{outcome="{o}"}} {c}' for o, c in sorted(self.admission_stats.items())
+        ]
+        lines += [
+            "# HELP infrabot_query_condensation_total Follow-up question rewrites, by outcome.",
+            "# TYPE infrabot_query_condensation_total counter",
+        ]
+        lines += [
+            f'infrabot_query_condensation_total{{outcome="{o}"}} {c}'
+            for o, c in sorted(self.condensation_stats.items())
+        ]
+
+        request_views = {e: sketch.views() for e, sketch in sorted(self.request_sketches.items())}
+        stage_views = {s: sketch.views() for s, sketch in sorted(self.stage_sketches.items())}
+        lines += [
+            "# HELP infrabot_request_duration_seconds Request duration, including the full response stream.",
+            "# TYPE infrabot_request_duration_seconds histogram",
+        ]
+        for endpoint, views in request_views.items():
+            lines += _histogram_lines(
+                "infrabot_request_duration_seconds", views["all"], LATENCY_BUCKETS, f'endpoint="{endpoint}"'
+            )
+        lines += [
+            "# HELP infrabot_stage_duration_seconds Duration of each RAG pipeline stage.",
+            "# TYPE infrabot_stage_duration_seconds histogram",
+        ]
+        for stage, views in stage_views.items():
+            lines += _histogram_lines("infrabot_stage_duration_seconds", views["all"], LATENCY_BUCKETS, f'stage="{stage}"')
+        lines += [
+            "# HELP infrabot_generated_tokens Tokens generated per answer.",
+            "# TYPE infrabot_generated_tokens histogram",
+        ]
+        lines += _histogram_lines("infrabot_generated_tokens", self.tokens_sketch.total, TOKEN_BUCKETS)
+        lines += [
+            "# HELP infrabot_prompt_tokens Prompt tokens sent to the model per answer.",
+            "# TYPE infrabot_prompt_tokens histogram",
+        ]
+        lines += _histogram_lines("infrabot_prompt_tokens", self.prompt_tokens_sketch.total, TOKEN_BUCKETS)
+        lines += [
+            "# HELP infrabot_request_duration_quantile_seconds Request duration quantiles over recent windows.",
+            "# TYPE infrabot_request_duration_quantile_seconds gauge",
+        ]
+        for endpoint, views in request_views.items():
+            lines += _quantile_lines("infrabot_request_duration_quantile_seconds", views, f'endpoint="{endpoint}"')
+        lines += [
+            "# HELP infrabot_stage_duration_quantile_seconds Stage duration quantiles over recent windows.",
+            "# TYPE infrabot_stage_duration_quantile_seconds gauge",
+        ]
+        for stage, views in stage_views.items():
+            lines += _quantile_lines("infrabot_stage_duration_quantile_seconds", views, f'stage="{stage}"')
+        return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots) -> MetricsCollector:
+    """Combine worker snapshots into one collector covering every worker."""
+    merged = MetricsCollector()
+    merged.request_sketches = defaultdict(WindowViews)
+    merged.stage_sketches = defaultdict(WindowViews)
+    merged.tokens_sketch = WindowViews()
+    merged.prompt_tokens_sketch = WindowViews()
+    merged.recent_response_times = deque()
+    for snapshot in snapshots:
+        for endpoint, count in snapshot["request_counts"].items():
+            merged.request_counts[endpoint] += count
+        for endpoint, count in snapshot["error_counts"].items():
+            merged.error_counts[endpoint] += count
+        for name, count in snapshot["cache_stats"].items():
+            merged.cache_stats[name] = merged.cache_stats.get(name, 0) + count
+        for name, count in snapshot.get("connection_stats", {}).items():
+            merged.connection_stats[name] += count
+        for name, count in snapshot.get("admission_stats", {}).items():
+            merged.admission_stats[name] += count
+        for name, count in snapshot.get("condensation_stats", {}).items():
+            merged.condensation_stats[name] += count
+        for endpoint, views in snapshot.get("request_sketches", {}).items():
+            merged.request_sketches[endpoint].merge_views(views)
+        for stage, views in snapshot.get("stage_sketches", {}).items():
+            merged.stage_sketches[stage].merge_views(views)
+        if "tokens_sketch" in snapshot:
+            merged.tokens_sketch.merge_views(snapshot["tokens_sketch"])
+        if "prompt_tokens_sketch" in snapshot:
+            merged.prompt_tokens_sketch.merge_views(snapshot["prompt_tokens_sketch"])
+        merged.active_requests += snapshot["active_requests"]
+        merged.recent_response_times.extend(snapshot.get("recent_response_times", []))
+    if snapshots:
+        merged.start_time = datetime.fromtimestamp(min(s["start_time"] for s in snapshots))
+    return merged
+
+
 # Global metrics collector
 metrics = MetricsCollector()
 
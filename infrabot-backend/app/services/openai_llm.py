@@ -2,7 +2,7 @@
 
 import os
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from langchain_openai import AzureChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 
@@ -27,13 +27,13 @@ class CustomAzureChatOpenAI(AzureChatOpenAI):
         return params
 
 
-def init_azure_chat_openai():
-    """Initialize Azure OpenAI with enhanced error handling."""
+def init_azure_chat_openai(deployment_name: Optional[str] = None, model_name: Optional[str] = None):
+    """Initialize Azure OpenAI with enhanced error handling (the chat deployment unless another is given)."""
     api_key_str = os.getenv("AZURE_OPENAI_API_KEY")
     azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
     api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-    deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-    model_name = os.getenv("OPENAI_MODEL_NAME")
+    deployment_name = deployment_name or os.getenv("AZURE_OPENAI_DEPLOYMENT")
+    model_name = model_name or os.getenv("OPENAI_MODEL_NAME")
 
     # Validate all required environment variables
     required_vars = {
@@ -0,0 +1,207 @@
+"""
+Process pool for parsing knowledge base PDFs in parallel.
+
+Parsing with UnstructuredPDFLoader is CPU bound (layout inference, OCR), so
+files are spread across worker processes. Results are yielded in input order,
+each file has its own timeout, and a failing or hanging file only affects
+its own result.
+"""
+import os
+import math
+import time
+import logging
+import multiprocessing
+from pathlib import Path
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from app.services.shared_state import cpu_limit
+
+logger = logging.getLogger(__name__)
+
+# Parse pool configuration (0 workers parses inline in the calling process);
+# defaults to the container's CPU limit rather than the host's CPU count
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(max(1, math.floor(cpu_limit())))))
+INGEST_PARSE_TIMEOUT_SECONDS = float(os.getenv("INGEST_PARSE_TIMEOUT_SECONDS", "300"))
+# "spawn" avoids forking a process that already holds gRPC/HTTP client threads
+INGEST_PARSE_START_METHOD = os.getenv("INGEST_PARSE_START_METHOD", "spawn")
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def count_pdf_pages(file_path: Path) -> int:
+    """Number of pages in a PDF, or 0 if it cannot be determined."""
+    try:
+        from pdfminer.pdfpage import PDFPage
+
+        with open(file_path, "rb") as handle:
+            return sum(1 for _ in PDFPage.get_pages(handle))
+    except Exception:
+        return 0
+
+
+def load_and_split_file(file_path: Path):
+    """Load a single PDF and split it into chunks."""
+    # Imported here so worker processes only pay for what parsing needs
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import UnstructuredPDFLoader
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    loader = UnstructuredPDFLoader(str(file_path))
+    documents = loader.load()
+    if not documents:
+        logger.warning(f"No content extracted from {Path(file_path).name}")
+        return []
+    return text_splitter.split_documents(documents)
+
+
+def parse_pdf(file_path: Path):
+    """Worker entry point: the file's chunks and its page count."""
+    return load_and_split_file(file_path), count_pdf_pages(file_path)
+
+
+@dataclass
+class ParseResult:
+    """Outcome of parsing one file."""
+    file_path: Path
+    documents: List = field(default_factory=list)
+    pages: int = 0
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _terminate_pool(executor: ProcessPoolExecutor):
+    """Stop a pool immediately, killing workers that are stuck on a file."""
+    terminate_workers = getattr(executor, "terminate_workers", None)
+    if terminate_workers is not None:
+        terminate_workers()
+        return
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+
+
+def _parse_inline(file_paths: Sequence[Path], parse_fn: Callable) -> Iterator[ParseResult]:
+    for file_path in file_paths:
+        started = time.monotonic()
+        try:
+            documents, pages = parse_fn(file_path)
+            yield ParseResult(file_path, documents, pages, elapsed=time.monotonic() - started)
+        except Exception as e:
+            yield ParseResult(file_path, error=str(e), elapsed=time.monotonic() - started)
+
+
+def parse_files(
+    file_paths: Sequence[Path],
+    workers: int = INGEST_PARSE_WORKERS,
+    timeout: float = INGEST_PARSE_TIMEOUT_SECONDS,
+    parse_fn: Callable = parse_pdf,
+) -> Iterator[ParseResult]:
+    """Parse files on a process pool, yielding one ``ParseResult`` per file in input order.
+
+    ``parse_fn`` must be a picklable top-level function returning
+    ``(documents, page_count)``. The generator is lazy: new files are only
+    submitted as results are consumed, so a slow consumer applies backpressure.
+    Files parsed ahead of a slow earlier one count against the same ``workers``
+    limit, so at most that many parsed files are ever held.
+    """
+    file_paths = list(file_paths)
+    if workers <= 0 or not file_paths:
+        yield from _parse_inline(file_paths, parse_fn)
+        return
+
+    workers = min(workers, len(file_paths))
+    mp_context = multiprocessing.get_context(INGEST_PARSE_START_METHOD)
+    logger.info(f"Parsing {len(file_paths)} files with {workers} worker processes")
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+
+    pending = deque(enumerate(file_paths))
+    # future -> (index, path, deadline, started)
+    inflight: Dict = {}
+    results: Dict[int, ParseResult] = {}
+    crash_retries: Dict[int, int] = {}
+    next_index = 0
+    executor = new_pool()
+
+    try:
+        while pending or inflight:
+            # Only keep as many files in flight as there are workers, so a
+            # file's deadline starts counting when it actually starts parsing,
+            # and count finished files waiting on an earlier one against that
+            # too. The next file to yield is always let through.
+            while pending and len(inflight) < workers and (
+                len(results) + len(inflight) < workers or pending[0][0] == next_index
+            ):
+                index, file_path = pending.popleft()
+                started = time.monotonic()
+                future = executor.submit(parse_fn, file_path)
+                inflight[future] = (index, file_path, started + timeout, started)
+
+            nearest_deadline = min(deadline for _, _, deadline, _ in inflight.values())
+            done, _ = wait(
+                list(inflight),
+                timeout=max(0.0, nearest_deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+
+            pool_broken = False
+            for future in done:
+                index, file_path, _, started = inflight.pop(future)
+                elapsed = time.monotonic() - started
+                try:
+                    documents, pages = future.result()
+                    results[index] = ParseResult(file_path, documents, pages, elapsed=elapsed)
+                except BrokenProcessPool:
+                    # A worker died (e.g. a native crash); every in-flight file
+                    # fails with it. Retry each once before blaming the file.
+                    pool_broken = True
+                    if crash_retries.get(index, 0) < 1:
+                        crash_retries[index] = crash_retries.get(index, 0) + 1
+                        pending.appendleft((index, file_path))
+                    else:
+                        results[index] = ParseResult(
+                            file_path, error="worker process crashed", elapsed=elapsed
+                        )
+                except Exception as e:
+                    results[index] = ParseResult(file_path, error=str(e), elapsed=elapsed)
+
+            now = time.monotonic()
+            expired = [f for f, (_, _, deadline, _) in inflight.items() if deadline <= now]
+            for future in expired:
+                index, file_path, _, started = inflight.pop(future)
+                logger.error(f"Parsing {file_path.name} timed out after {timeout:.0f}s")
+                results[index] = ParseResult(
+                    file_path, error=f"timed out after {timeout:.0f}s", elapsed=now - started
+                )
+
+            if expired or pool_broken:
+                # Workers stuck on expired files cannot be interrupted, so the
+                # pool is replaced and the other in-flight files are resubmitted.
+                for index, file_path, _, _ in sorted(inflight.values(), reverse=True):
+                    pending.appendleft((index, file_path))
+                inflight.clear()
+                _terminate_pool(executor)
+                executor = new_pool()
+
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+        executor.shutdown(wait=True)
+    finally:
+        _terminate_pool(executor)
@@ -0,0 +1,97 @@
+"""
+Per-request stage timings for the RAG chain, collected through LangChain callbacks.
+
+A ``PipelineTimingHandler`` is attached to one ``astream`` call and records
+how long each stage took: query embedding and Milvus search (reported by the
+retriever as custom events), prompt assembly, time to first token, the whole
+stream, the number of prompt tokens sent to the model and the number of
+tokens generated.
+"""
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.callbacks.manager import adispatch_custom_event
+
+from app.services.monitoring import MetricsCollector, metrics
+from app.services.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Custom callback event the retriever uses to report its internal stages
+STAGE_EVENT = "infrabot_stage_timing"
+
+
+async def report_stage(source, stage: str, seconds: float):
+    """Report a stage duration from inside a retriever (its run manager) or runnable (its config); never raises."""
+    try:
+        config = {"callbacks": source.get_child()} if hasattr(source, "get_child") else source
+        await adispatch_custom_event(STAGE_EVENT, {"stage": stage, "seconds": seconds}, config=config)
+    except Exception as e:
+        logger.debug(f"Could not report timing for stage {stage}: {e}")
+
+
+class PipelineTimingHandler(AsyncCallbackHandler):
+    """Collects stage timings for a single chat request."""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens = 0
+        self.prompt_tokens: Optional[int] = None
+        self._retriever_started: Optional[float] = None
+        self._retriever_runs = 0
+        self._retriever_ended: Optional[float] = None
+        self._first_token_at: Optional[float] = None
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    async def on_custom_event(self, name: str, data: Any, **kwargs: Any):
+        if name == STAGE_EVENT:
+            self.record(data["stage"], data["seconds"])
+
+    async def on_retriever_start(self, serialized, query, **kwargs: Any):
+        if self._retriever_runs == 0 and self._retriever_started is None:
+            self._retriever_started = time.perf_counter()
+        self._retriever_runs += 1
+
+    async def on_retriever_end(self, documents, **kwargs: Any):
+        # Retrievals may overlap (raw and condensed query): time from the
+        # first start to the last end
+        self._retriever_runs -= 1
+        self._retriever_ended = time.perf_counter()
+        if self._retriever_started is not None:
+            self.stages["retrieval"] = self._retriever_ended - self._retriever_started
+
+    async def on_retriever_error(self, error: BaseException, **kwargs: Any):
+        self._retriever_runs -= 1
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs: Any):
+        # Stuffing the documents and formatting the prompt happens between
+        # the end of retrieval and the model call.
+        if self._retriever_ended is not None and "prompt_assembly" not in self.stages:
+            self.record("prompt_assembly", time.perf_counter() - self._retriever_ended)
+        if self.prompt_tokens is None and messages:
+            self.prompt_tokens = count_message_tokens(messages[0])
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any):
+        if not token:
+            return
+        self.tokens += 1
+        if self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+            self.record("time_to_first_token", self._first_token_at - self.started_at)
+
+    def finish(self, collector: MetricsCollector = metrics) -> float:
+        """Record this request's stages and return its total duration."""
+        total = time.perf_counter() - self.started_at
+        self.record("stream_total", total)
+        for stage, seconds in self.stages.items():
+            collector.record_stage(stage, seconds)
+        if self.tokens:
+            collector.record_tokens(self.tokens)
+        if self.prompt_tokens is not None:
+            collector.record_prompt_tokens(self.prompt_tokens)
+        return total
@@ -0,0 +1,239 @@
+"""
+Streaming quantile sketches for latency metrics.
+
+``DDSketch`` stores values in logarithmically sized buckets, so every quantile
+it reports is within a fixed relative error of the true value, recording is a
+log and a dict increment, and two sketches merge by adding bucket counts. That
+makes them cheap on the request path and exact to combine across workers.
+
+``WindowedSketch`` keeps one sketch per time slot to answer "p95 over the last
+1m/5m/1h" without keeping raw samples. It records by appending to a short
+buffer that is folded into the current slot a batch at a time.
+"""
+import math
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_log = math.log
+_ceil = math.ceil
+
+# Relative accuracy of reported quantiles (1% => p99 of 200ms is within 198-202ms)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Values at or below this are counted as zero
+MIN_TRACKED_VALUE = 1e-9
+
+# Time windows exposed by WindowedSketch, in seconds
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+SLOT_SECONDS = 10
+# Values WindowedSketch buffers before folding them into the current slot
+FOLD_BATCH = 1024
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative-error guarantees."""
+
+    __slots__ = ("relative_accuracy", "gamma", "_multiplier", "bins", "zero_count", "count", "sum", "min", "max")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._multiplier = 1 / math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value > MIN_TRACKED_VALUE:
+            key = _ceil(_log(value) * self._multiplier)
+            bins = self.bins
+            bins[key] = bins.get(key, 0) + 1
+        else:
+            self.zero_count += 1
+
+    def add_many(self, values: Sequence[float]):
+        """Record a batch of values; much cheaper per value than ``add`` for large batches."""
+        if not len(values):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        tracked = values[values > MIN_TRACKED_VALUE]
+        self.zero_count += len(values) - len(tracked)
+        if not len(tracked):
+            return
+        keys = np.ceil(np.log(tracked) * self._multiplier).astype(np.int64)
+        lowest = int(keys.min())
+        counts = np.bincount(keys - lowest)
+        present = np.flatnonzero(counts)
+        bins = self.bins
+        for key, count in zip((present + lowest).tolist(), counts[present].tolist()):
+            bins[key] = bins.get(key, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile ``q`` in [0, 1], or None if the sketch is empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(key-1), gamma^key] in relative terms
+                value = 2 * self.gamma ** key / (1 + self.gamma)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def count_at_most(self, bound: float) -> int:
+        """Approximate number of values <= ``bound`` (exact up to bucket width)."""
+        if bound <= MIN_TRACKED_VALUE:
+            return self.zero_count if bound >= 0 else 0
+        limit = _ceil(_log(bound) * self._multiplier)
+        return self.zero_count + sum(count for key, count in self.bins.items() if key <= limit)
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def average(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "bins": {str(key): count for key, count in self.bins.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DDSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.bins = {int(key): count for key, count in data["bins"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+    @classmethod
+    def merged(cls, sketches: Iterable["DDSketch"]) -> "DDSketch":
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+
+class WindowViews:
+    """Read-only per-window sketches, e.g. merged from several workers' snapshots."""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self._views = {name: DDSketch(relative_accuracy) for name in (*WINDOWS, "all")}
+
+    def merge_views(self, data: Dict[str, Dict]):
+        for name, sketch in data.items():
+            self._views[name].merge(DDSketch.from_dict(sketch))
+
+    @property
+    def total(self) -> DDSketch:
+        return self._views["all"]
+
+    def view(self, name: str) -> DDSketch:
+        return self._views[name]
+
+    def views(self) -> Dict[str, DDSketch]:
+        return self._views
+
+
+class WindowedSketch:
+    """A sketch per ``SLOT_SECONDS`` slot, covering the longest window.
+
+    Recording reads the clock once and appends to a buffer, which is folded
+    into the current slot every ``FOLD_BATCH`` values, when the slot changes
+    and before any read. Views over a window merge the slots it covers, so
+    the cost is paid when metrics are read. Slots that age out are folded
+    into an ``expired`` sketch for the all-time view.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, clock=time.monotonic):
+        self.relative_accuracy = relative_accuracy
+        self.clock = clock
+        self.expired = DDSketch(relative_accuracy)
+        self._slots = deque()  # (slot number, DDSketch), oldest first
+        self._max_slots = max(WINDOWS.values()) // SLOT_SECONDS
+        self._slot_end = -math.inf
+        self._current: Optional[DDSketch] = None
+        self._pending: List[float] = []
+
+    def add(self, value: float):
+        # On every request's path: one clock read and an append
+        now = self.clock()
+        if now >= self._slot_end:
+            self._rotate(now)
+        pending = self._pending
+        pending.append(value)
+        if len(pending) >= FOLD_BATCH:
+            self._fold()
+
+    def _fold(self):
+        if self._pending:
+            self._current.add_many(self._pending)
+            self._pending.clear()
+
+    def _rotate(self, now: float):
+        # Buffered values belong to the slot they were recorded in
+        self._fold()
+        slot = int(now // SLOT_SECONDS)
+        self._slot_end = (slot + 1) * SLOT_SECONDS
+        self._current = DDSketch(self.relative_accuracy)
+        self._slots.append((slot, self._current))
+        while self._slots and self._slots[0][0] <= slot - self._max_slots:
+            self.expired.merge(self._slots.popleft()[1])
+
+    @property
+    def total(self) -> DDSketch:
+        self._fold()
+        return DDSketch.merged([self.expired, *(sketch for _, sketch in self._slots)])
+
+    def window(self, seconds: int) -> DDSketch:
+        """Merged sketch of the values recorded in the last ``seconds``."""
+        self._fold()
+        oldest = int(self.clock() // SLOT_SECONDS) - seconds // SLOT_SECONDS
+        return DDSketch.merged(sketch for slot, sketch in self._slots if slot > oldest)
+
+    def view(self, name: str) -> DDSketch:
+        """Sketch for one named window, or ``all``."""
+        return self.total if name == "all" else self.window(WINDOWS[name])
+
+    def views(self) -> Dict[str, DDSketch]:
+        """One sketch per named window plus ``all`` for everything recorded."""
+        views = {name: self.window(seconds) for name, seconds in WINDOWS.items()}
+        views["all"] = self.total
+        return views
@@ -0,0 +1,215 @@
+"""
+History-aware query condensation for retrieval.
+
+Only the latest question used to be embedded, so a follow-up such as "what
+about on Android?" retrieved unrelated chunks. Follow-ups are now rewritten
+into a standalone question using the recent conversation.
+
+The rewrite is an extra model call, so it is kept off the critical path as
+far as possible:
+
+* first turns (no history) skip it;
+* rewrites are cached per (recent history, question) fingerprint;
+* retrieval for the raw question starts immediately and runs concurrently
+  with the rewrite and the retrieval for the rewritten question; the result
+  set with the higher relevance wins, and the rewrite is abandoned after
+  ``QUERY_CONDENSE_TIMEOUT_SECONDS``;
+* it can run on a deployment of its own (``QUERY_CONDENSE_DEPLOYMENT``), as
+  a reasoning chat model spends most of a small token budget thinking. On a
+  reasoning model it asks for low effort and a budget that leaves room for
+  the answer.
+"""
+import os
+import time
+import asyncio
+import re
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+from app.services.cache_service import normalize_text
+from app.services.monitoring import metrics
+from app.services.pipeline_timing import report_stage
+
+logger = logging.getLogger(__name__)
+
+QUERY_CONDENSE_ENABLED = os.getenv("QUERY_CONDENSE_ENABLED", "true").lower() == "true"
+# Longest the raw question's results wait for a rewrite
+QUERY_CONDENSE_TIMEOUT_SECONDS = float(os.getenv("QUERY_CONDENSE_TIMEOUT_SECONDS", "2"))
+# Recent messages given to the rewriter
+QUERY_CONDENSE_HISTORY_MESSAGES = int(os.getenv("QUERY_CONDENSE_HISTORY_MESSAGES", "6"))
+QUERY_CONDENSE_MAX_TOKENS = int(os.getenv("QUERY_CONDENSE_MAX_TOKENS", "64"))
+# On reasoning models the budget also covers reasoning tokens
+QUERY_CONDENSE_REASONING_MAX_TOKENS = int(os.getenv("QUERY_CONDENSE_REASONING_MAX_TOKENS", "1024"))
+# Azure deployment (and model) used for rewrites; empty uses the chat deployment.
+# A small non-reasoning model (e.g. gpt-4o-mini) is fastest.
+QUERY_CONDENSE_DEPLOYMENT = os.getenv("QUERY_CONDENSE_DEPLOYMENT", "")
+QUERY_CONDENSE_MODEL_NAME = os.getenv("QUERY_CONDENSE_MODEL_NAME", "")
+QUERY_CONDENSE_CACHE_ENTRIES = int(os.getenv("QUERY_CONDENSE_CACHE_ENTRIES", "1000"))
+# Results compared on the mean relevance of this many top documents
+RELEVANCE_TOP_N = 3
+
+Rewriter = Callable[[str, List[BaseMessage]], Awaitable[str]]
+
+
+class QueryCondenser:
+    """Rewrite follow-up questions into standalone ones, with a per-history cache."""
+
+    def __init__(
+        self,
+        rewrite: Rewriter,
+        timeout: float = QUERY_CONDENSE_TIMEOUT_SECONDS,
+        history_messages: int = QUERY_CONDENSE_HISTORY_MESSAGES,
+        cache_entries: int = QUERY_CONDENSE_CACHE_ENTRIES,
+    ):
+        self.rewrite = rewrite
+        self.timeout = timeout
+        self.history_messages = history_messages
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def _cache_key(question: str, history: Sequence[BaseMessage]) -> str:
+        digest = hashlib.sha256()
+        for message in history:
+            digest.update(f"{message.type}\0{normalize_text(str(message.content))}\0".encode("utf-8"))
+        digest.update(normalize_text(question).encode("utf-8"))
+        return digest.hexdigest()
+
+    async def condense(self, question: str, chat_history: Sequence[BaseMessage]) -> Optional[str]:
+        """Standalone form of ``question``, or None for first turns or when rewriting fails."""
+        if not chat_history:
+            return None
+        history = list(chat_history[-self.history_messages:])
+        key = self._cache_key(question, history)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            metrics.record_condensation("cached")
+            return cached
+        try:
+            rewritten = (await asyncio.wait_for(self.rewrite(question, history), timeout=self.timeout)).strip()
+        except asyncio.TimeoutError:
+            metrics.record_condensation("timeout")
+            logger.info(f"Query condensation timed out after {self.timeout:.1f}s, using the raw question")
+            return None
+        except Exception as e:
+            metrics.record_condensation("failed")
+            logger.warning(f"Query condensation failed, using the raw question: {e}")
+            return None
+        if not rewritten:
+            # e.g. a reasoning model that used its whole token budget thinking
+            metrics.record_condensation("empty")
+            logger.warning("Query condensation returned an empty rewrite, using the raw question")
+            return None
+        metrics.record_condensation("rewritten")
+        self._cache[key] = rewritten
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+        return rewritten
+
+
+def mean_relevance(documents: Sequence[Document]) -> Optional[float]:
+    scores = [d.metadata["relevance_score"] for d in documents[:RELEVANCE_TOP_N] if "relevance_score" in d.metadata]
+    return sum(scores) / len(scores) if scores else None
+
+
+def choose_documents(raw: List[Document], condensed: List[Document]) -> List[Document]:
+    """The better of two result sets; the standalone question's unless the raw one scores higher."""
+    raw_score, condensed_score = mean_relevance(raw), mean_relevance(condensed)
+    if raw_score is not None and condensed_score is not None and raw_score > condensed_score:
+        return raw
+    return condensed or raw
+
+
+def make_condensing_retrieval(retriever, condenser: Optional[QueryCondenser]):
+    """Runnable taking the chain input dict and returning documents, for ``create_retrieval_chain``."""
+
+    async def retrieve(inputs: dict, config: RunnableConfig) -> List[Document]:
+        question = inputs["input"]
+        chat_history = inputs.get("chat_history") or []
+        raw = asyncio.ensure_future(retriever.ainvoke(question, config))
+        if condenser is None or not chat_history:
+            return await raw
+
+        started = time.perf_counter()
+        try:
+            standalone = await condenser.condense(question, chat_history)
+        except BaseException:
+            raw.cancel()
+            raise
+        await report_stage(config, "query_condensation", time.perf_counter() - started)
+        if not standalone or normalize_text(standalone) == normalize_text(question):
+            return await raw
+
+        condensed, raw_documents = await asyncio.gather(
+            retriever.ainvoke(standalone, config), raw, return_exceptions=True
+        )
+        # Either search failing (timeout, open breaker) leaves the other's results
+        if isinstance(condensed, BaseException) and isinstance(raw_documents, BaseException):
+            raise raw_documents
+        if isinstance(condensed, BaseException):
+            return raw_documents
+        if isinstance(raw_documents, BaseException):
+            return condensed
+        documents = choose_documents(raw_documents, condensed)
+        logger.debug(
+            f"Retrieved with {'condensed' if documents is condensed else 'raw'} query "
+            f"'{standalone[:100]}' for follow-up '{question[:100]}'"
+        )
+        return documents
+
+    return RunnableLambda(retrieve, name="condensing_retrieval")
+
+
+CONDENSE_SYSTEM_PROMPT = (
+    "Given a conversation between a user and an IT helpdesk assistant and the user's follow-up question, "
+    "rewrite the follow-up as a single standalone question that can be understood without the conversation. "
+    "Keep product names, devices, operating systems and error messages. "
+    "If it is already standalone, return it unchanged. Return only the question."
+)
+
+
+def is_reasoning_model(llm) -> bool:
+    """Whether ``llm`` is an o-series (reasoning) model, whose token budget includes its reasoning."""
+    names = (getattr(llm, "model_name", None), getattr(llm, "deployment_name", None))
+    return any(re.match(r"o\d", name.lower()) for name in names if isinstance(name, str))
+
+
+def make_llm_rewriter(
+    llm,
+    breaker=None,
+    max_tokens: int = QUERY_CONDENSE_MAX_TOKENS,
+    reasoning_max_tokens: int = QUERY_CONDENSE_REASONING_MAX_TOKENS,
+) -> Rewriter:
+    """Rewriter backed by a chat model, optionally behind a circuit breaker."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", CONDENSE_SYSTEM_PROMPT),
+        ("human", "Conversation:\n{history}\n\nFollow-up question: {question}"),
+    ])
+    if is_reasoning_model(llm):
+        bound = llm.bind(reasoning_effort="low", max_tokens=reasoning_max_tokens)
+    else:
+        bound = llm.bind(max_tokens=max_tokens)
+    chain = prompt | bound | StrOutputParser()
+    # Not part of the answer's run: keeps its tokens out of the request's timing callbacks
+    isolated = {"callbacks": []}
+
+    async def rewrite(question: str, history: List[BaseMessage]) -> str:
+        inputs = {
+            "history": get_buffer_string(history, human_prefix="User", ai_prefix="Assistant"),
+            "question": question,
+        }
+        if breaker is not None:
+            return await breaker.acall(chain.ainvoke, inputs, isolated)
+        return await chain.ainvoke(inputs, isolated)
+
+    return rewrite
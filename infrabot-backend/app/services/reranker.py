@@ -0,0 +1,206 @@
+"""
+Over-fetch and rerank for retrieval.
+
+Raw vector similarity is a coarse ranking, so instead of taking its top 5
+the retriever fetches ``RERANK_FETCH_K`` candidates and this stage rescores
+them locally, keeping ``RERANK_TOP_N`` for the prompt.
+
+Scoring runs in batches on a small dedicated thread pool. By default it uses
+cheap lexical features (query term and bigram coverage combined with the
+retriever's score). If ``RERANK_MODEL`` names a cross-encoder and
+sentence-transformers is installed, that model is used instead; it is loaded
+when the retriever is built, and a query arriving before it is ready keeps
+the retrieval order rather than waiting for it. Reranking has a latency
+budget: if scoring does not finish within ``RERANK_BUDGET_SECONDS`` the
+candidates are used in retrieval order.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from pydantic import ConfigDict
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.lexical_index import tokenize
+from app.services.pipeline_timing import report_stage
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+# Candidates fetched from retrieval, and how many are kept after reranking
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+# Optional cross-encoder (needs sentence-transformers), e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "2"))
+# Longest reranking may take before the retrieval order is used
+RERANK_BUDGET_SECONDS = float(os.getenv("RERANK_BUDGET_SECONDS", "0.3"))
+
+# Weights of the lexical feature scorer
+RELEVANCE_WEIGHT = 0.45
+COVERAGE_WEIGHT = 0.4
+BIGRAM_WEIGHT = 0.15
+
+_rerank_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_rerank_executor() -> ThreadPoolExecutor:
+    """Shared thread pool for reranking."""
+    global _rerank_executor
+    with _executor_lock:
+        if _rerank_executor is None:
+            _rerank_executor = ThreadPoolExecutor(max_workers=RERANK_THREADS, thread_name_prefix="rerank")
+        return _rerank_executor
+
+
+class LexicalFeatureScorer:
+    """Scores candidates by query term and bigram coverage plus the retriever's relevance."""
+
+    name = "lexical"
+
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        terms = tokenize(query)
+        query_terms = set(terms)
+        query_bigrams = set(zip(terms, terms[1:]))
+        scores = []
+        for document in documents:
+            words = tokenize(document.page_content)
+            coverage = len(query_terms & set(words)) / len(query_terms) if query_terms else 0.0
+            bigrams = len(query_bigrams & set(zip(words, words[1:]))) / len(query_bigrams) if query_bigrams else 0.0
+            relevance = float(document.metadata.get("relevance_score", 0.0))
+            scores.append(RELEVANCE_WEIGHT * relevance + COVERAGE_WEIGHT * coverage + BIGRAM_WEIGHT * bigrams)
+        return scores
+
+
+class CrossEncoderScorer:
+    """Scores (query, chunk) pairs with a sentence-transformers cross-encoder on CPU."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+
+        self.name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        pairs = [(query, document.page_content) for document in documents]
+        return [float(score) for score in self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+_scorer_loading = False
+
+
+def get_scorer():
+    """The configured scorer; the lexical one if the cross-encoder cannot be loaded."""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            if RERANK_MODEL:
+                try:
+                    _scorer = CrossEncoderScorer(RERANK_MODEL)
+                    logger.info(f"Reranking with cross-encoder '{RERANK_MODEL}'")
+                except Exception as e:
+                    logger.warning(f"Cross-encoder '{RERANK_MODEL}' unavailable, reranking with lexical features: {e}")
+            if _scorer is None:
+                _scorer = LexicalFeatureScorer()
+        return _scorer
+
+
+def start_scorer_load(executor) -> None:
+    """Load the configured scorer on ``executor`` unless that has already started."""
+    global _scorer_loading
+    with _scorer_lock:
+        if _scorer is not None or _scorer_loading:
+            return
+        _scorer_loading = True
+    executor.submit(get_scorer)
+
+
+class Reranker:
+    """Batched, budgeted rescoring of retrieval candidates."""
+
+    def __init__(
+        self,
+        scorer=None,
+        top_n: int = RERANK_TOP_N,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget: float = RERANK_BUDGET_SECONDS,
+        executor=None,
+    ):
+        self.scorer = scorer
+        self.top_n = top_n
+        self.batch_size = max(1, batch_size)
+        self.budget = budget
+        self.executor = executor
+
+    def _ranked(self, documents: List[Document], scores: List[float]) -> List[Document]:
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:self.top_n]
+        ranked = []
+        for i in order:
+            documents[i].metadata["rerank_score"] = scores[i]
+            ranked.append(documents[i])
+        return ranked
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """Synchronous reranking, without a budget."""
+        if len(documents) <= 1:
+            return documents[:self.top_n]
+        scorer = self.scorer or get_scorer()
+        return self._ranked(documents, scorer.score(query, documents))
+
+    async def arerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """Rerank within the latency budget; the retrieval order is kept if it runs out."""
+        if len(documents) <= 1:
+            return documents[:self.top_n]
+        loop = asyncio.get_running_loop()
+        executor = self.executor or get_rerank_executor()
+        scorer = self.scorer or _scorer
+        if scorer is None:
+            # Loading a cross-encoder takes far longer than the budget
+            start_scorer_load(executor)
+            logger.info("Reranking model is still loading, using retrieval order")
+            return documents[:self.top_n]
+        batches = [documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        futures = [loop.run_in_executor(executor, scorer.score, query, batch) for batch in batches]
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*futures), timeout=self.budget)
+        except asyncio.TimeoutError:
+            logger.info(f"Reranking exceeded its {self.budget:.2f}s budget, using retrieval order")
+            return documents[:self.top_n]
+        except Exception as e:
+            logger.warning(f"Reranking failed, using retrieval order: {e}")
+            return documents[:self.top_n]
+        return self._ranked(documents, [score for batch in results for score in batch])
+
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetches from ``base`` and keeps the reranker's top candidates."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base: BaseRetriever
+    reranker: Reranker
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.base.invoke(query, {"callbacks": run_manager.get_child()})
+        return self.reranker.rerank(query, documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = await self.base.ainvoke(query, {"callbacks": run_manager.get_child()})
+        started = time.perf_counter()
+        ranked = await self.reranker.arerank(query, documents)
+        await report_stage(run_manager, "rerank", time.perf_counter() - started)
+        return ranked
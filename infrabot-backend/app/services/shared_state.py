@@ -0,0 +1,130 @@
+"""
+State shared between uvicorn worker processes.
+
+Each worker keeps its own chain, caches and metrics in memory. What must be
+consistent across them goes through small JSON files in ``SHARED_STATE_DIR``
+(a pod-local directory): the knowledge base version, which tells workers to
+rebind to a new collection after an ingest or rollback, and per-worker
+metrics snapshots that are merged when metrics are read.
+
+This module only uses the standard library so the entrypoint can import it to
+size the worker pool without loading the app.
+"""
+import os
+import json
+import math
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_DIR = Path(os.getenv("SHARED_STATE_DIR", "./.cache/shared"))
+# How often each worker publishes its metrics and checks the knowledge base version
+SHARED_STATE_SYNC_SECONDS = float(os.getenv("SHARED_STATE_SYNC_SECONDS", "2"))
+# Snapshots older than this belong to workers that have exited
+METRICS_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("METRICS_SNAPSHOT_MAX_AGE_SECONDS", "30"))
+
+KB_VERSION_FILE = "kb_version.json"
+METRICS_DIR = "metrics"
+
+
+def write_json_atomic(path: Path, payload: Dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable shared state file {path}: {e}")
+        return None
+
+
+def publish_kb_version(collection_name: Optional[str], state_dir: Path = SHARED_STATE_DIR) -> int:
+    """Record that the knowledge base changed, so every worker reloads its chain."""
+    version = time.time_ns()
+    write_json_atomic(
+        state_dir / KB_VERSION_FILE,
+        {"version": version, "collection_name": collection_name, "pid": os.getpid()},
+    )
+    logger.info(f"Published knowledge base version {version} (collection '{collection_name}')")
+    return version
+
+
+def read_kb_version(state_dir: Path = SHARED_STATE_DIR) -> Optional[int]:
+    data = read_json(state_dir / KB_VERSION_FILE)
+    return data.get("version") if data else None
+
+
+def write_metrics_snapshot(snapshot: Dict[str, Any], state_dir: Path = SHARED_STATE_DIR):
+    write_json_atomic(state_dir / METRICS_DIR / f"{os.getpid()}.json", snapshot)
+
+
+def remove_metrics_snapshot(state_dir: Path = SHARED_STATE_DIR):
+    try:
+        (state_dir / METRICS_DIR / f"{os.getpid()}.json").unlink()
+    except FileNotFoundError:
+        pass
+
+
+def read_metrics_snapshots(
+    state_dir: Path = SHARED_STATE_DIR, max_age: float = METRICS_SNAPSHOT_MAX_AGE_SECONDS
+) -> List[Dict[str, Any]]:
+    """Fresh snapshots from every worker; stale ones are deleted."""
+    snapshots = []
+    now = time.time()
+    for path in sorted((state_dir / METRICS_DIR).glob("*.json")):
+        try:
+            if now - path.stat().st_mtime > max_age:
+                path.unlink()
+                continue
+        except FileNotFoundError:
+            continue
+        snapshot = read_json(path)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def cpu_limit() -> float:
+    """CPUs available to this container: the cgroup quota if set, else the affinity mask."""
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        limit, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            limit = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+            period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    return min(available, quota) if quota else float(available)
+
+
+def default_worker_count() -> int:
+    """Uvicorn workers for this pod: one per whole CPU of the limit, at least one."""
+    configured = os.getenv("UVICORN_WORKERS", "auto")
+    if configured != "auto":
+        return max(1, int(configured))
+    return max(1, math.floor(cpu_limit()))
+
+
+if __name__ == "__main__":
+    print(default_worker_count())
@@ -0,0 +1,85 @@
+"""
+Local token counting for prompt budgeting.
+
+Uses tiktoken with the encoding of the configured chat model. tiktoken fetches
+its BPE file on first use (the Docker image pre-fetches it into
+``TIKTOKEN_CACHE_DIR``); if it cannot be loaded, counts fall back to a
+character-based estimate so budgeting keeps working, only less precisely.
+"""
+import os
+import logging
+import threading
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+# Used when the model name is unknown to tiktoken
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tiktoken encoding for the chat model, or None if it cannot be loaded."""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                model_name = os.getenv("OPENAI_MODEL_NAME")
+                try:
+                    _encoding = tiktoken.encoding_for_model(model_name) if model_name else None
+                except KeyError:
+                    _encoding = None
+                if _encoding is None:
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating token counts from length: {e}")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Tokens a list of chat messages adds to a prompt."""
+    return sum(count_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of ``text`` within ``max_tokens``."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        return text[: (max_tokens - 1) * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def encoding_name() -> Optional[str]:
+    encoding = get_encoding()
+    return encoding.name if encoding is not None else None
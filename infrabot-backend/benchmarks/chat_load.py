@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Replay load test for /api/chat.
+
+Replays a trace of recorded chat requests (prompt and history) at a target
+rate, with open-loop arrivals: each request is sent at its scheduled time
+whether or not earlier ones have finished, and latencies are measured from
+that time, so a slow server shows up as latency rather than as a lower rate.
+
+By default the app is served by uvicorn on a loopback port in this process,
+on local stand-ins (``stand_ins.py``): a fake streaming chat model with the
+given time to first token and token rate, hash embeddings and the embedded
+vector store, so no Azure quota or Milvus is used. ``--url`` sends the same
+load to a running server instead.
+
+Reports time to first token, total latency, per-request tokens/s (after the
+first token), throughput and errors by kind. ``--max-p95-ttft``,
+``--max-p99-latency`` and ``--max-error-rate`` make it exit non-zero when a
+budget is exceeded, for use as a pre-deploy check.
+
+    python benchmarks/chat_load.py --qps 20 --duration 30
+    python benchmarks/chat_load.py --traces benchmarks/chat_traces.jsonl --qps 50 --duration 60 \\
+        --ttft 0.4 --token-rate 40 --max-p95-ttft 1.0 --max-error-rate 0.01
+    python benchmarks/chat_load.py --url http://localhost:8000 --traces traces.jsonl --qps 5 --duration 60
+
+Traces are JSON lines with a "prompt", an optional "history" (list of
+{"role", "content"}) and an optional "client" (sent as X-Forwarded-For, so
+per-client rate limits apply as they would in production). Requests without a
+client are spread over ``--clients`` addresses.
+"""
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stand_ins import QUESTIONS, StandInConfig, stand_ins  # noqa: E402
+from app.services.tokens import count_tokens  # noqa: E402
+
+
+@dataclass
+class Trace:
+    prompt: str
+    history: List[Dict[str, str]] = field(default_factory=list)
+    client: Optional[str] = None
+
+
+@dataclass
+class Result:
+    scheduled: float
+    status: Optional[int] = None
+    error: Optional[str] = None
+    ttft: Optional[float] = None
+    latency: Optional[float] = None
+    tokens: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        streaming = (self.latency or 0) - (self.ttft or 0)
+        return self.tokens / streaming if self.ok and self.tokens > 1 and streaming > 0 else None
+
+
+def load_traces(path: Path) -> List[Trace]:
+    traces = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            record = json.loads(line)
+            traces.append(Trace(record["prompt"], record.get("history", []), record.get("client")))
+    return traces
+
+
+QUESTION_SUFFIXES = ["", " on my laptop", " since this morning", " after the latest update", " when working from home"]
+
+
+def synthetic_traces(count: int, seed: int) -> List[Trace]:
+    """Helpdesk questions with some variation, a third of them follow-ups with a short history."""
+    rng = random.Random(seed)
+    traces = []
+    for _ in range(count):
+        history = []
+        if rng.random() < 1 / 3:
+            previous = rng.choice(QUESTIONS)
+            history = [
+                {"role": "user", "content": previous},
+                {"role": "assistant", "content": "Open the self-service portal and follow the prompts."},
+            ]
+        traces.append(Trace(rng.choice(QUESTIONS) + rng.choice(QUESTION_SUFFIXES), history))
+    return traces
+
+
+def arrival_offsets(qps: float, duration: float, poisson: bool, seed: int) -> List[float]:
+    """Send times (seconds from start) for ``qps`` requests per second over ``duration``."""
+    rng = random.Random(seed)
+    offsets, now = [], 0.0
+    while True:
+        now += rng.expovariate(qps) if poisson else 1.0 / qps
+        if now >= duration:
+            return offsets
+        offsets.append(now)
+
+
+async def send(client, trace: Trace, client_id: str, scheduled: float, timeout: float) -> Result:
+    result = Result(scheduled=scheduled)
+    body = {"prompt": trace.prompt, "history": trace.history}
+    chunks = []
+    try:
+        async with client.stream(
+            "POST", "/api/chat", json=body, headers={"X-Forwarded-For": trace.client or client_id}, timeout=timeout
+        ) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                result.error = f"http_{response.status_code}"
+                await response.aread()
+                return result
+            async for chunk in response.aiter_text():
+                if chunk and result.ttft is None:
+                    result.ttft = time.perf_counter() - scheduled
+                chunks.append(chunk)
+        result.latency = time.perf_counter() - scheduled
+        answer = "".join(chunks)
+        # The endpoint reports failures after the 200 in-band
+        if answer.startswith("ERROR:") or "\nERROR:" in answer or not answer:
+            result.error = "stream_error" if answer else "empty_answer"
+        result.tokens = count_tokens(answer)
+    except Exception as e:
+        result.error = type(e).__name__
+    return result
+
+
+async def run_load(client, traces: List[Trace], offsets: List[float], clients: int, timeout: float) -> List[Result]:
+    started = time.perf_counter()
+    tasks = []
+    for position, offset in enumerate(offsets):
+        scheduled = started + offset
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        trace = traces[position % len(traces)]
+        client_id = f"10.{position % clients // 65536 % 256}.{position % clients // 256 % 256}.{position % clients % 256}"
+        tasks.append(asyncio.create_task(send(client, trace, client_id, scheduled, timeout)))
+    return await asyncio.gather(*tasks)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+def summarize(results: List[Result], send_seconds: float, wall_seconds: float) -> Dict:
+    """Percentiles over successful requests; throughput over the whole run, until the last answer."""
+    ok = [r for r in results if r.ok]
+    rates = [r.tokens_per_second for r in ok if r.tokens_per_second]
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "error_rate": (len(results) - len(ok)) / max(1, len(results)),
+        "errors": dict(Counter(r.error for r in results if not r.ok)),
+        "offered_qps": len(results) / send_seconds if send_seconds else 0.0,
+        "completed_qps": len(ok) / wall_seconds if wall_seconds else 0.0,
+        "ttft_seconds": percentiles([r.ttft for r in ok if r.ttft is not None]),
+        "latency_seconds": percentiles([r.latency for r in ok]),
+        "tokens_per_second": percentiles(rates),
+        "output_tokens_per_second": sum(r.tokens for r in ok) / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def report(summary: Dict):
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else "       -"
+
+    print(
+        f"requests:           {summary['requests']} sent at {summary['offered_qps']:.1f}/s, "
+        f"{summary['succeeded']} ok ({summary['completed_qps']:.1f}/s)"
+    )
+    print(f"error rate:         {summary['error_rate']:.2%} {summary['errors'] or ''}")
+    print(f"{'':19s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for label, key in (("ttft ms", "ttft_seconds"), ("latency ms", "latency_seconds")):
+        values = summary[key]
+        print(f"{label:19s} {ms(values['p50'])} {ms(values['p95'])} {ms(values['p99'])}")
+    rates = summary["tokens_per_second"]
+    print(f"{'tokens/s/request':19s} " + " ".join(
+        f"{rates[q]:8.1f}" if rates[q] is not None else "       -" for q in ("p50", "p95", "p99")
+    ))
+    print(f"output tokens/s:    {summary['output_tokens_per_second']:.1f}")
+
+
+def budget_failures(summary: Dict, args) -> List[str]:
+    failures = []
+    ttft, latency = summary["ttft_seconds"]["p95"], summary["latency_seconds"]["p99"]
+    if args.max_p95_ttft is not None and (ttft is None or ttft > args.max_p95_ttft):
+        failures.append(f"p95 TTFT {ttft}s exceeds {args.max_p95_ttft}s")
+    if args.max_p99_latency is not None and (latency is None or latency > args.max_p99_latency):
+        failures.append(f"p99 latency {latency}s exceeds {args.max_p99_latency}s")
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {summary['error_rate']:.2%} exceeds {args.max_error_rate:.2%}")
+    return failures
+
+
+@contextmanager
+def serve(app):
+    """Serve ``app`` with uvicorn on a free loopback port from a background thread; yields its URL."""
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, lifespan="off", log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, name="chat-load-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+async def run(args, traces: List[Trace], url: str) -> Dict:
+    import httpx
+
+    offsets = arrival_offsets(args.qps, args.duration, not args.uniform, args.seed)
+    # Open loop: requests are paced by their schedule, never queued for a connection
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    headers = {} if args.gzip else {"Accept-Encoding": "identity"}
+    async with httpx.AsyncClient(base_url=url, limits=limits, headers=headers) as client:
+        if args.warmup:
+            await run_load(client, traces, arrival_offsets(args.qps, args.warmup, False, args.seed), args.clients, args.timeout)
+        started = time.perf_counter()
+        results = await run_load(client, traces, offsets, args.clients, args.timeout)
+        return summarize(results, offsets[-1] if offsets else 0.0, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traces", type=Path, help="JSON lines of recorded requests (default: synthetic)")
+    parser.add_argument("--qps", type=float, default=10.0, help="Target request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of load before measuring")
+    parser.add_argument("--uniform", action="store_true", help="Evenly spaced instead of Poisson arrivals")
+    parser.add_argument("--clients", type=int, default=1000, help="Client addresses for traces without one")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (s)")
+    parser.add_argument("--gzip", action="store_true", help="Accept gzip like a browser does")
+    parser.add_argument("--url", help="Load a running server instead of the in-process app on stand-ins")
+    parser.add_argument("--seed", type=int, default=0)
+    stand_in = parser.add_argument_group("stand-ins (in-process only)")
+    stand_in.add_argument("--ttft", type=float, default=0.3, help="Chat model time to first token (s)")
+    stand_in.add_argument("--token-rate", type=float, default=50.0, help="Chat model tokens per second")
+    stand_in.add_argument("--answer-tokens", type=int, default=120)
+    stand_in.add_argument("--llm-failure-rate", type=float, default=0.0)
+    stand_in.add_argument("--embed-latency", type=float, default=0.02, help="Embedding call latency (s)")
+    stand_in.add_argument("--chunks", type=int, default=2000, help="Synthetic corpus size")
+    stand_in.add_argument("--no-semantic-cache", action="store_true")
+    budgets = parser.add_argument_group("budgets (exit 1 when exceeded)")
+    budgets.add_argument("--max-p95-ttft", type=float)
+    budgets.add_argument("--max-p99-latency", type=float)
+    budgets.add_argument("--max-error-rate", type=float)
+    parser.add_argument("--output", type=Path, help="Also write the summary as JSON")
+    args = parser.parse_args()
+
+    traces = load_traces(args.traces) if args.traces else synthetic_traces(500, args.seed)
+    if args.url:
+        summary = asyncio.run(run(args, traces, args.url))
+    else:
+        config = StandInConfig(
+            ttft_seconds=args.ttft,
+            tokens_per_second=args.token_rate,
+            answer_tokens=args.answer_tokens,
+            failure_rate=args.llm_failure_rate,
+            embedding_latency_seconds=args.embed_latency,
+            corpus_chunks=args.chunks,
+            semantic_cache=not args.no_semantic_cache,
+            seed=args.seed,
+        )
+        with stand_ins(config) as app, serve(app) as url:
+            summary = asyncio.run(run(args, traces, url))
+
+    print(f"{len(traces)} traces at {args.qps:g} req/s for {args.duration:g}s")
+    report(summary)
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    failures = budget_failures(summary, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Footprint/latency/recall benchmark for shortened and quantized embeddings.
+
+Takes the full-size vectors of the served collection, shortens them to each
+``--dimensions`` value (text-embedding-3 vectors are Matryoshka-trained: the
+first d components, re-normalised, equal what the API returns for
+``dimensions=d``) and builds a scratch collection per dimension and
+``--index`` setting. Each is searched with the saved query set:
+
+* recall@k against exact search at full size, so both the shortening and the
+  quantization losses show;
+* the same with rescoring: ``--rescore-factor`` times more candidates are
+  fetched and re-ranked by exact distance on the stored float vectors, as the
+  retriever does with ``MILVUS_RESCORE_FACTOR``;
+* per-query latency (p50/p99) with and without rescoring;
+* estimated index memory.
+
+    python benchmarks/embedding_footprint.py --queries queries.txt \\
+        --dimensions 256 --dimensions 512 --dimensions 1024 \\
+        --index HNSW --index IVF_SQ8:nlist=256 --index IVF_PQ:nlist=256,m=16 --rescore-factor 4
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.index_config import DEFAULT_BUILD_PARAMS, IndexConfig, collection_index, distances  # noqa: E402
+from index_recall import build_collection, exact_top_k, load_queries, load_vectors, parse_spec, recall_at_k  # noqa: E402
+
+
+def shorten(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Matryoshka shortening: keep the first components and re-normalise."""
+    short = vectors[:, :dimensions]
+    return short / np.linalg.norm(short, axis=1, keepdims=True)
+
+
+def estimate_index_bytes(index_type: str, params: Dict, count: int, dimensions: int) -> int:
+    """Approximate in-memory size of a vector index (codes and graph links, not raw data kept on disk)."""
+    params = {**DEFAULT_BUILD_PARAMS.get(index_type, {}), **params}
+    if index_type == "IVF_SQ8":
+        return count * dimensions + params["nlist"] * dimensions * 4
+    if index_type == "IVF_PQ":
+        codebooks = params["m"] * (2 ** params["nbits"]) * (dimensions // params["m"]) * 4
+        return count * params["m"] * params["nbits"] // 8 + codebooks + params["nlist"] * dimensions * 4
+    raw = count * dimensions * 4
+    if index_type == "HNSW":
+        return raw + count * params["M"] * 2 * 4
+    if index_type in ("IVF_FLAT",):
+        return raw + params["nlist"] * dimensions * 4
+    return raw
+
+
+def search(client, name: str, vector: np.ndarray, limit: int, search_params: Dict) -> List[str]:
+    hits = client.search(name, data=[vector.tolist()], limit=limit, search_params=search_params, output_fields=["pk"])
+    return [str(hit["id"]) for hit in hits[0]]
+
+
+def rescored_search(client, name: str, vector: np.ndarray, k: int, factor: int, search_params: Dict, metric: str):
+    """Fetch ``k * factor`` candidates, then keep the k closest by exact distance on their stored vectors."""
+    candidates = search(client, name, vector, k * factor, search_params)
+    rows = client.get(name, ids=candidates, output_fields=["vector"])
+    stored = {str(row["pk"]): row["vector"] for row in rows}
+    exact = distances(vector, [stored[c] for c in candidates], metric)[0]
+    return [candidates[i] for i in exact.argsort()[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=Path, required=True)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--collection", help="Source collection with full-size vectors (default: the active version)")
+    parser.add_argument("--dimensions", type=int, action="append", default=[], help="Shortened size, repeatable")
+    parser.add_argument("--index", action="append", default=[], help="TYPE:params to build, repeatable")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the query set for latency")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    from app.services.ingest_service import get_milvus_client, init_embeddings, resolve_active_collection
+
+    client = get_milvus_client()
+    source = args.collection or resolve_active_collection()
+    metric = (collection_index(client, source) or {"metric_type": "L2"})["metric_type"]
+    ids, vectors = load_vectors(client, source)
+    full_size = vectors.shape[1]
+    queries = load_queries(args.queries)
+    query_vectors = np.asarray(init_embeddings(dimensions=full_size).embed_documents(queries), dtype=np.float32)
+    truth = [[ids[i] for i in row] for row in exact_top_k(vectors, query_vectors, args.k, metric)]
+    print(f"{len(vectors)} vectors of dimension {full_size} from '{source}', {len(queries)} queries, k={args.k}")
+
+    rows, scratch = [], []
+    try:
+        for dimensions in args.dimensions or [full_size]:
+            short_vectors = shorten(vectors, dimensions) if dimensions < full_size else vectors
+            short_queries = shorten(query_vectors, dimensions) if dimensions < full_size else query_vectors
+            for position, spec in enumerate(args.index or ["HNSW"]):
+                index_type, params = parse_spec(spec)
+                config = IndexConfig(index_type=index_type, metric_type=metric, build_params=params, search_overrides={})
+                name = f"{source}_footprint_{dimensions}_{position}"
+                scratch.append(name)
+                print(f"Building {dimensions} dimensions, {config.describe()} ...")
+                build_seconds = build_collection(client, name, ids, short_vectors, config)
+                search_params = config.search_params()
+
+                plain, rescored, plain_ms, rescored_ms = [], [], [], []
+                for _ in range(args.repeat):
+                    plain, rescored = [], []
+                    for vector in short_queries:
+                        started = time.perf_counter()
+                        plain.append(search(client, name, vector, args.k, search_params))
+                        plain_ms.append((time.perf_counter() - started) * 1000)
+                        started = time.perf_counter()
+                        rescored.append(rescored_search(
+                            client, name, vector, args.k, args.rescore_factor, search_params, metric
+                        ))
+                        rescored_ms.append((time.perf_counter() - started) * 1000)
+
+                rows.append({
+                    "dimensions": dimensions,
+                    "index": f"{index_type} {json.dumps(config.index_params()['params'])}",
+                    "index_mb": estimate_index_bytes(index_type, params, len(ids), dimensions) / 2**20,
+                    "build_seconds": build_seconds,
+                    "recall": recall_at_k(plain, truth),
+                    "recall_rescored": recall_at_k(rescored, truth),
+                    "p50_ms": float(np.percentile(plain_ms, 50)),
+                    "p99_ms": float(np.percentile(plain_ms, 99)),
+                    "p50_rescored_ms": float(np.percentile(rescored_ms, 50)),
+                    "p99_rescored_ms": float(np.percentile(rescored_ms, 99)),
+                })
+    finally:
+        if not args.keep:
+            for name in scratch:
+                if client.has_collection(name):
+                    client.drop_collection(name)
+
+    print(
+        f"{'dims':>5s} {'index':36s} {'est MB':>8s} {'build s':>8s} {'recall':>7s} {'rescored':>8s} "
+        f"{'p50 ms':>7s} {'p99 ms':>7s} {'p50 rs':>7s} {'p99 rs':>7s}"
+    )
+    for row in rows:
+        print(
+            f"{row['dimensions']:5d} {row['index']:36s} {row['index_mb']:8.1f} {row['build_seconds']:8.1f} "
+            f"{row['recall']:7.3f} {row['recall_rescored']:8.3f} {row['p50_ms']:7.2f} {row['p99_ms']:7.2f} "
+            f"{row['p50_rescored_ms']:7.2f} {row['p99_rescored_ms']:7.2f}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
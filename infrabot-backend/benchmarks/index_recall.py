@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Recall/latency benchmark for Milvus index settings.
+
+Copies the vectors of the active collection (or ``--collection``) into scratch
+collections built with each ``--index`` setting, then runs a saved query set
+against each with every matching ``--search`` setting. Recall@k is measured
+against exact (brute-force NumPy) search over the same vectors; latency is
+per query, one query at a time.
+
+    python benchmarks/index_recall.py --queries benchmarks/queries.txt \\
+        --index HNSW:M=16,efConstruction=200 --index IVF_FLAT:nlist=256 \\
+        --search HNSW:ef=16 --search HNSW:ef=64 --search IVF_FLAT:nprobe=8 --search IVF_FLAT:nprobe=32
+
+    # Only the serving collection, with its own index and the given search settings
+    python benchmarks/index_recall.py --queries benchmarks/queries.txt --existing --search HNSW:ef=128
+
+The query file has one question per line, or JSON lines with a "query" key.
+Query embeddings go through the embedding cache, so repeated runs cost no API calls.
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.index_config import (  # noqa: E402
+    IndexConfig,
+    collection_index,
+    distances,
+    parse_params,
+    search_params_for,
+)
+
+INSERT_BATCH = 1000
+
+
+def load_queries(path: Path) -> List[str]:
+    queries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return queries
+
+
+def parse_spec(spec: str):
+    """``TYPE:key=value,...`` -> (TYPE, params)."""
+    index_type, _, params = spec.partition(":")
+    return index_type.upper(), parse_params(params)
+
+
+def load_vectors(client, collection_name: str):
+    """Primary keys and vectors of every entity in a collection."""
+    ids, vectors = [], []
+    iterator = client.query_iterator(collection_name, batch_size=INSERT_BATCH, output_fields=["pk", "vector"])
+    try:
+        while batch := iterator.next():
+            for row in batch:
+                ids.append(str(row["pk"]))
+                vectors.append(row["vector"])
+    finally:
+        iterator.close()
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, metric: str) -> np.ndarray:
+    """Indices of the exact k nearest vectors for each query."""
+    scores = distances(queries, vectors, metric)
+    top = np.argpartition(scores, kth=min(k, vectors.shape[0] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(results: Sequence[Sequence[str]], truth: Sequence[Sequence[str]]) -> float:
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+    return hits / max(1, sum(len(expected) for expected in truth))
+
+
+def build_collection(client, name: str, ids: List[str], vectors: np.ndarray, config: IndexConfig) -> float:
+    """Create a scratch collection with ``config``'s index; returns seconds until it is loaded."""
+    from pymilvus import DataType
+
+    if client.has_collection(name):
+        client.drop_collection(name)
+    schema = client.create_schema(auto_id=False)
+    schema.add_field("pk", DataType.VARCHAR, is_primary=True, max_length=128)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=vectors.shape[1])
+    index_params = client.prepare_index_params()
+    params = config.index_params()
+    index_params.add_index(
+        field_name="vector", index_type=params["index_type"], metric_type=params["metric_type"], params=params["params"]
+    )
+    started = time.perf_counter()
+    client.create_collection(name, schema=schema, index_params=index_params)
+    for start in range(0, len(ids), INSERT_BATCH):
+        client.insert(name, [
+            {"pk": pk, "vector": vector.tolist()}
+            for pk, vector in zip(ids[start:start + INSERT_BATCH], vectors[start:start + INSERT_BATCH])
+        ])
+    client.flush(name)
+    client.load_collection(name)
+    return time.perf_counter() - started
+
+
+def run_queries(client, name: str, query_vectors: np.ndarray, k: int, search_params: Dict, repeat: int):
+    results, latencies = [], []
+    for _ in range(repeat):
+        results = []
+        for vector in query_vectors:
+            started = time.perf_counter()
+            hits = client.search(name, data=[vector.tolist()], limit=k, search_params=search_params, output_fields=["pk"])
+            latencies.append(time.perf_counter() - started)
+            results.append([str(hit["id"]) for hit in hits[0]])
+    return results, latencies
+
+
+def report(rows: List[Dict]):
+    print(f"{'index':44s} {'search':24s} {'build s':>8s} {'recall':>7s} {'p50 ms':>8s} {'p99 ms':>8s} {'qps':>7s}")
+    for row in rows:
+        build = f"{row['build_seconds']:.1f}" if row["build_seconds"] is not None else "-"
+        print(
+            f"{row['index']:44s} {json.dumps(row['search_params']):24s} {build:>8s} {row['recall']:7.3f} "
+            f"{row['p50_ms']:8.2f} {row['p99_ms']:8.2f} {row['qps']:7.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=Path, required=True)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--collection", help="Source collection (default: the active version)")
+    parser.add_argument("--index", action="append", default=[], help="TYPE:params to build, repeatable")
+    parser.add_argument("--search", action="append", default=[], help="TYPE:params to search with, repeatable")
+    parser.add_argument("--metric", default=None, help="Metric for built indexes (default: the source collection's)")
+    parser.add_argument("--existing", action="store_true", help="Benchmark the source collection itself")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the query set for latency")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    from app.services.ingest_service import get_milvus_client, init_embeddings, resolve_active_collection
+
+    client = get_milvus_client()
+    source = args.collection or resolve_active_collection()
+    source_index = collection_index(client, source) or {"index_type": "AUTOINDEX", "metric_type": "L2"}
+    metric = (args.metric or source_index["metric_type"]).upper()
+
+    queries = load_queries(args.queries)
+    ids, vectors = load_vectors(client, source)
+    # Queries embedded at the collection's dimension, as the retriever does
+    query_vectors = np.asarray(init_embeddings(dimensions=vectors.shape[1]).embed_documents(queries), dtype=np.float32)
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]} from '{source}', {len(queries)} queries, k={args.k}")
+
+    truth = [[ids[i] for i in row] for row in exact_top_k(vectors, query_vectors, args.k, metric)]
+    searches = [parse_spec(spec) for spec in args.search]
+
+    targets = []  # (collection, index type, metric, description, build seconds)
+    if args.existing:
+        targets.append((source, source_index["index_type"], source_index["metric_type"], f"{source} (serving)", None))
+    for position, spec in enumerate(args.index):
+        index_type, params = parse_spec(spec)
+        config = IndexConfig(index_type=index_type, metric_type=metric, build_params=params)
+        name = f"{source}_bench_{position}"
+        print(f"Building {config.describe()} ...")
+        seconds = build_collection(client, name, ids, vectors, config)
+        targets.append((name, index_type, metric, f"{index_type} {json.dumps(config.index_params()['params'])}", seconds))
+
+    rows = []
+    try:
+        for name, index_type, target_metric, description, build_seconds in targets:
+            settings = [params for search_type, params in searches if search_type == index_type.upper()] or [{}]
+            for params in settings:
+                search_params = search_params_for(index_type, target_metric, params)
+                results, latencies = run_queries(client, name, query_vectors, args.k, search_params, args.repeat)
+                latencies_ms = np.asarray(latencies) * 1000
+                rows.append({
+                    "index": description,
+                    "search_params": search_params["params"],
+                    "build_seconds": build_seconds,
+                    "recall": recall_at_k(results, truth),
+                    "p50_ms": float(np.percentile(latencies_ms, 50)),
+                    "p99_ms": float(np.percentile(latencies_ms, 99)),
+                    "qps": len(latencies) / (latencies_ms.sum() / 1000),
+                })
+    finally:
+        if not args.keep:
+            for name, *_ in targets:
+                if name != source:
+                    client.drop_collection(name)
+
+    report(rows)
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Metrics overhead benchmark: cost of recording one latency on the request path.
+
+Times the ``MetricsCollector`` calls the chat endpoint makes for every
+request and pipeline stage, and the sketches under them, and exits non-zero
+if any exceeds the per-call budget. Each call is made from a Python function,
+as at the call sites; the cost of the timing loop and that function's own
+call is measured separately and subtracted.
+
+    python benchmarks/metrics_overhead.py --budget-ns 1000
+"""
+import sys
+import random
+import timeit
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.monitoring import MetricsCollector  # noqa: E402
+from app.services.quantile_sketch import DDSketch, WindowedSketch  # noqa: E402
+
+
+def per_call_ns(fn, values, repeat: int) -> float:
+    """Best-of-``repeat`` time per recorded value, in nanoseconds."""
+    best = min(timeit.repeat(lambda: [fn(v) for v in values], number=1, repeat=repeat))
+    return best / len(values) * 1e9
+
+
+def noop(value):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ns", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-2.0, 1.0) for _ in range(args.samples)]
+    collector = MetricsCollector()
+    dd_sketch, windowed_sketch = DDSketch(), WindowedSketch()
+    cases = {
+        "DDSketch.add": lambda v: dd_sketch.add(v),
+        "WindowedSketch.add": lambda v: windowed_sketch.add(v),
+        "MetricsCollector.record_stage": lambda v: collector.record_stage("milvus_search", v),
+        "MetricsCollector.record_request": lambda v: collector.record_request("/api/chat", v),
+    }
+
+    loop_ns = per_call_ns(lambda v: noop(v), values, args.repeat)
+    print(f"{'(timing loop, subtracted)':34s} {loop_ns:8.0f} ns/call")
+    over_budget = False
+    for name, fn in cases.items():
+        ns = per_call_ns(fn, values, args.repeat) - loop_ns
+        over_budget |= ns > args.budget_ns
+        print(f"{name:34s} {ns:8.0f} ns/call")
+
+    # The read side, which used to sort up to 1000 samples per call
+    start = timeit.default_timer()
+    collector.get_summary()
+    print(f"{'MetricsCollector.get_summary':34s} {(timeit.default_timer() - start) * 1e6:8.0f} us")
+
+    if over_budget:
+        print(f"FAIL: recording exceeded {args.budget_ns:.0f} ns/call")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
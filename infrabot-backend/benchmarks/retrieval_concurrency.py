@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the chat retrieval path.
+
+Fires N retrievals at once through the retriever used by /api/chat and
+compares the wall time with N back-to-back retrievals. When retrieval does not
+block the event loop, the concurrent run takes roughly one search latency
+instead of N.
+
+    python benchmarks/retrieval_concurrency.py --requests 16
+    python benchmarks/retrieval_concurrency.py --requests 16 --live   # against Milvus
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.services.async_retriever import AsyncVectorStoreRetriever
+
+
+class StaticEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class BlockingVectorStore:
+    """Stands in for Milvus: each search blocks its thread like a gRPC call."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def similarity_search_by_vector(self, vector, k=5, **kwargs):
+        time.sleep(self.latency)
+        return [Document(page_content=f"doc {i}") for i in range(k)]
+
+    def similarity_search(self, query, k=5, **kwargs):
+        return self.similarity_search_by_vector(None, k=k)
+
+
+def build_retriever(args):
+    if args.live:
+        from app.services.ingest_service import init_embeddings, get_milvus_retriever
+
+        return get_milvus_retriever(init_embeddings())
+    return AsyncVectorStoreRetriever.model_construct(
+        vectorstore=BlockingVectorStore(args.latency),
+        embeddings=StaticEmbeddings(),
+        k=5,
+        search_kwargs={},
+        timeout=30.0,
+        executor=None,
+    )
+
+
+async def timed(retriever, query):
+    started = time.perf_counter()
+    await retriever.ainvoke(query)
+    return started, time.perf_counter()
+
+
+async def run(args):
+    retriever = build_retriever(args)
+    queries = [f"{args.query} #{i}" for i in range(args.requests)]
+    await retriever.ainvoke(args.query)  # Warm up connections and the pool
+
+    started = time.perf_counter()
+    for query in queries:
+        await retriever.ainvoke(query)
+    serial = time.perf_counter() - started
+
+    started = time.perf_counter()
+    spans = await asyncio.gather(*(timed(retriever, query) for query in queries))
+    concurrent = time.perf_counter() - started
+
+    # Retrievals overlap when the last one starts before the first one ends
+    overlapping = max(start for start, _ in spans) < min(end for _, end in spans)
+    print(f"requests:        {args.requests}")
+    print(f"serial total:    {serial * 1000:.1f} ms ({serial / args.requests * 1000:.1f} ms each)")
+    print(f"concurrent:      {concurrent * 1000:.1f} ms")
+    print(f"speedup:         {serial / concurrent:.1f}x")
+    print(f"overlapping:     {overlapping}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8, help="Simultaneous retrievals")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated search latency (s)")
+    parser.add_argument("--query", default="How do I reset my VPN password?")
+    parser.add_argument("--live", action="store_true", help="Use the configured Milvus collection")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Local stand-ins for Azure OpenAI and Milvus, for load tests and chat tests.
+
+* ``FakeStreamingChatModel`` streams a deterministic answer after a
+  configurable time to first token, at a configurable token rate.
+* ``HashEmbeddings`` maps text to unit vectors by hashing its words, so
+  similar questions get similar vectors, with an optional per-call latency.
+* The vector store is the embedded local backend (``VECTOR_STORE_BACKEND=local``)
+  in a scratch directory, filled with a synthetic helpdesk corpus.
+
+``stand_ins()`` builds the app's real retriever and RAG chain over these and
+binds them into ``app.main``, restoring everything on exit. Only the external
+services are replaced; retrieval, reranking, context packing, caching,
+admission and timing all run as in production.
+"""
+import time
+import random
+import asyncio
+import hashlib
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+TOPICS = [
+    ("VPN", "GlobalProtect VPN connection drops, portal address, certificate error 0x80070005"),
+    ("Outlook", "Outlook mailbox full, shared mailbox access, calendar delegation, OST rebuild"),
+    ("Password", "password reset through the self-service portal, account lockout after failed attempts"),
+    ("Intune", "Intune device enrollment, compliance policy, company portal app installation"),
+    ("Teams", "Microsoft Teams audio issues, meeting recording, guest access to a team"),
+    ("Printer", "network printer mapping, print queue stuck, badge release printing"),
+    ("Laptop", "laptop replacement request, BitLocker recovery key, docking station display"),
+    ("O365", "Office 365 licence activation, OneDrive sync conflicts, SharePoint permissions"),
+    ("WiFi", "corporate WiFi 802.1X authentication, guest network voucher, slow wireless"),
+    ("MFA", "multi-factor authentication new phone, authenticator app codes, SMS fallback"),
+]
+
+QUESTIONS = [
+    "How do I reset my password?",
+    "My VPN keeps disconnecting, what should I do?",
+    "Outlook says my mailbox is full",
+    "How do I enroll my phone in Intune?",
+    "Teams audio is not working in meetings",
+    "How can I map the network printer?",
+    "Where do I find my BitLocker recovery key?",
+    "OneDrive is showing sync conflicts",
+    "I cannot connect to the corporate WiFi",
+    "I got a new phone, how do I set up MFA again?",
+    "What does error 0x80070005 mean when connecting to VPN?",
+    "How do I get access to a shared mailbox?",
+]
+
+ANSWER_WORDS = (
+    "open the self-service portal sign in with your corporate account select the affected device follow the "
+    "prompts restart the application and check the connection again if the issue persists raise a ticket "
+    "in the helpdesk portal with the error message and a screenshot"
+).split()
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model that answers after ``ttft_seconds`` and then streams ``tokens_per_second``."""
+
+    ttft_seconds: float = 0.3
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 120
+    # Fails this share of calls before the first token, to exercise error handling
+    failure_rate: float = 0.0
+    seed: int = 0
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _answer(self, messages: List[BaseMessage], max_tokens: Optional[int]) -> List[str]:
+        digest = hashlib.sha256((str(self.seed) + messages[-1].content).encode("utf-8")).digest()
+        rng = random.Random(digest)
+        count = min(self.answer_tokens, max_tokens) if max_tokens else self.answer_tokens
+        # Leading spaces, as BPE tokenizers split words, so each piece is about one token
+        return [" " + rng.choice(ANSWER_WORDS) for _ in range(count)]
+
+    def model_post_init(self, __context: Any):
+        self._rng = random.Random(self.seed)
+
+    def _should_fail(self) -> bool:
+        return self.failure_rate > 0 and self._rng.random() < self.failure_rate
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._answer(messages, kwargs.get("max_tokens"))
+        time.sleep(self.ttft_seconds + len(tokens) / self.tokens_per_second)
+        if self._should_fail():
+            raise RuntimeError("Injected chat model failure")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._answer(messages, kwargs.get("max_tokens"))
+        await asyncio.sleep(self.ttft_seconds + len(tokens) / self.tokens_per_second)
+        if self._should_fail():
+            raise RuntimeError("Injected chat model failure")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        result = self._generate(messages, stop, **kwargs)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=result.generations[0].message.content))
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        started = time.perf_counter()
+        fail = self._should_fail()
+        for position, token in enumerate(self._answer(messages, kwargs.get("max_tokens"))):
+            # Paced against an absolute schedule so sleep overhead does not accumulate
+            due = started + self.ttft_seconds + position / self.tokens_per_second
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            if fail:
+                raise RuntimeError("Injected chat model failure")
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings: each word adds to a few hashed dimensions."""
+
+    def __init__(self, dimensions: int = 256, latency_seconds: float = 0.0):
+        self.dimensions = dimensions
+        self.latency_seconds = latency_seconds
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.strip("?.,!:;").encode("utf-8"), digest_size=8).digest()
+            for position in range(0, 8, 2):
+                vector[int.from_bytes(digest[position:position + 2], "little") % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def synthetic_corpus(chunks: int, seed: int = 0) -> List[Document]:
+    """Helpdesk-like chunks spread over ``TOPICS``, each a few sentences long."""
+    rng = random.Random(seed)
+    documents = []
+    for index in range(chunks):
+        topic, detail = TOPICS[index % len(TOPICS)]
+        words = detail.replace(",", "").split()
+        sentences = [
+            f"{topic} guide section {index // len(TOPICS)}.",
+            " ".join(rng.sample(words, k=min(len(words), 8))) + ".",
+            " ".join(rng.choice(ANSWER_WORDS) for _ in range(30)) + ".",
+        ]
+        documents.append(Document(page_content=" ".join(sentences), metadata={"source": f"{topic}.pdf"}))
+    return documents
+
+
+@dataclass
+class StandInConfig:
+    ttft_seconds: float = 0.3
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 120
+    failure_rate: float = 0.0
+    embedding_dimensions: int = 256
+    embedding_latency_seconds: float = 0.0
+    corpus_chunks: int = 2000
+    semantic_cache: bool = True
+    seed: int = 0
+
+
+@contextmanager
+def stand_ins(config: StandInConfig = None, root: Optional[Path] = None):
+    """Bind ``app.main`` to a RAG chain over the stand-ins; yields the FastAPI app."""
+    from app import main
+    from app.services import ingest_service, lexical_index, load_data, local_vector_store, openai_llm
+    from app.services.history_compaction import history_compactor
+
+    config = config or StandInConfig()
+    scratch = tempfile.TemporaryDirectory(prefix="infrabot-stand-ins-") if root is None else None
+    root = Path(scratch.name) if scratch else Path(root)
+    embeddings = HashEmbeddings(config.embedding_dimensions, config.embedding_latency_seconds)
+
+    def chat_model():
+        return FakeStreamingChatModel(
+            ttft_seconds=config.ttft_seconds,
+            tokens_per_second=config.tokens_per_second,
+            answer_tokens=config.answer_tokens,
+            failure_rate=config.failure_rate,
+            seed=config.seed,
+        )
+
+    def build_vector_db():
+        return embeddings, ingest_service.get_milvus_retriever(embeddings)
+
+    patches = [
+        (ingest_service, "VECTOR_STORE_BACKEND", "local"),
+        (ingest_service, "AZURE_OPENAI_EMBEDDING_DIMENSIONS", config.embedding_dimensions),
+        (local_vector_store, "_local_client", local_vector_store.LocalVectorClient(root / "vectors")),
+        (lexical_index, "LEXICAL_INDEX_DIR", root / "lexical"),
+        (openai_llm, "init_azure_chat_openai", chat_model),
+        (load_data, "init_azure_chat_openai", chat_model),
+        (load_data, "build_vector_db", build_vector_db),
+        (main, "SEMANTIC_CACHE_ENABLED", config.semantic_cache),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    originals += [(history_compactor, "summarize", history_compactor.summarize)]
+    originals += [(main, name, getattr(main, name))
+                  for name in ("embeddings", "retriever", "retrieval_qa_chain", "loaded_kb_version")]
+    startup_state = dict(main.startup_state)
+    try:
+        for module, name, value in patches:
+            setattr(module, name, value)
+        ingest_service.create_milvus_vectorstore(embeddings, synthetic_corpus(config.corpus_chunks, config.seed))
+        main.reload_rag_chain()
+        main.startup_state.update(ready=True, last_error=None)
+        yield main.app
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+        main.startup_state.clear()
+        main.startup_state.update(startup_state)
+        main.semantic_cache.invalidate()
+        if scratch:
+            scratch.cleanup()
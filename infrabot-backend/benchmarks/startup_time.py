@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: import time of the app module and time to readiness.
+
+Each run imports ``app.main`` in a fresh interpreter and reports the median
+import time and the slowest modules (from ``python -X importtime``). With
+``--serve`` it also starts uvicorn and measures how long /healthz and /readyz
+take to answer, which needs a reachable Milvus and Azure OpenAI credentials.
+
+    python benchmarks/startup_time.py --runs 5
+    python benchmarks/startup_time.py --serve
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def measure_import(runs: int):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def slowest_imports(limit: int):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), module.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def wait_for(url: str, timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except Exception:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} was not ready after {timeout:.0f}s")
+
+
+def measure_serve(port: int, timeout: float):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/healthz", timeout)
+        live = time.perf_counter() - started
+        wait_for(f"http://127.0.0.1:{port}/readyz", timeout)
+        return live, time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    parser.add_argument("--serve", action="store_true", help="Also time /healthz and /readyz under uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    samples = measure_import(args.runs)
+    print(f"import app.main: median {statistics.median(samples) * 1000:.0f} ms "
+          f"(min {min(samples) * 1000:.0f}, max {max(samples) * 1000:.0f}, {args.runs} runs)")
+    print("slowest imports (cumulative):")
+    for micros, module in slowest_imports(args.top):
+        print(f"  {micros / 1000:8.1f} ms  {module}")
+
+    if args.serve:
+        live, ready = measure_serve(args.port, args.timeout)
+        print(f"time to /healthz: {live * 1000:.0f} ms")
+        print(f"time to /readyz:  {ready * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
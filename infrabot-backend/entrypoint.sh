@@ -10,37 +10,25 @@ echo "Starting InfraBot Backend for Azure Container Apps..."
 echo "Environment: ${ENVIRONMENT:-development}"
 echo "Connecting to Milvus at $TARGET_HOST:$TARGET_PORT"
 
-# Wait for Milvus service to be available (with shorter timeout for faster startup)
-echo "Waiting for Milvus service to be ready..."
-timeout=60  # Reduced timeout
-count=0
-
-# Check if Milvus is available, but don't block startup
-while [ $count -lt $timeout ]; do
-  if nc -z -w 2 "$TARGET_HOST" "$TARGET_PORT" 2>/dev/null; then
-    echo "Successfully connected to Milvus at $TARGET_HOST:$TARGET_PORT"
-    break
-  fi
-  
-  if [ $((count % 10)) -eq 0 ]; then
-    echo "Waiting for Milvus at $TARGET_HOST:$TARGET_PORT (attempt $count/$timeout)"
-  fi
-  
-  sleep 2
-  count=$((count + 2))
-done
-
-if [ $count -ge $timeout ]; then
-  echo "Warning: Could not connect to Milvus at $TARGET_HOST:$TARGET_PORT within timeout"
+# The app connects to Milvus in the background and reports it through /readyz,
+# so a single reachability check is logged here instead of waiting for it.
+if nc -z -w 2 "$TARGET_HOST" "$TARGET_PORT" 2>/dev/null; then
+  echo "Milvus is reachable at $TARGET_HOST:$TARGET_PORT"
+else
+  echo "Warning: Milvus is not reachable at $TARGET_HOST:$TARGET_PORT yet"
   echo "Starting application anyway - Milvus connection will be retried at runtime"
 fi
 
+# One worker per CPU of the container's limit unless UVICORN_WORKERS is set.
+# Workers share ingest state and metrics through SHARED_STATE_DIR.
+WORKERS=$(python -m app.services.shared_state)
+
 # Start the FastAPI application with Azure-optimized settings
-echo "Starting FastAPI application..."
+echo "Starting FastAPI application with $WORKERS worker(s)..."
 exec uvicorn app.main:app \
   --host 0.0.0.0 \
   --port 8000 \
-  --workers 1 \
+  --workers "$WORKERS" \
   --log-level info \
   --access-log \
   --timeout-keep-alive 65 \
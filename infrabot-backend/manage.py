@@ -11,7 +11,15 @@ from pathlib import Path
 # Add the app directory to the Python path
 sys.path.insert(0, str(Path(__file__).parent / "app"))
 
-from app.services.ingest_service import ingest_documents, validate_milvus_connection
+from app.services.ingest_service import (
+    ingest_documents,
+    validate_milvus_connection,
+    rollback_collection,
+    resolve_active_collection,
+    build_lexical_index,
+    IngestStats,
+)
+from app.services.index_config import IndexConfig, MILVUS_INDEX_TYPE, MILVUS_METRIC_TYPE, parse_params
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,7 +38,25 @@ def main():
     ingest_parser.add_argument(
         "--force", 
         action="store_true", 
-        help="Force re-ingestion even if collection exists"
+        help="Force a full rebuild of the collection instead of an incremental update"
+    )
+    ingest_parser.add_argument(
+        "--index-type",
+        help="Vector index for the rebuilt collection (AUTOINDEX, FLAT, HNSW, IVF_FLAT, IVF_SQ8, IVF_PQ, DISKANN); implies --force"
+    )
+    ingest_parser.add_argument("--metric", help="Distance metric (L2, IP, COSINE); implies --force")
+    ingest_parser.add_argument(
+        "--index-params", help='Index build parameters, e.g. "M=16,efConstruction=200" or JSON; implies --force'
+    )
+    
+    # Rollback command
+    rollback_parser = subparsers.add_parser(
+        "rollback", help="Point the knowledge base back at the previous collection version"
+    )
+    
+    # Lexical index command
+    lexical_parser = subparsers.add_parser(
+        "lexical-index", help="Rebuild the BM25 index of the active collection from Milvus"
     )
     
     # Validate command
@@ -43,8 +69,24 @@ def main():
     
     if args.command == "ingest":
         logger.info("Starting document ingestion...")
+        stats = IngestStats()
         try:
-            success = ingest_documents()
+            index_config = None
+            if args.index_type or args.metric or args.index_params:
+                index_config = IndexConfig(
+                    index_type=args.index_type or MILVUS_INDEX_TYPE,
+                    metric_type=args.metric or MILVUS_METRIC_TYPE,
+                    build_params=parse_params(args.index_params),
+                )
+                logger.info(f"Rebuilding with index {index_config.describe()}")
+            success = ingest_documents(
+                force=args.force or index_config is not None, stats=stats, index_config=index_config
+            )
+            rates = stats.rates()
+            logger.info(
+                f"Throughput: {rates['pages_per_second']:.2f} pages/s, "
+                f"{rates['chunks_per_second']:.2f} chunks/s ({stats.summary()})"
+            )
             if success:
                 logger.info("Document ingestion completed successfully!")
                 sys.exit(0)
@@ -55,6 +97,27 @@ def main():
             logger.error(f"Document ingestion failed with error: {e}")
             sys.exit(1)
     
+    elif args.command == "rollback":
+        logger.info("Rolling back to the previous collection version...")
+        try:
+            collection_name = rollback_collection()
+            logger.info(f"Knowledge base now served from '{collection_name}'")
+            sys.exit(0)
+        except Exception as e:
+            logger.error(f"Rollback failed with error: {e}")
+            sys.exit(1)
+    
+    elif args.command == "lexical-index":
+        logger.info("Building the lexical index...")
+        try:
+            collection_name = resolve_active_collection()
+            index = build_lexical_index(collection_name)
+            logger.info(f"Lexical index of '{collection_name}' holds {len(index)} chunks")
+            sys.exit(0)
+        except Exception as e:
+            logger.error(f"Lexical index build failed with error: {e}")
+            sys.exit(1)
+    
     elif args.command == "validate":
         logger.info("Validating Milvus connection...")
         try:
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from app.main import PermitStreamingResponse
+from app.services.admission import AdmissionController, AdmissionRejected, client_address
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_client_token_bucket_refills():
+    clock = FakeClock()
+    controller = AdmissionController(client_rate_per_minute=60, client_burst=2, clock=clock)
+    controller.check_rate("10.0.0.1")
+    controller.check_rate("10.0.0.1")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check_rate("10.0.0.1")
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == pytest.approx(1.0)
+    # Other clients have their own bucket
+    controller.check_rate("10.0.0.2")
+    clock.now = 1.0
+    controller.check_rate("10.0.0.1")
+
+
+def test_queued_request_gets_released_slot_and_overload_is_rejected_early():
+    controller = AdmissionController(
+        max_inflight=1, min_inflight=1, queue_size=1, queue_timeout=1.0,
+        target_latency=0.5, client_max_inflight=5,
+    )
+
+    async def run():
+        first = await controller.acquire("a")
+        waiting = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+        # The queue is full
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("c")
+        assert rejected.value.status_code == 503
+        first.release(upstream_latency=0.5)
+        second = await waiting
+        assert controller.in_flight == 1
+        second.release()
+
+        # Slots are held ~10s: a queued request would miss its 1s deadline, so it is refused at once
+        controller.service_ewma = 10.0
+        held = await controller.acquire("a")
+        controller.queue_size = 10
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        assert rejected.value.retry_after >= 10
+        held.release()
+
+    asyncio.run(run())
+    assert controller.in_flight == 0
+
+
+def test_per_client_concurrency_cap():
+    controller = AdmissionController(max_inflight=10, client_max_inflight=1)
+
+    async def run():
+        permit = await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("a")
+        assert rejected.value.status_code == 429
+        permit.release()
+        (await controller.acquire("a")).release()
+
+    asyncio.run(run())
+
+
+def test_client_address_trusts_only_the_configured_proxy_hops():
+    # A spoofed leftmost entry does not change who the request is limited as
+    assert client_address("6.6.6.6, 203.0.113.7", "10.0.0.9", trusted_hops=1) == "203.0.113.7"
+    assert client_address("6.6.6.6, 203.0.113.7, 10.0.0.5", "10.0.0.9", trusted_hops=2) == "203.0.113.7"
+    assert client_address("203.0.113.7", "10.0.0.9", trusted_hops=2) == "203.0.113.7"
+    # Without trusted proxies the header is ignored
+    assert client_address("6.6.6.6", "10.0.0.9", trusted_hops=0) == "10.0.0.9"
+    assert client_address("", "10.0.0.9", trusted_hops=1) == "10.0.0.9"
+
+
+def test_per_client_limits_are_off_by_default():
+    controller = AdmissionController(max_inflight=10)
+    for _ in range(100):
+        controller.check_rate("10.0.0.1")
+
+    async def run():
+        permits = [await controller.acquire("10.0.0.1") for _ in range(5)]
+        for permit in permits:
+            permit.release()
+
+    asyncio.run(run())
+
+
+def test_permit_is_released_when_client_disconnects_before_response_starts():
+    controller = AdmissionController(max_inflight=1, client_max_inflight=1)
+
+    async def body():
+        yield "never sent"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("Client went away")
+
+    async def run():
+        response = PermitStreamingResponse(body(), await controller.acquire("10.0.0.1"))
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        assert controller.in_flight == 0
+        # Neither the global slot nor the client's count leaked
+        (await controller.acquire("10.0.0.1")).release()
+
+    asyncio.run(run())
+
+
+def test_limit_follows_upstream_latency():
+    clock = FakeClock()
+    controller = AdmissionController(max_inflight=20, min_inflight=4, target_latency=2.0, clock=clock)
+    for step in range(30):
+        clock.now = step * 2.0
+        controller.observe_latency(8.0)
+    assert int(controller.limit) == 4
+
+    for _ in range(200):
+        controller.observe_latency(0.5)
+    assert int(controller.limit) == 20
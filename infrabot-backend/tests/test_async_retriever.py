@@ -0,0 +1,103 @@
+import time
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.services.async_retriever import AsyncVectorStoreRetriever, RetrievalTimeout
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+
+class StaticEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class BlockingVectorStore:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def similarity_search_by_vector(self, vector, k=5, **kwargs):
+        time.sleep(self.latency)
+        return [Document(page_content="vpn")] * k
+
+
+def make_retriever(latency, timeout=5.0):
+    return AsyncVectorStoreRetriever.model_construct(
+        vectorstore=BlockingVectorStore(latency),
+        embeddings=StaticEmbeddings(),
+        k=2,
+        search_kwargs={},
+        timeout=timeout,
+        executor=None,
+    )
+
+
+def test_concurrent_retrievals_overlap():
+    retriever = make_retriever(latency=0.2)
+
+    async def run():
+        started = time.monotonic()
+        results = await asyncio.gather(*(retriever.ainvoke(f"q{i}") for i in range(6)))
+        return time.monotonic() - started, results
+
+    elapsed, results = asyncio.run(run())
+    assert all(len(docs) == 2 for docs in results)
+    # Six blocking 0.2s searches run side by side rather than back to back
+    assert elapsed < 0.6
+
+
+def test_retrieval_timeout():
+    retriever = make_retriever(latency=0.5, timeout=0.05)
+    with pytest.raises(RetrievalTimeout):
+        asyncio.run(retriever.ainvoke("vpn"))
+
+
+def test_open_search_breaker_fails_fast():
+    breaker = CircuitBreaker("milvus_search")
+    breaker.state, breaker.opened_at = CircuitState.OPEN, time.monotonic()
+    retriever = make_retriever(latency=0.5)
+    retriever.search_breaker = breaker
+
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(retriever.ainvoke("vpn"))
+    assert time.monotonic() - started < 0.1
+
+
+class QuantizedVectorStore:
+    """Returns candidates in approximate order; the stored vectors give the exact one."""
+    collection_name = "kb"
+    _primary_field = "pk"
+    _vector_field = "vector"
+
+    def __init__(self):
+        self.vectors = {"a": [0.0, 1.0], "b": [0.9, 0.1], "c": [1.0, 0.0], "d": [0.5, 0.5]}
+        self.client = self
+        self.fetched_k = None
+
+    def similarity_search_with_score_by_vector(self, vector, k=5, **kwargs):
+        self.fetched_k = k
+        return [(Document(page_content=pk, metadata={"pk": pk}), 0.5) for pk in ["a", "b", "d", "c"][:k]]
+
+    def get(self, collection_name, ids, output_fields):
+        return [{"pk": pk, "vector": self.vectors[pk]} for pk in ids]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance / 2
+
+
+def test_candidates_are_rescored_by_exact_distance():
+    store = QuantizedVectorStore()
+    retriever = AsyncVectorStoreRetriever.model_construct(
+        vectorstore=store, embeddings=StaticEmbeddings(), k=2, search_kwargs={}, timeout=5.0, executor=None,
+        with_scores=True, rescore_factor=2, metric_type="L2",
+    )
+    documents = asyncio.run(retriever.ainvoke("vpn"))
+    assert store.fetched_k == 4
+    assert [d.page_content for d in documents] == ["c", "b"]
+    assert documents[0].metadata["relevance_score"] == 1.0
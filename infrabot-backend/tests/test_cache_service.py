@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.services.cache_service import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    SemanticCache,
+    history_fingerprint,
+)
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_exact_hit_ignores_case_and_whitespace():
+    cache = SemanticCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    key = history_fingerprint([])
+    cache.put("VPN not connecting", key, "Restart the VPN client.")
+    assert cache.get_exact("  vpn   NOT connecting ", key) == "Restart the VPN client."
+
+
+def test_similar_hit_respects_threshold_and_history():
+    cache = SemanticCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    key = history_fingerprint([])
+    cache.put("reset password", key, "Use the self-service portal.", query_vector=[1.0, 0.0])
+
+    assert cache.get_similar([0.99, 0.05], key) == "Use the self-service portal."
+    assert cache.get_similar([0.0, 1.0], key) is None
+    other_key = history_fingerprint([{"role": "user", "content": "hi"}])
+    assert cache.get_similar([1.0, 0.0], other_key) is None
+
+
+def test_lru_eviction_and_ttl():
+    cache = SemanticCache(threshold=0.9, ttl_seconds=60, max_entries=2)
+    key = history_fingerprint([])
+    cache.put("a", key, "A")
+    cache.put("b", key, "B")
+    cache.get_exact("a", key)
+    cache.put("c", key, "C")
+    assert cache.get_exact("b", key) is None
+    assert cache.get_exact("a", key) == "A"
+
+    cache.ttl_seconds = 1
+    cache._entries[next(iter(cache._entries))].created_at = time.time() - 5
+    assert len([q for q in ("a", "c") if cache.get_exact(q, key)]) == 1
+
+
+def test_invalidate_drops_stale_writes():
+    cache = SemanticCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    key = history_fingerprint([])
+    generation = cache.generation
+    cache.invalidate()
+    cache.put("vpn", key, "stale answer", generation=generation)
+    assert cache.get_exact("vpn", key) is None
+    assert len(cache) == 0
+
+
+def test_embedding_cache_persists_across_instances(tmp_path):
+    path = tmp_path / "embeddings.sqlite3"
+    first = CountingEmbeddings()
+    cached = CachedEmbeddings(first, "deploy:model", EmbeddingCache(path, memory_entries=10))
+    vectors = cached.embed_documents(["alpha", "beta", "alpha"])
+    assert first.texts == 2
+    assert vectors[0] == vectors[2]
+
+    second = CountingEmbeddings()
+    reopened = CachedEmbeddings(second, "deploy:model", EmbeddingCache(path, memory_entries=10))
+    assert reopened.embed_documents(["alpha", "beta"]) == vectors[:2]
+    assert reopened.embed_query("beta") == vectors[1]
+    assert second.calls == 0
+
+
+def test_embedding_cache_is_namespaced_by_model(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3", memory_entries=10)
+    CachedEmbeddings(CountingEmbeddings(), "deploy:model-a", cache).embed_query("vpn")
+    other = CountingEmbeddings()
+    CachedEmbeddings(other, "deploy:model-b", cache).embed_query("vpn")
+    assert other.calls == 1
+
+
+def test_embedding_cache_memory_tier_holds_float32_arrays():
+    cache = EmbeddingCache(None, memory_entries=2)
+    cache.put_many("deploy:model", {"a": [0.5] * 3072, "b": [0.25] * 3072, "c": [1.0] * 3072})
+    assert list(cache._memory) == ["b", "c"]
+    assert all(vector.dtype == np.float32 and vector.nbytes == 4 * 3072 for vector in cache._memory.values())
+    found = cache.get_many(["a", "b"])
+    assert list(found) == ["b"]
+    assert found["b"] == [0.25] * 3072
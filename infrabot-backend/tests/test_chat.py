@@ -4,5 +4,58 @@ from fastapi.testclient import TestClient
 client = TestClient(app)
 
 def test_chat_health():
-    resp = client.post("/chat", json={"user": "test", "message": "ping"})
-    assert resp.status_code == 200
\ No newline at end of file
+    resp = client.get("/healthz")
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "alive"}
+
+def test_chat_streams_answer_through_rag_chain_on_stand_ins():
+    from benchmarks.stand_ins import StandInConfig, stand_ins
+
+    config = StandInConfig(ttft_seconds=0.0, tokens_per_second=10000, answer_tokens=20, corpus_chunks=50)
+    with stand_ins(config) as app:
+        chat = TestClient(app)
+        first = chat.post("/api/chat", json={"prompt": "How do I reset my VPN password?", "history": []})
+        assert first.status_code == 200
+        assert len(first.text.split()) == 20
+        assert not first.text.startswith("ERROR")
+
+        follow_up = chat.post("/api/chat", json={
+            "prompt": "And on my phone?",
+            "history": [
+                {"role": "user", "content": "How do I reset my VPN password?"},
+                {"role": "assistant", "content": first.text},
+            ],
+        })
+        assert follow_up.status_code == 200
+        assert not follow_up.text.startswith("ERROR")
+
+def test_lexical_fast_path_query_makes_no_embedding_calls(monkeypatch):
+    from benchmarks.stand_ins import HashEmbeddings, StandInConfig, stand_ins
+
+    calls = []
+    embed = HashEmbeddings.embed_documents
+    aembed = HashEmbeddings.aembed_documents
+
+    async def counted_aembed(self, texts):
+        calls.append(texts)
+        return await aembed(self, texts)
+
+    def counted_embed(self, texts):
+        calls.append(texts)
+        return embed(self, texts)
+
+    monkeypatch.setattr(HashEmbeddings, "aembed_documents", counted_aembed)
+    monkeypatch.setattr(HashEmbeddings, "embed_documents", counted_embed)
+    config = StandInConfig(ttft_seconds=0.0, tokens_per_second=10000, answer_tokens=20, corpus_chunks=500)
+    with stand_ins(config) as app:
+        chat = TestClient(app)
+        calls.clear()
+        # Every term is in one chunk and "42" is rare: answered from the lexical index
+        confident = chat.post("/api/chat", json={"prompt": "VPN guide section 42", "history": []})
+        assert confident.status_code == 200
+        assert not confident.text.startswith("ERROR")
+        assert calls == []
+
+        vague = chat.post("/api/chat", json={"prompt": "How do I reset my password?", "history": []})
+        assert vague.status_code == 200
+        assert calls
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+from app.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakerCallbackHandler,
+    CircuitOpenError,
+    CircuitState,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(clock, **kwargs):
+    options = dict(window_seconds=30, min_calls=4, failure_rate_threshold=0.5,
+                   recovery_timeout=10, half_open_max_calls=1, clock=clock)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+def fail():
+    raise ConnectionError("upstream down")
+
+
+def test_failure_rate_opens_and_single_probe_closes():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    breaker.call(lambda: "ok")
+    breaker.call(lambda: "ok")
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CircuitState.OPEN
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.call(lambda: "ok")
+    assert rejected.value.retry_after == pytest.approx(10)
+
+    # After recovery only one concurrent probe is let through
+    clock.now = 11
+    probe = breaker.acquire()
+    assert probe is True
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record(probe, failed=False, duration=0.01)
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_slow_calls_trip_and_failed_probe_reopens():
+    clock = FakeClock()
+    breaker = make_breaker(clock, slow_call_seconds=1.0, slow_call_rate_threshold=0.5)
+    for _ in range(4):
+        breaker.record(breaker.acquire(), failed=False, duration=2.5)
+    assert breaker.state == CircuitState.OPEN
+
+    clock.now = 11
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.retry_after() == pytest.approx(10)
+
+
+def test_half_open_admits_one_probe_across_threads():
+    clock = FakeClock()
+    breaker = make_breaker(clock, half_open_max_calls=1)
+    breaker.state, breaker.opened_at = CircuitState.OPEN, 0.0
+    clock.now = 11
+    admitted = []
+    start = threading.Barrier(8)
+
+    def attempt():
+        start.wait()
+        try:
+            admitted.append(breaker.acquire())
+        except CircuitOpenError:
+            pass
+
+    threads = [threading.Thread(target=attempt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert admitted == [True]
+
+
+def test_open_breaker_rejects_model_call_before_it_starts():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    breaker.state, breaker.opened_at = CircuitState.OPEN, 0.0
+    llm = FakeListChatModel(responses=["hello"])
+
+    async def run():
+        async for _ in llm.astream("hi", config={"callbacks": [CircuitBreakerCallbackHandler(breaker)]}):
+            pass
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(run())
+
+    # Once recovered, a streamed reply is a successful probe
+    clock.now = 11
+    asyncio.run(run())
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_closing_the_stream_early_is_not_an_upstream_failure():
+    clock = FakeClock()
+    breaker = make_breaker(clock, min_calls=1)
+    handler = CircuitBreakerCallbackHandler(breaker)
+    llm = FakeListChatModel(responses=["hello world"])
+
+    async def run():
+        stream = llm.astream("hi", config={"callbacks": [handler]})
+        async for _ in stream:
+            break
+        await stream.aclose()
+        # A client that goes away before the first token closes the stream at its start
+        await handler.on_chat_model_start({}, [], run_id="aborted")
+        await handler.on_llm_error(GeneratorExit(), run_id="aborted")
+
+    for _ in range(5):
+        asyncio.run(run())
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.stats()["failure_rate"] == 0.0
@@ -0,0 +1,123 @@
+import pytest
+from pymilvus import MilvusException
+
+from app.services import lexical_index
+from app.services.collection_versions import CollectionVersions
+from app.services.lexical_index import BM25Index
+
+
+class FakeClient:
+    def __init__(self, collections=None):
+        self.collections = dict(collections or {})
+        self.aliases = {}
+
+    def has_collection(self, name):
+        return name in self.collections
+
+    def list_collections(self):
+        return list(self.collections)
+
+    def describe_alias(self, alias):
+        if alias not in self.aliases:
+            raise MilvusException(message="alias not found")
+        return {"alias": alias, "collection_name": self.aliases[alias]}
+
+    def create_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def alter_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def drop_collection(self, name):
+        del self.collections[name]
+
+    def flush(self, name):
+        pass
+
+    def get_collection_stats(self, name):
+        return {"row_count": self.collections[name]}
+
+
+def test_promote_replaces_legacy_collection_and_keeps_previous_version():
+    client = FakeClient({"kb": 10})
+    versions = CollectionVersions(client, "kb", keep_versions=2)
+    assert versions.active() == "kb"
+
+    client.collections["kb_v20250101000000"] = 12
+    versions.promote("kb_v20250101000000", expected_count=12)
+    assert versions.active() == "kb_v20250101000000"
+    assert "kb" not in client.collections
+
+    client.collections["kb_v20250102000000"] = 15
+    versions.promote("kb_v20250102000000", expected_count=15)
+    client.collections["kb_v20250103000000"] = 16
+    versions.promote("kb_v20250103000000", expected_count=16)
+    assert versions.list_versions() == ["kb_v20250102000000", "kb_v20250103000000"]
+
+    assert versions.rollback() == "kb_v20250102000000"
+    assert versions.active() == "kb_v20250102000000"
+
+
+def test_promote_refuses_incomplete_collection():
+    client = FakeClient({"kb_v1": 3})
+    versions = CollectionVersions(client, "kb")
+    with pytest.raises(RuntimeError):
+        versions.promote("kb_v1", expected_count=5)
+    assert versions.active() is None
+
+
+def test_prune_deletes_lexical_index_of_dropped_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIR", tmp_path)
+    client = FakeClient()
+    versions = CollectionVersions(client, "kb", keep_versions=2)
+    for name in ("kb_v1", "kb_v2", "kb_v3"):
+        client.collections[name] = 1
+        BM25Index(name).save()
+        versions.promote(name, expected_count=1)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["kb_v2.json", "kb_v3.json"]
+
+
+class RowsClient(FakeClient):
+    """Collections as lists of rows, which may repeat a primary key like Milvus inserts can."""
+
+    def get_collection_stats(self, name):
+        return {"row_count": len(self.collections[name])}
+
+    def query_iterator(self, name, batch_size, output_fields):
+        rows = [{"pk": row["pk"]} for row in self.collections[name]]
+
+        class Iterator:
+            def next(self):
+                batch, rows[:] = rows[:batch_size], rows[batch_size:]
+                return batch
+
+            def close(self):
+                pass
+
+        return Iterator()
+
+    def describe_collection(self, name):
+        return {"fields": [{"name": "pk"}, {"name": "text"}, {"name": "vector"}]}
+
+    def get(self, name, ids, output_fields):
+        return [dict(row) for row in self.collections[name] if row["pk"] in ids]
+
+    def delete(self, name, ids):
+        self.collections[name] = [row for row in self.collections[name] if row["pk"] not in ids]
+
+    def insert(self, name, data):
+        self.collections[name].extend(data)
+
+
+def test_promote_removes_duplicates_of_a_resumed_batch():
+    rows = [{"pk": f"c{i}", "text": f"chunk {i}", "vector": [float(i)]} for i in range(5)]
+    client = RowsClient({"kb_v1": rows + rows[3:], "kb_v2": rows[:4] + rows[:2]})
+    versions = CollectionVersions(client, "kb")
+
+    versions.promote("kb_v1", expected_count=5)
+    assert versions.active() == "kb_v1"
+    assert sorted(row["pk"] for row in client.collections["kb_v1"]) == [f"c{i}" for i in range(5)]
+
+    # Duplicates do not make up for missing chunks
+    with pytest.raises(RuntimeError):
+        versions.promote("kb_v2", expected_count=5)
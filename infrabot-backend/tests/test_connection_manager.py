@@ -0,0 +1,95 @@
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+
+from app.services.connection_manager import MilvusConnectionManager
+
+
+class FakeChannel:
+    def __init__(self, number):
+        self.number = number
+        self.healthy = True
+        self.closed = False
+        self._using = f"channel-{number}"
+
+    def get_server_version(self):
+        if not self.healthy:
+            raise ConnectionError("channel unavailable")
+        return "v2.5.7"
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+def make_manager(pool_size=2):
+    created = []
+
+    def factory():
+        created.append(FakeChannel(len(created)))
+        return created[-1]
+
+    manager = MilvusConnectionManager(pool_size=pool_size, client_factory=factory, health_interval=0)
+    return manager, created
+
+
+def test_pool_round_robins_over_channels():
+    manager, created = make_manager(pool_size=3)
+    numbers = [manager.client().number for _ in range(6)]
+    assert numbers == [0, 1, 2, 0, 1, 2]
+    assert manager.stats()["connects"] == 3
+
+
+def test_failed_probe_replaces_channel():
+    manager, created = make_manager()
+    manager.connect_sync()
+    created[1].healthy = False
+
+    assert manager.probe()
+    assert created[1].closed
+    assert {manager.client().number for _ in range(2)} == {0, 2}
+    assert manager.stats()["reconnects"] == 1
+    assert manager.stats()["failed_probes"] == 1
+
+
+def test_pooled_vector_store_opens_no_clients_of_its_own(monkeypatch):
+    from langchain_milvus.vectorstores import milvus as base
+
+    from app.services import connection_manager
+    from app.services.connection_manager import PooledMilvus
+
+    def unpooled(**kwargs):
+        raise AssertionError("PooledMilvus opened a client outside the pool")
+
+    manager, created = make_manager(pool_size=2)
+    monkeypatch.setattr(connection_manager, "milvus_manager", manager)
+    monkeypatch.setattr(base, "MilvusClient", unpooled)
+    monkeypatch.setattr(base, "AsyncMilvusClient", unpooled)
+    aliases = []
+
+    def has_collection(name, using):
+        # langchain_milvus' own client classes are untouched while a PooledMilvus is built
+        assert base.MilvusClient is unpooled and base.AsyncMilvusClient is unpooled
+        aliases.append(using)
+        # A collection that does not exist yet; it is created on the first insert
+        return False
+
+    monkeypatch.setattr(base.utility, "has_collection", has_collection)
+
+    for _ in range(3):
+        store = PooledMilvus(embedding_function=FakeEmbeddings(), collection_name="kb")
+        assert store.client in created
+
+    assert len(created) == 2
+    # Collection setup ran on pooled channels
+    assert len(aliases) == 3 and set(aliases) <= {channel._using for channel in created}
+    # Async calls run the pooled synchronous client on a thread
+    assert asyncio.run(store.aclient.get_server_version()) == "v2.5.7"
+    assert len(created) == 2
@@ -0,0 +1,62 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from app.services.context_packing import make_context_packer, pack_documents
+from app.services.tokens import count_tokens
+
+WORDS = [f"word{i}" for i in range(400)]
+POLICY_TEXT = " ".join(WORDS)
+
+
+def chunk(text, source, index, score):
+    return Document(page_content=text, metadata={"source": source, "pk": f"{'a' * 32}-{index:05d}", "relevance_score": score})
+
+
+def test_overlapping_neighbours_are_merged_and_duplicates_dropped():
+    first = " ".join(WORDS[:150])
+    second = " ".join(WORDS[120:260])  # repeats the last 30 words of the first chunk
+    documents = [
+        chunk(second, "Policy.pdf", 1, 0.9),
+        chunk(first, "Policy.pdf", 0, 0.8),
+        Document(page_content=first + " extra", metadata={"source": "Copy.pdf", "relevance_score": 0.7}),
+        Document(page_content="Reset your password from the self-service portal.", metadata={"source": "Password.pdf", "relevance_score": 0.5}),
+    ]
+    packed = pack_documents(documents, token_budget=10_000)
+
+    assert packed.merged_chunks == 1
+    assert packed.dropped_duplicates == 1
+    merged = packed.documents[0]
+    assert merged.page_content == " ".join(WORDS[:260])
+    assert merged.metadata["chunks"] == 2
+    assert merged.metadata["relevance_score"] == 0.9
+    assert [d.metadata["source"] for d in packed.documents] == ["Policy.pdf", "Password.pdf"]
+    assert packed.tokens_after < packed.tokens_before
+
+
+def test_mmr_prefers_other_sources_and_budget_is_respected():
+    documents = [
+        Document(page_content=f"policy section {i} " + " ".join(WORDS[i * 50:(i + 1) * 50]), metadata={"source": "Policy.pdf", "relevance_score": 0.9 - i * 0.01})
+        for i in range(4)
+    ] + [Document(page_content="Connect to the VPN with GlobalProtect.", metadata={"source": "VPN.pdf", "relevance_score": 0.75})]
+
+    packed = pack_documents(documents, token_budget=10_000)
+    assert [d.metadata["source"] for d in packed.documents][:2] == ["Policy.pdf", "VPN.pdf"]
+
+    budget = count_tokens(documents[0].page_content) + count_tokens(documents[4].page_content)
+    packed = pack_documents(documents, token_budget=budget)
+    assert packed.tokens_after <= budget
+    assert len(packed.documents) == 2
+
+    # A single passage over budget is truncated rather than dropped
+    packed = pack_documents([Document(page_content=POLICY_TEXT, metadata={"source": "Policy.pdf"})], token_budget=50)
+    assert len(packed.documents) == 1
+    assert count_tokens(packed.documents[0].page_content) <= 50
+
+
+def test_packer_runs_after_retrieval():
+    retrieval = RunnableLambda(lambda inputs: [chunk(POLICY_TEXT, "Policy.pdf", 0, 0.9)]) | make_context_packer(token_budget=40)
+    documents = asyncio.run(retrieval.ainvoke({"input": "policy"}))
+    assert len(documents) == 1
+    assert count_tokens(documents[0].page_content) <= 40
@@ -0,0 +1,86 @@
+import asyncio
+
+from langchain_core.messages import SystemMessage
+
+from app.services.history_compaction import HistoryCompactor
+
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: my laptop VPN drops every few minutes " * 3})
+        history.append({"role": "assistant", "content": f"Answer {i}: reinstall the VPN client and reboot. " * 6})
+    return history
+
+
+def test_short_history_is_sent_verbatim():
+    compactor = HistoryCompactor(budget=2000)
+    compacted = compactor.compact(conversation(2))
+    assert len(compacted.messages) == 4
+    assert compacted.tokens == compacted.original_tokens
+
+
+def test_long_history_keeps_recent_turns_and_rolls_summary_forward():
+    calls = []
+
+    async def summarize(previous, messages):
+        calls.append((previous, len(messages)))
+        return f"summary of {len(messages)} messages after [{previous}]"
+
+    compactor = HistoryCompactor(summarize=summarize, budget=400, summary_max_tokens=100, min_recent_messages=2)
+
+    async def run():
+        history = conversation(10)
+        first = compactor.compact(history)
+        assert isinstance(first.messages[0], SystemMessage)
+        assert first.summary_source == "extractive"
+        assert first.messages[-1].content == history[-1]["content"]
+        assert first.tokens <= 400 < first.original_tokens
+        await asyncio.gather(*compactor._pending.values())
+
+        second = compactor.compact(history)
+        assert second.summary_source == "cached"
+        assert second.summarized_messages == first.summarized_messages
+
+        # The next turn only summarises the messages that aged out since
+        history = history + conversation(1)
+        compactor.compact(history)
+        await asyncio.gather(*compactor._pending.values())
+        return first.summarized_messages
+
+    summarized = asyncio.run(run())
+    assert calls[0] == ("", summarized)
+    assert calls[1][0].startswith(f"summary of {summarized} messages")
+    assert calls[1][1] == 2
+
+
+def test_growing_conversation_uses_latest_model_summary():
+    calls = []
+
+    async def summarize(previous, messages):
+        calls.append(len(messages))
+        return f"summary {len(calls)}"
+
+    compactor = HistoryCompactor(summarize=summarize, budget=400, summary_max_tokens=100, min_recent_messages=2)
+
+    async def run():
+        history, summaries = conversation(6), []
+        for turn in range(6, 14):
+            history = history + [
+                {"role": "user", "content": f"Question {turn}: it still drops after the reinstall"},
+                {"role": "assistant", "content": f"Answer {turn}: check the MTU setting. " * 6},
+            ]
+            compacted = compactor.compact(history)
+            summaries.append((compacted.summary_source, compacted.messages[0].content, len(calls)))
+            await asyncio.gather(*compactor._pending.values())
+        return summaries
+
+    summaries = asyncio.run(run())
+    assert summaries[0][0] == "extractive"
+    for source, summary, latest in summaries[1:]:
+        # The newest model summary is served, with the questions that aged out since after it
+        assert source in ("cached", "rolling")
+        assert summary.split(": ", 1)[1].startswith(f"summary {latest}")
+    assert any("Since then the user asked: Question 9" in summary for _, summary, _ in summaries)
+    # After the first, each summarisation only covers the messages that aged out since
+    assert all(count <= 2 for count in calls[1:])
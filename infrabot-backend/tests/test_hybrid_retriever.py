@@ -0,0 +1,107 @@
+import asyncio
+from typing import List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from app.services.lexical_index import BM25Index
+
+CHUNKS = {
+    "intune": "Intune enrollment fails with error 0x80180014 when the device is already managed.",
+    "vpn": "Connect to the corporate VPN with GlobalProtect before opening internal sites.",
+    "password": "Reset your password from the self-service portal.",
+    "license": "Request an O365 license from the service desk for new starters.",
+}
+
+
+def make_index():
+    index = BM25Index("kb")
+    for chunk_id, text in CHUNKS.items():
+        index.add(chunk_id, text, {"source": f"{chunk_id}.pdf"})
+    # Filler so the chunks above have rare terms
+    for i in range(100):
+        index.add(f"filler-{i}", f"General guidance on device setup and sites, part {i}.", {"source": "Guide.pdf"})
+    return index
+
+
+class DenseRetriever(BaseRetriever):
+    """Returns fixed results and counts how often it was called."""
+    results: List[str] = []
+    calls: int = 0
+    fail: bool = False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        raise NotImplementedError
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.calls += 1
+        if self.fail:
+            raise TimeoutError("search timed out")
+        return [
+            Document(page_content=CHUNKS[pk], metadata={"pk": pk, "relevance_score": 0.8 - 0.1 * rank})
+            for rank, pk in enumerate(self.results)
+        ]
+
+
+def test_bm25_index_round_trip_and_removal(tmp_path):
+    index = make_index()
+    hits = index.search("error 0x80180014", k=3)
+    assert hits[0].chunk_id == "intune"
+    assert hits[0].coverage == 1.0
+
+    path = tmp_path / "kb.json"
+    index.save(path)
+    loaded = BM25Index.load("kb", path)
+    assert len(loaded) == len(index)
+    assert [h.chunk_id for h in loaded.search("O365 license")][:1] == ["license"]
+
+    loaded.remove(["license"])
+    assert all(hit.chunk_id != "license" for hit in loaded.search("O365 license"))
+    assert loaded.document_frequency("o365") == 0
+
+
+def test_keyword_query_takes_the_lexical_fast_path():
+    dense = DenseRetriever(results=["vpn"])
+    retriever = HybridRetriever(dense=dense, index=make_index(), k=2)
+
+    documents = asyncio.run(retriever.ainvoke("Intune error 0x80180014"))
+    assert dense.calls == 0
+    assert documents[0].metadata["pk"] == "intune"
+
+    # A vague question is not confident: dense and lexical results are fused
+    documents = asyncio.run(retriever.ainvoke("cannot open internal sites from home"))
+    assert dense.calls == 1
+    assert documents[0].metadata["pk"] == "vpn"
+
+
+def test_rankings_are_fused_and_dense_failure_serves_lexical():
+    fused = reciprocal_rank_fusion([
+        [Document(page_content="a", metadata={"pk": "a"}), Document(page_content="b", metadata={"pk": "b"})],
+        [Document(page_content="b", metadata={"pk": "b"}), Document(page_content="c", metadata={"pk": "c"})],
+    ], k=3)
+    assert [d.metadata["pk"] for d in fused] == ["b", "a", "c"]
+
+    dense = DenseRetriever(results=["vpn"], fail=True)
+    retriever = HybridRetriever(dense=dense, index=make_index(), k=2, fast_path=False)
+    documents = asyncio.run(retriever.ainvoke("password portal"))
+    assert dense.calls == 1
+    assert documents[0].metadata["pk"] == "password"
+
+
+def test_lexical_hits_are_not_scored_as_dense_relevance():
+    retriever = HybridRetriever(dense=DenseRetriever(results=["vpn"]), index=make_index(), k=3)
+    fast = asyncio.run(retriever.ainvoke("Intune error 0x80180014"))
+    assert fast[0].metadata["lexical_score"] == 1.0
+    assert "relevance_score" not in fast[0].metadata
+
+    dense = DenseRetriever(results=["vpn", "license"])
+    retriever = HybridRetriever(dense=dense, index=make_index(), k=3, fast_path=False)
+    documents = {d.metadata["pk"]: d.metadata for d in asyncio.run(retriever.ainvoke("VPN password portal"))}
+    assert documents["vpn"]["relevance_score"] == 0.8 and documents["vpn"]["lexical_score"] > 0
+    # Found only lexically: no higher than the weakest dense result
+    assert documents["password"]["relevance_score"] == documents["license"]["relevance_score"] < 0.8
+    assert documents["password"]["lexical_score"] > 0
@@ -0,0 +1,40 @@
+import pytest
+
+from app.services.index_config import IndexConfig, collection_search_params, parse_params
+
+
+class FakeClient:
+    def __init__(self, index_type, metric_type):
+        self.info = {"index_type": index_type, "metric_type": metric_type}
+
+    def list_indexes(self, collection_name):
+        return ["vector"]
+
+    def describe_index(self, collection_name, index_name):
+        return self.info
+
+
+def test_index_config_builds_params_with_per_type_defaults():
+    assert parse_params('{"M": 8}') == {"M": 8}
+    assert parse_params("M=16,efConstruction=200") == {"M": 16, "efConstruction": 200}
+
+    config = IndexConfig(index_type="hnsw", metric_type="ip", build_params={}, search_overrides={})
+    assert config.index_params() == {"index_type": "HNSW", "metric_type": "IP", "params": {"M": 16, "efConstruction": 200}}
+    assert config.search_params() == {"metric_type": "IP", "params": {"ef": 64}}
+
+    config = IndexConfig(index_type="IVF_FLAT", build_params={"nlist": 128}, search_overrides={"nprobe": 4})
+    assert config.index_params()["params"] == {"nlist": 128}
+    assert config.search_params()["params"] == {"nprobe": 4}
+
+    with pytest.raises(ValueError):
+        IndexConfig(index_type="NOPE")
+
+
+def test_search_params_follow_the_collection_index():
+    assert collection_search_params(FakeClient("IVF_SQ8", "COSINE"), "kb") == {"metric_type": "COSINE", "params": {"nprobe": 16}}
+
+    class BrokenClient:
+        def list_indexes(self, collection_name):
+            raise RuntimeError("unavailable")
+
+    assert collection_search_params(BrokenClient(), "kb") is None
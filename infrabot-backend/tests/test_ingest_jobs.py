@@ -0,0 +1,48 @@
+import time
+import threading
+
+import pytest
+
+from app.services.ingest_jobs import IngestJobManager, JobStatus
+from app.services.ingest_service import IngestAlreadyRunning
+
+
+def test_job_runs_in_background_and_reports_progress():
+    release = threading.Event()
+    reloaded = []
+
+    def run(force, stats):
+        stats.add(files_total=2, files_parsed=2, chunks_parsed=10, chunks_inserted=5)
+        release.wait(5)
+        return True
+
+    manager = IngestJobManager(run_fn=run)
+    job = manager.start(on_success=lambda: reloaded.append(True))
+    with pytest.raises(IngestAlreadyRunning):
+        manager.start()
+
+    release.set()
+    while not job.finished:
+        time.sleep(0.01)
+    status = manager.get(job.job_id).to_dict()
+    assert status["status"] == JobStatus.SUCCEEDED.value
+    assert status["chunks_inserted"] == 5
+    assert reloaded == [True]
+
+
+def test_cancel_stops_job_at_next_checkpoint():
+    started = threading.Event()
+
+    def run(force, stats):
+        started.set()
+        while True:
+            stats.check_cancelled()
+            stats.cancel_event.wait(0.01)
+
+    manager = IngestJobManager(run_fn=run)
+    job = manager.start()
+    started.wait(5)
+    manager.cancel(job.job_id)
+    manager.shutdown()
+    assert job.status == JobStatus.CANCELLED
+    assert manager.active is None
@@ -0,0 +1,41 @@
+import os
+
+from app.services.ingest_manifest import IngestManifest, chunk_ids_for
+
+
+def _write(path, content):
+    path.write_bytes(content)
+    return path
+
+
+def test_diff_detects_new_changed_removed_and_touched(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    vpn = _write(kb / "VPN.pdf", b"vpn v1")
+    policy = _write(kb / "Policy.pdf", b"policy")
+    old = _write(kb / "Old.pdf", b"old")
+
+    manifest = IngestManifest(tmp_path / "manifest.json", collection_name="kb")
+    for path in (vpn, policy, old):
+        manifest.record(path, chunk_ids_for(path.name, manifest.content_hash(path), 2))
+    manifest.save()
+
+    _write(vpn, b"vpn v2 with more steps")
+    os.utime(policy, (1, 1))  # touched, same content
+    old.unlink()
+    new = _write(kb / "Intune.pdf", b"intune")
+
+    reloaded = IngestManifest.load(tmp_path / "manifest.json")
+    diff = reloaded.diff([vpn, policy, new])
+    assert diff.new == [new]
+    assert diff.changed == [vpn]
+    assert diff.unchanged == [policy]
+    assert [record.name for record in diff.removed] == ["Old.pdf"]
+
+
+def test_chunk_ids_are_deterministic_per_file():
+    ids = chunk_ids_for("VPN.pdf", "ab" * 32, 2)
+    assert ids == chunk_ids_for("VPN.pdf", "ab" * 32, 2)
+    assert [chunk_id[-6:] for chunk_id in ids] == ["-00000", "-00001"]
+    # The same content under another name gets its own chunks
+    assert set(ids).isdisjoint(chunk_ids_for("VPN copy.pdf", "ab" * 32, 2))
@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.services.ingest_manifest import IngestCheckpoint, IngestManifest
+from app.services import ingest_service, lexical_index
+from app.services.ingest_service import EmbeddingRateLimiter, embed_and_insert
+from app.services.lexical_index import BM25Index
+from app.services.local_vector_store import LocalVectorClient, LocalVectorStore
+from app.services.parse_pool import ParseResult
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyEmbeddings(Embeddings):
+    def __init__(self, fail_first=0, fail_on=None):
+        self.calls = 0
+        self.fail_first = fail_first
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.fail_first:
+                raise RateLimitError("429 Too Many Requests")
+        if self.fail_on and self.fail_on in texts:
+            raise RuntimeError("upstream down")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class RecordingStore:
+    def __init__(self):
+        self.ids = []
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        assert len(texts) == len(embeddings) == len(metadatas) == len(ids)
+        self.ids.extend(ids)
+
+
+def _docs(count):
+    return [Document(page_content=f"chunk {i}", metadata={"source": "VPN.pdf"}) for i in range(count)]
+
+
+def test_batches_are_inserted_after_rate_limit_backoff(tmp_path):
+    store = RecordingStore()
+    embeddings = FlakyEmbeddings(fail_first=1)
+    limiter = EmbeddingRateLimiter(tokens_per_minute=0, requests_per_minute=0, max_concurrency=4)
+
+    inserted = embed_and_insert(embeddings, store, zip(_docs(10), [str(i) for i in range(10)]),
+                                batch_size=3, limiter=limiter)
+    assert inserted == 10
+    assert sorted(store.ids, key=int) == [str(i) for i in range(10)]
+    assert limiter.concurrency_limit < 4
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_service, "INGEST_EMBED_MAX_RETRIES", 0)
+    checkpoint = IngestCheckpoint(tmp_path / "checkpoint.jsonl")
+    checkpoint.begin("rebuild", "kb")
+    ids = [str(i) for i in range(6)]
+
+    first = RecordingStore()
+    with pytest.raises(RuntimeError):
+        embed_and_insert(FlakyEmbeddings(fail_on="chunk 5"), first, zip(_docs(6), ids),
+                         checkpoint=checkpoint, batch_size=2,
+                         limiter=EmbeddingRateLimiter(0, 0, max_concurrency=1))
+
+    resumed = IngestCheckpoint.load(tmp_path / "checkpoint.jsonl")
+    assert resumed.in_progress("rebuild", "kb")
+    second = RecordingStore()
+    lexical_index = BM25Index("kb")
+    embed_and_insert(FlakyEmbeddings(), second, zip(_docs(6), ids), checkpoint=resumed, batch_size=2,
+                     lexical_index=lexical_index)
+    assert sorted(first.ids + second.ids) == sorted(ids)
+    # Chunks inserted before the interruption are indexed too
+    assert sorted(lexical_index.documents) == sorted(ids)
+
+
+def test_input_is_consumed_lazily_with_bounded_inflight_chunks():
+    consumed = []
+
+    def stream():
+        for i in range(100):
+            consumed.append(i)
+            yield Document(page_content=f"chunk {i}", metadata={}), str(i)
+
+    class SlowStore(RecordingStore):
+        def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+            # Never more than the in-flight budget (plus the batch being formed) read ahead
+            assert len(consumed) - len(self.ids) <= 8 + 4
+            super().add_embeddings(texts, embeddings, metadatas, ids)
+
+    store = SlowStore()
+    inserted = embed_and_insert(FlakyEmbeddings(), store, stream(), batch_size=4,
+                                max_inflight_chunks=8)
+    assert inserted == 100
+
+
+def test_renamed_and_duplicate_files_keep_their_chunks(tmp_path, monkeypatch):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    (kb / "VPN.pdf").write_text("vpn guide")
+    (kb / "VPN copy.pdf").write_text("vpn guide")
+
+    def parse_files(paths):
+        for path in paths:
+            documents = [Document(page_content=f"{path.read_text()} part {i}", metadata={"source": path.name})
+                         for i in range(2)]
+            yield ParseResult(path, documents, pages=1)
+
+    monkeypatch.setattr(ingest_service, "KNOWLEDGEBASE_PATH", kb)
+    monkeypatch.setattr(ingest_service, "parse_files", parse_files)
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIR", tmp_path / "lexical")
+    BM25Index("kb_v1").save()
+    store = LocalVectorStore(FlakyEmbeddings(), "kb_v1", client=LocalVectorClient(tmp_path / "vectors"))
+    manifest = IngestManifest(tmp_path / "manifest.json", collection_name="kb_v1")
+
+    saves = []
+    monkeypatch.setattr(BM25Index, "save", lambda self, path=None, save=BM25Index.save: saves.append(save(self, path)))
+
+    def update():
+        checkpoint = IngestCheckpoint(tmp_path / "checkpoint.jsonl")
+        saves.clear()
+        ingest_service.update_collection(FlakyEmbeddings(), manifest, store, checkpoint, ingest_service.IngestStats())
+        # Saved once per run, not once per file
+        assert len(saves) == 1
+        live = sorted(row["metadata"]["source"] for _, row in store.collection.live_rows())
+        indexed = sorted(metadata["source"] for _, metadata in BM25Index.load("kb_v1").documents.values())
+        assert live == indexed
+        return live
+
+    assert update() == ["VPN copy.pdf"] * 2 + ["VPN.pdf"] * 2
+    (kb / "VPN copy.pdf").unlink()
+    assert update() == ["VPN.pdf"] * 2
+    (kb / "VPN.pdf").rename(kb / "Remote access.pdf")
+    assert update() == ["Remote access.pdf"] * 2
+    assert sorted(manifest.files) == ["Remote access.pdf"]
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+
+from app.services.collection_versions import CollectionVersions
+from app.services.index_config import collection_dimension, collection_index
+from app.services.local_vector_store import LocalCollection, LocalVectorClient, LocalVectorStore
+
+
+class UnitEmbeddings:
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.zeros(4, dtype=np.float32)
+        for word in text.lower().split():
+            vector[hash(word) % 4] += 1.0
+        return (vector / max(np.linalg.norm(vector), 1e-9)).tolist()
+
+
+def _store(root, name="kb_v1", metric_type="L2"):
+    return LocalVectorStore(UnitEmbeddings(), name, client=LocalVectorClient(root), metric_type=metric_type)
+
+
+def test_search_upsert_delete_and_reopen(tmp_path):
+    store = _store(tmp_path)
+    vectors = [[1, 0, 0, 0], [0, 1, 0, 0], [0.9, 0.1, 0, 0]]
+    store.add_embeddings(["a", "b", "c"], vectors, [{"source": "A.pdf"}] * 3, ids=["a-0", "b-0", "c-0"])
+
+    results = store.similarity_search_with_score_by_vector([1, 0, 0, 0], k=2)
+    assert [document.metadata["pk"] for document, _ in results] == ["a-0", "c-0"]
+    assert results[0][1] == 0.0
+    assert results[0][0].metadata["source"] == "A.pdf"
+
+    # Same pk replaces the row; deleted rows are not returned
+    store.add_embeddings(["a2"], [[0, 0, 1, 0]], ids=["a-0"])
+    store.delete(ids=["c-0"])
+    assert [d.page_content for d in store.similarity_search_by_vector([1, 0, 0, 0], k=5)] == ["b", "a2"]
+
+    reopened = _store(tmp_path)
+    assert reopened.client.get_collection_stats("kb_v1") == {"row_count": 2}
+    assert [d.page_content for d in reopened.similarity_search_by_vector([0, 0, 1, 0], k=1)] == ["a2"]
+    assert collection_dimension(reopened.client, "kb_v1") == 4
+    assert collection_index(reopened.client, "kb_v1") == {"index_type": "FLAT", "metric_type": "L2"}
+
+
+def test_interrupted_append_is_truncated(tmp_path):
+    store = _store(tmp_path, metric_type="IP")
+    store.add_embeddings(["a", "b"], [[1, 0, 0, 0], [0, 1, 0, 0]], ids=["a", "b"])
+    collection = store.collection
+    # A vector written without its row, as if the process died mid-append
+    with open(collection._file("vectors"), "ab") as handle:
+        handle.write(np.ones(4, dtype=np.float32).tobytes())
+
+    reopened = _store(tmp_path)
+    reopened.add_embeddings(["c"], [[0, 0, 1, 0]], ids=["c"])
+    scored = reopened.similarity_search_with_score_by_vector([0, 0, 1, 0], k=1)
+    assert scored[0][0].page_content == "c"
+    assert scored[0][1] == 1.0
+    assert reopened._select_relevance_score_fn()(scored[0][1]) == 1.0
+
+
+def test_reader_loading_mid_append_leaves_files_alone(tmp_path):
+    writer = _store(tmp_path)
+    writer.add_embeddings(["a", "b"], [[1, 0, 0, 0], [0, 1, 0, 0]], ids=["a", "b"])
+    collection = writer.collection
+    # The writer has appended the next batch's vectors but not yet its rows
+    with open(collection._file("vectors"), "ab") as handle:
+        handle.write(np.eye(4, dtype=np.float32)[2:].tobytes())
+    size = collection._file("vectors").stat().st_size
+
+    reader = LocalCollection(collection.path)
+    assert len(reader) == 2
+    assert len(reader.search([0, 0, 1, 0], k=5)) == 2
+    assert collection._file("vectors").stat().st_size == size
+
+    with open(collection._file("rows"), "a", encoding="utf-8") as handle:
+        for pk in ("c", "d"):
+            handle.write(json.dumps({"pk": pk, "text": pk, "metadata": {}}) + "\n")
+    assert len(LocalCollection(collection.path)) == 4
+
+
+def test_versions_promote_and_roll_back_local_collections(tmp_path):
+    client = LocalVectorClient(tmp_path)
+    versions = CollectionVersions(client, "kb", keep_versions=2)
+    for name, count in (("kb_v1", 2), ("kb_v2", 3), ("kb_v3", 1)):
+        store = LocalVectorStore(UnitEmbeddings(), name, client=client)
+        store.add_texts([f"{name} chunk {i}" for i in range(count)], ids=[f"{name}-{i}" for i in range(count)])
+        versions.promote(name, expected_count=count)
+
+    assert versions.active() == "kb_v3"
+    assert client.list_collections() == ["kb_v2", "kb_v3"]
+    assert client.get_collection_stats("kb") == {"row_count": 1}
+    assert versions.rollback() == "kb_v2"
+    assert LocalVectorStore(UnitEmbeddings(), versions.active(), client=client).similarity_search("kb_v2 chunk 0", k=1)
@@ -0,0 +1,47 @@
+import time
+from pathlib import Path
+
+from app.services.parse_pool import parse_files
+
+
+def fake_parse(file_path):
+    name = Path(file_path).name
+    if name.startswith("slow"):
+        time.sleep(1)
+    if name.startswith("hang"):
+        time.sleep(30)
+    if name.startswith("bad"):
+        raise ValueError("corrupt pdf")
+    return [name.upper()], 1
+
+
+def test_results_are_ordered_and_failures_isolated():
+    paths = [Path(name) for name in ("a.pdf", "bad.pdf", "hang.pdf", "b.pdf", "c.pdf")]
+    started = time.monotonic()
+    results = list(parse_files(paths, workers=2, timeout=3, parse_fn=fake_parse))
+
+    assert [result.file_path for result in results] == paths
+    assert [result.documents for result in results if result.ok] == [["A.PDF"], ["B.PDF"], ["C.PDF"]]
+    assert "corrupt pdf" in results[1].error
+    assert "timed out" in results[2].error
+    assert time.monotonic() - started < 20
+
+
+def marking_parse(file_path):
+    Path(file_path).touch()
+    return fake_parse(file_path)
+
+
+def test_files_parsed_ahead_of_a_slow_one_are_bounded(tmp_path):
+    paths = [tmp_path / "slow.pdf"] + [tmp_path / f"{i}.pdf" for i in range(8)]
+    results = parse_files(paths, workers=2, parse_fn=marking_parse)
+
+    assert next(results).documents == ["SLOW.PDF"]
+    # While slow.pdf parsed, only one other file was parsed and held; the rest waited
+    assert sum(path.exists() for path in paths) == 2
+    assert [result.documents for result in results] == [[f"{i}.PDF"] for i in range(8)]
+
+
+def test_inline_mode():
+    results = list(parse_files([Path("x.pdf")], workers=0, parse_fn=fake_parse))
+    assert results[0].documents == ["X.PDF"]
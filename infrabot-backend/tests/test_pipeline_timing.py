@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains.retrieval import create_retrieval_chain
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.services.async_retriever import AsyncVectorStoreRetriever
+from app.services.monitoring import MetricsCollector
+from app.services.pipeline_timing import PipelineTimingHandler
+
+
+class StaticEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class StaticVectorStore:
+    def similarity_search_by_vector(self, vector, k=5, **kwargs):
+        return [Document(page_content="Restart the VPN client.")]
+
+
+def test_stage_timings_are_collected_and_exported():
+    retriever = AsyncVectorStoreRetriever.model_construct(
+        vectorstore=StaticVectorStore(), embeddings=StaticEmbeddings(), k=1,
+        search_kwargs={}, timeout=5.0, executor=None,
+    )
+    prompt = ChatPromptTemplate.from_messages([("system", "{context}"), ("human", "{input}")])
+    llm = FakeListChatModel(responses=["Restart it."])
+    chain = create_retrieval_chain(retriever, create_stuff_documents_chain(llm, prompt))
+
+    timing = PipelineTimingHandler()
+
+    async def run():
+        async for _ in chain.astream({"input": "vpn down"}, config={"callbacks": [timing]}):
+            pass
+
+    asyncio.run(run())
+    collector = MetricsCollector()
+    timing.finish(collector)
+
+    for stage in ("query_embedding", "milvus_search", "retrieval", "prompt_assembly",
+                  "time_to_first_token", "stream_total"):
+        assert collector.stage_sketches[stage].total.count == 1, stage
+    assert timing.tokens == len("Restart it.")
+    assert timing.prompt_tokens > 0
+
+    exposition = collector.render_prometheus()
+    assert 'infrabot_stage_duration_seconds_count{stage="milvus_search"} 1' in exposition
+    assert 'infrabot_generated_tokens_bucket{le="+Inf"} 1' in exposition
+    assert "infrabot_prompt_tokens_count 1" in exposition
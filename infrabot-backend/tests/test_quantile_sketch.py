@@ -0,0 +1,79 @@
+import random
+
+from app.services.monitoring import MetricsCollector, merge_snapshots
+from app.services.quantile_sketch import DDSketch, WindowedSketch
+
+
+def test_quantiles_are_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(-1.5, 0.8) for _ in range(20000)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact <= 0.011, q
+    assert sketch.count_at_most(ordered[-1]) == len(values)
+
+
+def test_merged_sketch_matches_single_sketch():
+    single, first, second = DDSketch(), DDSketch(), DDSketch()
+    for i in range(1, 1001):
+        single.add(i / 1000)
+        (first if i % 2 else second).add(i / 1000)
+
+    merged = DDSketch.from_dict(first.to_dict())
+    merged.merge(DDSketch.from_dict(second.to_dict()))
+    assert merged.count == single.count
+    assert merged.bins == single.bins
+    assert merged.quantile(0.95) == single.quantile(0.95)
+
+
+def test_buffered_recording_matches_direct_recording():
+    rng = random.Random(3)
+    values = [0.0] * 10 + [rng.lognormvariate(-2.0, 1.0) for _ in range(3000)]
+    direct = DDSketch()
+    windowed = WindowedSketch(clock=lambda: 0.0)
+    for value in values:
+        direct.add(value)
+        windowed.add(value)
+
+    # Folded in batches and on read, with nothing lost or double-counted
+    total = windowed.total
+    assert total.count == direct.count and total.zero_count == direct.zero_count == 10
+    assert total.bins == direct.bins
+    assert (total.min, total.max) == (direct.min, direct.max)
+    assert windowed.total.count == len(values)
+
+
+def test_windows_forget_old_values():
+    now = [0.0]
+    sketch = WindowedSketch(clock=lambda: now[0])
+    sketch.add(5.0)
+    now[0] = 120.0
+    sketch.add(0.1)
+
+    views = sketch.views()
+    assert views["1m"].count == 1 and views["1m"].quantile(0.99) == 0.1
+    assert views["5m"].count == 2
+    now[0] = 4000.0
+    views = sketch.views()
+    assert views["1h"].count == 0
+    assert views["all"].count == 2
+
+
+def test_worker_quantiles_merge_through_snapshots():
+    first, second = MetricsCollector(), MetricsCollector()
+    for _ in range(90):
+        first.record_stage("milvus_search", 0.01)
+    for _ in range(10):
+        second.record_stage("milvus_search", 1.0)
+
+    merged = merge_snapshots([first.snapshot(), {**second.snapshot(), "pid": -1}])
+    stats = merged.get_detailed_metrics()["stage_stats"]["milvus_search"]
+    assert stats["1m"]["count"] == 100
+    assert abs(stats["5m"]["p50"] - 0.01) < 0.001
+    assert abs(stats["5m"]["p95"] - 1.0) < 0.02
+    assert 'stage="milvus_search",window="1h",quantile="0.99"' in merged.render_prometheus()
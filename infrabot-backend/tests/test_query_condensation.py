@@ -0,0 +1,125 @@
+import time
+import asyncio
+from typing import List
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains.retrieval import create_retrieval_chain
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.monitoring import metrics
+from app.services.pipeline_timing import PipelineTimingHandler
+from app.services.query_condensation import (
+    QueryCondenser,
+    choose_documents,
+    make_condensing_retrieval,
+    make_llm_rewriter,
+)
+
+HISTORY = [HumanMessage(content="How do I set up the VPN on Windows?"), AIMessage(content="Install GlobalProtect.")]
+
+
+class KeywordRetriever(BaseRetriever):
+    """Scores documents by whether the query names a platform; takes 0.2s like a real search."""
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        raise NotImplementedError
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        await asyncio.sleep(0.2)
+        score = 0.9 if "VPN" in query else 0.3
+        return [Document(page_content=f"result for {query}", metadata={"relevance_score": score})]
+
+
+def test_follow_up_is_condensed_concurrently_and_cached():
+    rewrites = []
+
+    async def rewrite(question, history):
+        rewrites.append(question)
+        await asyncio.sleep(0.2)
+        return "How do I set up the VPN on Android?"
+
+    retrieval = make_condensing_retrieval(KeywordRetriever(), QueryCondenser(rewrite))
+
+    async def run():
+        started = time.monotonic()
+        documents = await retrieval.ainvoke({"input": "what about on Android?", "chat_history": HISTORY})
+        elapsed = time.monotonic() - started
+        await retrieval.ainvoke({"input": "what about on Android?", "chat_history": HISTORY})
+        first_turn = await retrieval.ainvoke({"input": "what about on Android?", "chat_history": []})
+        return documents, elapsed, first_turn
+
+    documents, elapsed, first_turn = asyncio.run(run())
+    assert documents[0].page_content == "result for How do I set up the VPN on Android?"
+    # Raw retrieval overlapped the rewrite: 0.4s rather than 0.6s serially
+    assert elapsed < 0.55
+    assert rewrites == ["what about on Android?"]
+    assert first_turn[0].page_content == "result for what about on Android?"
+
+
+class RecordingChatModel(FakeListChatModel):
+    """Fake chat model with a model name that records the call parameters it was bound with."""
+
+    model_name: str = "gpt-4o-mini"
+    calls: List[dict] = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(kwargs)
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+
+def test_rewriter_leaves_reasoning_models_room_to_answer():
+    for model_name, expected in [
+        ("gpt-4o-mini", {"max_tokens": 64}),
+        ("o3-mini", {"reasoning_effort": "low", "max_tokens": 1024}),
+    ]:
+        llm = RecordingChatModel(model_name=model_name, responses=["How do I set up the VPN on Android?"], calls=[])
+        rewrite = make_llm_rewriter(llm, max_tokens=64, reasoning_max_tokens=1024)
+        assert asyncio.run(rewrite("what about on Android?", HISTORY)).endswith("Android?")
+        assert llm.calls == [expected]
+
+
+def test_empty_rewrite_is_counted_and_raw_question_used():
+    async def rewrite(question, history):
+        return ""
+
+    before = metrics.condensation_stats["empty"]
+    assert asyncio.run(QueryCondenser(rewrite).condense("what about on Android?", HISTORY)) is None
+    assert metrics.condensation_stats["empty"] == before + 1
+
+
+def test_raw_results_win_when_more_relevant():
+    raw = [Document(page_content="raw", metadata={"relevance_score": 0.8})]
+    condensed = [Document(page_content="condensed", metadata={"relevance_score": 0.5})]
+    assert choose_documents(raw, condensed) is raw
+    assert choose_documents(raw, [Document(page_content="unscored")])[0].page_content == "unscored"
+
+
+def test_condensed_retrieval_in_rag_chain():
+    async def rewrite(question, history):
+        return "How do I set up the VPN on Android?"
+
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", "{context}"), MessagesPlaceholder("chat_history"), ("human", "{input}")]
+    )
+    chain = create_retrieval_chain(
+        make_condensing_retrieval(KeywordRetriever(), QueryCondenser(rewrite)),
+        create_stuff_documents_chain(FakeListChatModel(responses=["Use the Android app."]), prompt),
+    )
+    timing = PipelineTimingHandler()
+
+    async def run():
+        return await chain.ainvoke(
+            {"input": "what about on Android?", "chat_history": HISTORY}, config={"callbacks": [timing]}
+        )
+
+    result = asyncio.run(run())
+    assert result["context"][0].page_content.endswith("VPN on Android?")
+    assert "query_condensation" in timing.stages
+    assert 0.15 < timing.stages["retrieval"] < 0.35
@@ -0,0 +1,83 @@
+import time
+import asyncio
+from typing import List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services import reranker
+from app.services.reranker import LexicalFeatureScorer, Reranker, RerankingRetriever
+
+
+def candidates():
+    return [
+        Document(page_content="Printer drivers are installed from the software center.", metadata={"pk": "printer", "relevance_score": 0.62}),
+        Document(page_content="General IT onboarding checklist.", metadata={"pk": "onboarding", "relevance_score": 0.61}),
+        Document(page_content="To map a network drive, open File Explorer and choose Map network drive.", metadata={"pk": "drive", "relevance_score": 0.58}),
+    ]
+
+
+class SlowScorer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.batches = []
+
+    def score(self, query, documents):
+        self.batches.append(len(documents))
+        time.sleep(self.delay)
+        return [float(len(d.page_content)) for d in documents]
+
+
+class ListRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return candidates()
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return candidates()
+
+
+def test_lexical_features_promote_the_matching_chunk():
+    retriever = RerankingRetriever(base=ListRetriever(), reranker=Reranker(LexicalFeatureScorer(), top_n=2))
+    documents = asyncio.run(retriever.ainvoke("how do I map a network drive"))
+    assert [d.metadata["pk"] for d in documents] == ["drive", "printer"]
+    assert documents[0].metadata["rerank_score"] > documents[1].metadata["rerank_score"]
+    assert [d.metadata["pk"] for d in retriever.invoke("how do I map a network drive")] == ["drive", "printer"]
+
+
+def test_scoring_is_batched_and_falls_back_to_retrieval_order_over_budget():
+    scorer = SlowScorer(delay=0.05)
+    reranked = asyncio.run(Reranker(scorer, top_n=2, batch_size=2, budget=1.0).arerank("q", candidates()))
+    assert scorer.batches == [2, 1]
+    assert [d.metadata["pk"] for d in reranked] == ["drive", "printer"]
+
+    started = time.perf_counter()
+    reranked = asyncio.run(Reranker(SlowScorer(delay=0.5), top_n=2, budget=0.05).arerank("q", candidates()))
+    assert time.perf_counter() - started < 0.4
+    assert [d.metadata["pk"] for d in reranked] == ["printer", "onboarding"]
+
+
+def test_queries_keep_retrieval_order_while_the_model_loads(monkeypatch):
+    class SlowLoadingCrossEncoder(SlowScorer):
+        def __init__(self, model_name):
+            time.sleep(0.5)
+            super().__init__(delay=0)
+
+    monkeypatch.setattr(reranker, "RERANK_MODEL", "cross-encoder/test")
+    monkeypatch.setattr(reranker, "CrossEncoderScorer", SlowLoadingCrossEncoder)
+    monkeypatch.setattr(reranker, "_scorer", None)
+    monkeypatch.setattr(reranker, "_scorer_loading", False)
+
+    started = time.perf_counter()
+    reranked = asyncio.run(Reranker(top_n=2, budget=0.05).arerank("q", candidates()))
+    assert time.perf_counter() - started < 0.3
+    assert [d.metadata["pk"] for d in reranked] == ["printer", "onboarding"]
+
+    deadline = time.monotonic() + 5
+    while reranker._scorer is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert isinstance(reranker._scorer, SlowLoadingCrossEncoder)
+    reranked = asyncio.run(Reranker(top_n=2, budget=1.0).arerank("q", candidates()))
+    assert [d.metadata["pk"] for d in reranked] == ["drive", "printer"]
@@ -0,0 +1,60 @@
+import threading
+
+from app.services.ingest_jobs import IngestJobManager, JobStatus
+from app.services.monitoring import MetricsCollector, merge_snapshots
+from app.services.shared_state import (
+    default_worker_count,
+    publish_kb_version,
+    read_kb_version,
+    read_metrics_snapshots,
+    write_metrics_snapshot,
+)
+
+
+def test_kb_version_is_visible_to_other_workers(tmp_path):
+    assert read_kb_version(tmp_path) is None
+    version = publish_kb_version("infrabot_knowledgebase_v1", tmp_path)
+    assert read_kb_version(tmp_path) == version
+
+
+def test_metrics_merge_across_workers(tmp_path):
+    first, second = MetricsCollector(), MetricsCollector()
+    first.record_request("/api/chat", 0.2)
+    first.record_cache_hit()
+    second.record_request("/api/chat", 0.4, success=False)
+    second.record_cache_miss()
+
+    write_metrics_snapshot(first.snapshot(), tmp_path)
+    snapshots = read_metrics_snapshots(tmp_path) + [{**second.snapshot(), "pid": -1}]
+    merged = merge_snapshots(snapshots).get_detailed_metrics()
+    assert merged["endpoint_stats"] == {"/api/chat": 2}
+    assert merged["error_stats"] == {"/api/chat": 1}
+    assert merged["summary"]["cache_hit_rate"] == 0.5
+
+
+def test_worker_count_override(monkeypatch):
+    monkeypatch.setenv("UVICORN_WORKERS", "3")
+    assert default_worker_count() == 3
+    monkeypatch.setenv("UVICORN_WORKERS", "auto")
+    assert default_worker_count() >= 1
+
+
+def test_job_status_and_cancel_from_another_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.ingest_jobs.INGEST_JOB_REPORT_SECONDS", 0.01)
+    started = threading.Event()
+
+    def run(force, stats):
+        started.set()
+        while True:
+            stats.check_cancelled()
+            stats.cancel_event.wait(0.01)
+
+    owner = IngestJobManager(run_fn=run, state_dir=tmp_path)
+    other = IngestJobManager(run_fn=run, state_dir=tmp_path)
+    job = owner.start()
+    started.wait(5)
+
+    assert other.status(job.job_id)["status"] == JobStatus.RUNNING.value
+    other.cancel(job.job_id)
+    owner.shutdown()
+    assert other.status(job.job_id)["status"] == JobStatus.CANCELLED.value
@@ -0,0 +1,27 @@
+import sys
+import subprocess
+
+from fastapi.testclient import TestClient
+
+HEAVY_MODULES = ("langchain_openai", "langchain_milvus", "pymilvus", "unstructured")
+
+
+def test_importing_app_defers_heavy_modules():
+    code = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_liveness_and_readiness_before_startup_completes():
+    from app.main import app
+
+    # No lifespan here, so the RAG chain is never initialised
+    client = TestClient(app)
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["chain_ready"] is False
+    assert client.post("/api/chat", json={"prompt": "vpn"}).status_code == 503
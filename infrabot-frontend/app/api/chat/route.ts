@@ -17,12 +17,19 @@ export async function POST(req: NextRequest) {
     // Get the backend URL from environment variables or use default
     const backendUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
     
+    // Pass on the browser's address so the backend limits each user rather
+    // than this server (Next.js fills the header in from the socket when no
+    // proxy in front of it did)
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    const forwardedFor = req.headers.get('x-forwarded-for');
+    if (forwardedFor) {
+      headers['X-Forwarded-For'] = forwardedFor;
+    }
+
     // Forward the request to the backend
     const response = await fetch(`${backendUrl}/api/chat`, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers,
       body: JSON.stringify({ prompt }),
     });
 